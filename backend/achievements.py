@@ -0,0 +1,216 @@
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple, TYPE_CHECKING
+import asyncio
+import logging
+
+from storage import Storage, field_key, previous_day
+
+if TYPE_CHECKING:
+    from database import Database
+
+logger = logging.getLogger(__name__)
+
+# Progress metrics a rule can test; "subjects" is tested per subject
+ANSWERS = "answers"
+CORRECT = "correct"
+STREAK = "streak"
+SUBJECT_CORRECT = "subjects"
+
+@dataclass(frozen=True)
+class AchievementRule:
+    id: str
+    title: str
+    description: str
+    type: str
+    icon: str
+    metric: str
+    threshold: int
+
+RULES = [
+    AchievementRule("first-answer", "First Steps", "Answered your first question", "practice", "🎯", ANSWERS, 1),
+    AchievementRule("answers-100", "Century", "Answered 100 questions", "practice", "💯", ANSWERS, 100),
+    AchievementRule("answers-1000", "Marathoner", "Answered 1,000 questions", "practice", "🏃", ANSWERS, 1000),
+    AchievementRule("correct-50", "Sharp Mind", "Answered 50 questions correctly", "practice", "🧠", CORRECT, 50),
+    AchievementRule("correct-500", "Olympiad Ready", "Answered 500 questions correctly", "practice", "🏆", CORRECT, 500),
+    AchievementRule("streak-3", "On a Roll", "Answered questions 3 days in a row", "streak", "🔥", STREAK, 3),
+    AchievementRule("streak-10", "Unstoppable", "Answered questions 10 days in a row", "streak", "⚡", STREAK, 10),
+    AchievementRule("streak-30", "Habit Formed", "Answered questions 30 days in a row", "streak", "📅", STREAK, 30),
+    # Awarded once per subject, as "<id>:<subject>"
+    AchievementRule("subject-correct-100", "{subject} Scholar", "Answered 100 {subject} questions correctly", "practice", "🎓", SUBJECT_CORRECT, 100),
+]
+
+def earned_awards(rules: List[AchievementRule], progress: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Build an achievement for every rule the progress meets that has not been awarded yet"""
+    awarded = set(progress.get("awarded", []))
+    awards = []
+    for rule in rules:
+        if rule.metric == SUBJECT_CORRECT:
+            candidates = [(f"{rule.id}:{subject}", subject, count) for subject, count in progress.get("subjects", {}).items()]
+        else:
+            candidates = [(rule.id, None, progress.get(rule.metric, 0))]
+        for rule_id, subject, value in candidates:
+            if value < rule.threshold or rule_id in awarded:
+                continue
+            name = subject.replace("_", " ").title() if subject else ""
+            awards.append({
+                "rule_id": rule_id,
+                "title": rule.title.format(subject=name),
+                "description": rule.description.format(subject=name),
+                "type": rule.type,
+                "icon": rule.icon
+            })
+    return awards
+
+class AchievementEngine:
+    """Award achievements from the answer stream without slowing down answer submission.
+
+    Answers are only queued on the request path. A background task drains
+    the queue in batches, folds each user's answers per day into one update
+    of their progress document (streak and counters), and checks the rules
+    that user has not earned yet against the returned progress, so no rule
+    ever rescans user_answers. Awards are upserts keyed by (user_id,
+    rule_id), so retries and racing workers never award twice.
+
+    Delivery is at most once: queued answers live only in this process, so
+    answers queued when it crashes, or dropped while the queue is full, are
+    never counted. `python jobs.py backfill-achievements` rebuilds progress
+    from the answer log and awards what was missed.
+    """
+
+    def __init__(
+        self,
+        db: Storage,
+        rules: List[AchievementRule] = RULES,
+        on_award: Optional[Callable[[str], None]] = None,
+        flush_seconds: float = 1.0,
+        max_batch: int = 1000,
+        max_queued: int = 50000,
+        concurrency: int = 8
+    ):
+        self.db = db
+        self.rules = rules
+        self.on_award = on_award
+        self.flush_seconds = flush_seconds
+        self.max_batch = max_batch
+        self.concurrency = concurrency
+        self.queue: "asyncio.Queue[Tuple[str, str, bool, str]]" = asyncio.Queue(max_queued)  # (user ID, subject, correct, day)
+        self.dropped = 0
+
+    def record(self, user_id: str, subject: str, correct: bool, at: Optional[datetime] = None):
+        """Queue an answer for evaluation; never blocks"""
+        day = (at or datetime.utcnow()).strftime("%Y-%m-%d")
+        try:
+            self.queue.put_nowait((user_id, subject, correct, day))
+        except asyncio.QueueFull:
+            self.dropped += 1
+
+    async def run(self):
+        """Evaluate queued answers until cancelled, processing what is left on the way out"""
+        try:
+            while True:
+                await asyncio.sleep(self.flush_seconds)
+                await self.flush()
+        finally:
+            await self.flush()
+
+    async def flush(self):
+        if self.dropped:
+            logger.warning(f"Achievement queue was full; {self.dropped} answers were not counted")
+            self.dropped = 0
+        while not self.queue.empty():
+            batch = [self.queue.get_nowait() for _ in range(min(self.max_batch, self.queue.qsize()))]
+            await self.process(batch)
+
+    async def process(self, answers: List[Tuple[str, str, bool, str]]):
+        """Apply a batch of answers, one progress update per user and day, a few users at a time"""
+        days: Dict[str, Dict[str, Tuple[int, Dict[str, int]]]] = {}  # user ID -> day -> (answers, correct per subject)
+        for user_id, subject, correct, day in answers:
+            count, correct_by_subject = days.setdefault(user_id, {}).get(day, (0, {}))
+            correct_by_subject[subject] = correct_by_subject.get(subject, 0) + (1 if correct else 0)
+            days[user_id][day] = (count + 1, correct_by_subject)
+
+        # Bounded so a large batch does not queue up behind the request path for pool connections
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def apply(user_id: str, user_days: Dict[str, Tuple[int, Dict[str, int]]]):
+            async with semaphore:
+                await self._apply(user_id, user_days)
+
+        results = await asyncio.gather(
+            *(apply(user_id, user_days) for user_id, user_days in days.items()),
+            return_exceptions=True
+        )
+        for user_id, result in zip(days, results):
+            if isinstance(result, Exception):
+                logger.error(f"Failed to evaluate achievements for user {user_id}: {result}")
+
+    async def _apply(self, user_id: str, days: Dict[str, Tuple[int, Dict[str, int]]]):
+        # Days in order, so a batch spanning midnight extends the streak
+        for day in sorted(days):
+            count, correct_by_subject = days[day]
+            progress = await self.db.update_achievement_progress(user_id, day, count, correct_by_subject)
+        awarded = await award_earned(self.db, self.rules, user_id, progress)
+        if awarded and self.on_award:
+            self.on_award(user_id)
+
+async def award_earned(db: Storage, rules: List[AchievementRule], user_id: str, progress: Dict[str, Any]) -> int:
+    """Award the rules a user's progress meets, returning how many were new"""
+    awards = earned_awards(rules, progress)
+    if not awards:
+        return 0
+    awarded = await db.award_achievements(user_id, awards)
+    if awarded:
+        logger.info(f"Awarded {', '.join(achievement.rule_id for achievement in awarded)} to user {user_id}")
+    return len(awarded)
+
+def trailing_streak(days: List[str]) -> int:
+    """Number of consecutive days ending at the latest of days, which are sorted"""
+    streak = 1
+    for day, earlier in zip(reversed(days), reversed(days[:-1])):
+        if earlier != previous_day(day):
+            break
+        streak += 1
+    return streak
+
+@dataclass
+class AchievementBackfill:
+    users: int = 0
+    awarded: int = 0
+
+async def backfill_achievements(
+    db: "Database",
+    rules: List[AchievementRule] = RULES,
+    batch_size: int = 1000,
+    concurrency: int = 8
+) -> AchievementBackfill:
+    """Rebuild every user's achievement progress from the answer log and award what it has earned.
+
+    Repairs progress that missed answers the engine never saw. Counters are
+    overwritten, so answers evaluated while the backfill runs may be counted
+    twice; run it while submissions are paused. Awards already held are kept
+    and never repeated.
+    """
+    report = AchievementBackfill()
+    await db.backfill_answer_scoring_fields()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def award(user_id: str, progress: Dict[str, Any]) -> int:
+        async with semaphore:
+            return await award_earned(db, rules, user_id, progress)
+
+    async for batch in db.iter_achievement_counters(batch_size):
+        progress = {}
+        for counters in batch:
+            days = sorted(counters["days"])
+            subjects = {field_key(entry["subject"]): entry["correct"] for entry in counters["subjects"] if entry["subject"]}
+            progress[counters["user_id"]] = {
+                "answers": counters["answers"],
+                "correct": sum(entry["correct"] for entry in counters["subjects"]),
+                "subjects": subjects,
+                "streak": trailing_streak(days),
+                "last_day": days[-1]
+            }
+        report.users += await db.set_achievement_progress([{"user_id": user_id, **doc} for user_id, doc in progress.items()])
+        report.awarded += sum(await asyncio.gather(*(award(user_id, doc) for user_id, doc in progress.items())))
+    return report
@@ -0,0 +1,110 @@
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+import asyncio
+import gzip
+import io
+import logging
+import os
+
+from bson import json_util
+
+from database import Database
+from images import IMAGE_OWNERS
+
+logger = logging.getLogger(__name__)
+
+# Collections whose soft-deleted documents are archived
+SOFT_DELETED_COLLECTIONS = ("questions", "panelists", "admin_members", "club_info", "competitions")
+
+@dataclass
+class ArchiveReport:
+    collection: str
+    archived: int = 0
+    destination: str = ""
+
+class NdjsonArchive:
+    """Append documents as extended JSON lines to a gzip file, created on first write"""
+
+    def __init__(self, directory: Path, collection: str, started_at: datetime):
+        self.path = directory / f"{collection}-{started_at:%Y%m%dT%H%M%S}.ndjson.gz"
+        self.raw = None
+        self.file = None
+
+    def write(self, docs: List[Dict[str, Any]]):
+        if self.file is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self.raw = open(self.path, "ab")
+            self.file = io.TextIOWrapper(gzip.GzipFile(fileobj=self.raw, mode="ab"), encoding="utf-8")
+        for doc in docs:
+            self.file.write(json_util.dumps(doc, json_options=json_util.RELAXED_JSON_OPTIONS))
+            self.file.write("\n")
+        # Make the batch durable before its documents are deleted from Mongo: flush the
+        # compressor to the file, then the file to disk
+        self.file.flush()
+        os.fsync(self.raw.fileno())
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.raw.close()
+
+async def archive_matching(
+    db: Database,
+    collection: str,
+    filter_query: Dict[str, Any],
+    directory: Optional[Path],
+    started_at: datetime,
+    batch_size: int,
+    pause: float
+) -> ArchiveReport:
+    """Move every document matching filter_query into its archive collection, or a gzip NDJSON file under directory"""
+    report = ArchiveReport(collection)
+    ndjson = NdjsonArchive(directory, collection, started_at) if directory else None
+    report.destination = str(ndjson.path) if ndjson else f"{collection}_archive"
+    try:
+        while True:
+            # Archived documents leave the collection, so each batch is simply the next matching documents
+            docs = await db.find_archivable(collection, filter_query, batch_size)
+            if not docs:
+                break
+            if ndjson:
+                await asyncio.to_thread(ndjson.write, docs)
+            report.archived += await db.archive_documents(collection, docs, filter_query, keep_copy=ndjson is None)
+            if collection in IMAGE_OWNERS:
+                await db.delete_image_variants([doc["id"] for doc in docs if "id" in doc])
+            await asyncio.sleep(pause)
+    finally:
+        if ndjson:
+            ndjson.close()
+    return report
+
+async def archive(
+    db: Database,
+    answers_older_than_days: Optional[int],
+    directory: Optional[Path] = None,
+    batch_size: int = 1000,
+    pause: float = 0.05
+) -> List[ArchiveReport]:
+    """Archive soft-deleted documents and, optionally, answers older than a number of days.
+
+    Answers always go to the user_answers_archive collection, even when
+    directory is given, because score, statistics and rating rebuilds read
+    them from there. Counters such as user_scores, user_rollups, question
+    stats and activity rollups are stored separately and stay as they are.
+    """
+    started_at = datetime.utcnow()
+    reports = []
+    for collection in SOFT_DELETED_COLLECTIONS:
+        reports.append(await archive_matching(db, collection, {"is_active": False}, directory, started_at, batch_size, pause))
+
+    if answers_older_than_days is not None:
+        # Archived answers keep their scoring fields, so rebuilds never need to look up archived questions
+        await db.backfill_answer_scoring_fields()
+        cutoff = started_at - timedelta(days=answers_older_than_days)
+        reports.append(await archive_matching(db, "user_answers", {"created_at": {"$lt": cutoff}}, None, started_at, batch_size, pause))
+
+    for report in reports:
+        logger.info(f"Archived {report.archived} {report.collection} documents to {report.destination}")
+    return reports
@@ -1,26 +1,30 @@
+import asyncio
 import httpx
 from datetime import datetime, timedelta
 from typing import Optional, Dict, Any
 from fastapi import HTTPException, Depends, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from models import User, UserSession, UserRole
-from database import Database
+from storage import Storage
+from tracing import span
 
 security = HTTPBearer()
 
 class AuthService:
-    def __init__(self, db: Database):
+    def __init__(self, db: Storage, last_login_interval: timedelta = timedelta(minutes=15)):
         self.db = db
+        self.last_login_interval = last_login_interval  # last_login is only rewritten once it is this old
         self.emergent_auth_url = "https://demobackend.emergentagent.com/auth/v1/env/oauth/session-data"
     
     async def authenticate_with_emergent(self, session_id: str) -> Dict[str, Any]:
         """Authenticate user with Emergent Auth service"""
         try:
             headers = {"X-Session-ID": session_id}
-            async with httpx.AsyncClient() as client:
-                response = await client.get(self.emergent_auth_url, headers=headers)
-                response.raise_for_status()
-                return response.json()
+            with span("auth.emergent"):
+                async with httpx.AsyncClient() as client:
+                    response = await client.get(self.emergent_auth_url, headers=headers)
+                    response.raise_for_status()
+                    return response.json()
         except httpx.HTTPError as e:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
@@ -32,33 +36,27 @@ class AuthService:
         # Get user data from Emergent Auth
         auth_data = await self.authenticate_with_emergent(session_id)
         
-        # Check if user exists
-        user = await self.db.get_user_by_email(auth_data["email"])
-        
-        if not user:
-            # Create new user
-            user_data = {
-                "email": auth_data["email"],
-                "name": auth_data["name"],
-                "picture": auth_data.get("picture"),
-                "role": UserRole.ADMIN if auth_data["email"] == "mehedi.hasin@example.com" else UserRole.USER,
-                "last_login": datetime.utcnow()
-            }
-            user = await self.db.create_user(user_data)
-        else:
-            # Update last login
-            await self.db.users.update_one(
-                {"id": user.id},
-                {"$set": {"last_login": datetime.utcnow()}}
-            )
+        # Find or create the user and record the login in one atomic write
+        now = datetime.utcnow()
+        user_data = {
+            "email": auth_data["email"],
+            "name": auth_data["name"],
+            "picture": auth_data.get("picture"),
+            "role": UserRole.ADMIN if auth_data["email"] == "mehedi.hasin@example.com" else UserRole.USER
+        }
+        user, created = await self.db.login_user(user_data, now, self.last_login_interval)
         
-        # Create session
+        # The session and the signup count are independent, so write them together
         session_data = {
             "user_id": user.id,
             "session_token": auth_data["session_token"],
-            "expires_at": datetime.utcnow() + timedelta(days=7)
+            "expires_at": now + timedelta(days=7)
         }
-        session = await self.db.create_session(session_data)
+        writes = [self.db.create_session(session_data)]
+        if created:
+            writes.append(self.db.record_signup_activity(user.created_at))
+        session, *_ = await asyncio.gather(*writes)
+        self.db.record_active_user(user.id)
         
         return {
             "user": user,
@@ -87,7 +85,8 @@ class AuthService:
                 detail="Authentication required"
             )
         
-        user = await self.get_current_user(credentials.credentials)
+        with span("auth.require_auth"):
+            user = await self.get_current_user(credentials.credentials)
         if not user:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
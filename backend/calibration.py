@@ -0,0 +1,174 @@
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, List, Tuple
+import logging
+
+import numpy as np
+import pandas as pd
+
+from database import Database
+from models import DifficultyLevel
+
+logger = logging.getLogger(__name__)
+
+# Gaussian priors keep sparse users and questions from diverging and fix the ability scale
+ABILITY_PRIOR_SD = 1.0
+DIFFICULTY_PRIOR_SD = 2.0
+LOG_DISCRIMINATION_PRIOR_SD = 0.5
+MAX_STEP = 1.0
+
+@dataclass
+class CalibrationReport:
+    answers: int = 0
+    users: int = 0
+    questions: int = 0
+    calibrated: int = 0  # Questions with enough responses to be written back
+    relabelled: int = 0  # Questions whose difficulty level changed
+    iterations: int = 0
+    converged: bool = False
+
+class IdCodes:
+    """Incrementally map string ids to dense integer codes, one batch at a time"""
+
+    def __init__(self):
+        self.codes: Dict[str, int] = {}
+
+    def encode(self, ids: List[str]) -> np.ndarray:
+        # Factorize within the batch so the dict is only consulted once per distinct id
+        batch_codes, uniques = pd.factorize(np.asarray(ids, dtype=object))
+        lookup = np.fromiter((self.codes.setdefault(uid, len(self.codes)) for uid in uniques), dtype=np.int64, count=len(uniques))
+        return lookup[batch_codes]
+
+    def ids(self) -> np.ndarray:
+        return np.array(list(self.codes), dtype=object)
+
+async def load_responses(db: Database, batch_size: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray, IdCodes, IdCodes]:
+    """Read the answer log into user code, question code and correctness arrays.
+
+    Only each user's first attempt at a question is kept, since later
+    attempts are informed by the revealed answer.
+    """
+    users, questions = IdCodes(), IdCodes()
+    user_parts, question_parts, correct_parts = [], [], []
+    async for batch in db.iter_answer_outcomes(batch_size):
+        user_parts.append(users.encode(batch["user_id"]))
+        question_parts.append(questions.encode(batch["question_id"]))
+        correct_parts.append(np.asarray(batch["is_correct"], dtype=bool))
+
+    if not user_parts:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty, np.empty(0, dtype=bool), users, questions
+
+    user_codes = np.concatenate(user_parts)
+    question_codes = np.concatenate(question_parts)
+    correct = np.concatenate(correct_parts)
+    _, first = np.unique(user_codes * len(questions.codes) + question_codes, return_index=True)
+    first.sort()
+    return user_codes[first], question_codes[first], correct[first], users, questions
+
+def fit_2pl(
+    user_codes: np.ndarray,
+    question_codes: np.ndarray,
+    correct: np.ndarray,
+    n_users: int,
+    n_questions: int,
+    max_iterations: int = 100,
+    tolerance: float = 1e-3
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, int, bool]:
+    """Fit a two-parameter logistic IRT model by penalized maximum likelihood.
+
+    P(correct) = sigmoid(a_q * (theta_u - b_q)). Abilities, difficulties and
+    log discriminations are updated in turn with diagonal Newton steps whose
+    gradients and curvatures are summed per user or question with bincount.
+    Returns (ability, difficulty, discrimination, iterations, converged).
+    """
+    y = correct.astype(np.float64)
+    theta = np.zeros(n_users)
+    b = np.zeros(n_questions)
+    log_a = np.zeros(n_questions)
+
+    def predict():
+        a = np.exp(log_a)[question_codes]
+        spread = theta[user_codes] - b[question_codes]
+        p = 1.0 / (1.0 + np.exp(-a * spread))
+        return a, spread, p, p * (1.0 - p)
+
+    for iteration in range(1, max_iterations + 1):
+        a, spread, p, weight = predict()
+        gradient = np.bincount(user_codes, (y - p) * a, n_users) - theta / ABILITY_PRIOR_SD ** 2
+        curvature = np.bincount(user_codes, weight * a * a, n_users) + 1 / ABILITY_PRIOR_SD ** 2
+        theta_step = np.clip(gradient / curvature, -MAX_STEP, MAX_STEP)
+        theta += theta_step
+
+        a, spread, p, weight = predict()
+        gradient = np.bincount(question_codes, -(y - p) * a, n_questions) - b / DIFFICULTY_PRIOR_SD ** 2
+        curvature = np.bincount(question_codes, weight * a * a, n_questions) + 1 / DIFFICULTY_PRIOR_SD ** 2
+        b_step = np.clip(gradient / curvature, -MAX_STEP, MAX_STEP)
+        b += b_step
+
+        a, spread, p, weight = predict()
+        # Derivatives with respect to log a, so discriminations stay positive
+        gradient = np.bincount(question_codes, (y - p) * a * spread, n_questions) - log_a / LOG_DISCRIMINATION_PRIOR_SD ** 2
+        curvature = np.bincount(question_codes, weight * (a * spread) ** 2, n_questions) + 1 / LOG_DISCRIMINATION_PRIOR_SD ** 2
+        log_a_step = np.clip(gradient / curvature, -MAX_STEP, MAX_STEP)
+        log_a += log_a_step
+
+        largest_step = max(np.abs(theta_step).max(initial=0), np.abs(b_step).max(initial=0), np.abs(log_a_step).max(initial=0))
+        if largest_step < tolerance:
+            return theta, b, np.exp(log_a), iteration, True
+
+    return theta, b, np.exp(log_a), max_iterations, False
+
+def difficulty_levels(difficulty: np.ndarray, easy_below: float, hard_above: float) -> np.ndarray:
+    """Map calibrated difficulties onto the easy/medium/hard scale"""
+    return np.select(
+        [difficulty < easy_below, difficulty > hard_above],
+        [DifficultyLevel.EASY.value, DifficultyLevel.HARD.value],
+        DifficultyLevel.MEDIUM.value
+    )
+
+async def calibrate_questions(
+    db: Database,
+    min_responses: int = 30,
+    update_levels: bool = False,
+    easy_below: float = -0.75,
+    hard_above: float = 0.75,
+    batch_size: int = 50000,
+    max_iterations: int = 100
+) -> CalibrationReport:
+    """Fit item difficulty and discrimination from the answer log and store them on questions"""
+    report = CalibrationReport()
+    user_codes, question_codes, correct, users, questions = await load_responses(db, batch_size)
+    report.answers, report.users, report.questions = len(correct), len(users.codes), len(questions.codes)
+    if not report.answers:
+        return report
+
+    _, difficulty, discrimination, report.iterations, report.converged = fit_2pl(
+        user_codes, question_codes, correct, report.users, report.questions, max_iterations
+    )
+    if not report.converged:
+        logger.warning(f"Calibration stopped after {report.iterations} iterations without converging")
+
+    responses = np.bincount(question_codes, minlength=report.questions)
+    accuracy = np.bincount(question_codes, correct.astype(np.float64), report.questions) / np.maximum(responses, 1)
+    calibrated = np.flatnonzero(responses >= min_responses)
+    levels = difficulty_levels(difficulty, easy_below, hard_above)
+    question_ids = questions.ids()
+    calibrated_at = datetime.utcnow()
+
+    calibrations = [
+        {
+            "id": question_ids[index],
+            "calibration": {
+                "difficulty": round(float(difficulty[index]), 4),
+                "discrimination": round(float(discrimination[index]), 4),
+                "responses": int(responses[index]),
+                "accuracy": round(float(accuracy[index]), 4),
+                "calibrated_at": calibrated_at
+            },
+            "level": str(levels[index]) if update_levels else None
+        }
+        for index in calibrated
+    ]
+    report.calibrated, report.relabelled = await db.save_question_calibrations(calibrations)
+    return report
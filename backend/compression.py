@@ -0,0 +1,165 @@
+from collections import OrderedDict
+from hashlib import blake2b
+from typing import Callable, Dict, List, Optional, Tuple
+import asyncio
+import gzip
+
+try:
+    import brotli
+except ImportError:  # Optional: only gzip is offered without it
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # Optional: only gzip is offered without it
+    zstandard = None
+
+# Smallest body worth compressing, by media type prefix; anything unlisted is sent as is
+MIN_SIZES = {
+    "application/json": 1024,
+    "text/": 1024,
+    "application/javascript": 1024,
+    "image/svg+xml": 1024,
+}
+
+THREAD_MIN_SIZE = 64 * 1024  # Larger bodies are compressed in a worker thread, off the event loop
+
+COMPRESSORS: Dict[str, Callable[[bytes], bytes]] = {}
+if zstandard:
+    _zstd = zstandard.ZstdCompressor(level=6)
+    COMPRESSORS["zstd"] = _zstd.compress
+if brotli:
+    COMPRESSORS["br"] = lambda body: brotli.compress(body, quality=5)
+COMPRESSORS["gzip"] = lambda body: gzip.compress(body, compresslevel=6)
+
+def min_size_for(content_type: str) -> Optional[int]:
+    """Get the compression threshold for a media type, or None if it should never be compressed"""
+    media_type = content_type.split(";")[0].strip().lower()
+    for prefix, size in MIN_SIZES.items():
+        if media_type.startswith(prefix):
+            return size
+    return None
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """Pick the best supported encoding the client accepts, honouring q=0 exclusions"""
+    accepted = {}
+    for part in accept_encoding.lower().split(","):
+        name, _, params = part.strip().partition(";")
+        quality = 1.0
+        if params.strip().startswith("q="):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip()] = quality
+
+    for encoding in COMPRESSORS:
+        if accepted.get(encoding, accepted.get("*", 0.0)) > 0:
+            return encoding
+    return None
+
+class CompressionMiddleware:
+    """Compress buffered responses with zstd, brotli or gzip as the client allows.
+
+    Only text-like media types above a per-type size threshold are
+    compressed; images and other binary payloads pass through. Streaming
+    responses are never buffered. Compressed bodies of successful GET
+    responses under cacheable_prefixes are kept in an LRU keyed by body
+    digest and bounded by total size, so repeated public responses are not
+    recompressed.
+    """
+
+    def __init__(self, app, cacheable_prefixes: Tuple[str, ...] = (), max_cached_bytes: int = 16 * 1024 * 1024):
+        self.app = app
+        self.cacheable_prefixes = cacheable_prefixes
+        self.max_cached_bytes = max_cached_bytes
+        self.cached_bytes = 0
+        self.cache: "OrderedDict[Tuple[bytes, str], bytes]" = OrderedDict()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope["headers"])
+        encoding = choose_encoding(headers.get(b"accept-encoding", b"").decode("latin-1"))
+        if not encoding:
+            await self.app(scope, receive, send)
+            return
+
+        cacheable = scope["method"] == "GET" and scope["path"].startswith(self.cacheable_prefixes)
+        start_message = None
+        body_parts: List[bytes] = []
+        passthrough = False
+
+        async def send_compressed(message):
+            nonlocal start_message, passthrough
+            if passthrough:
+                await send(message)
+                return
+
+            if message["type"] == "http.response.start":
+                start_message = message
+                response_headers = dict(message.get("headers", []))
+                content_type = response_headers.get(b"content-type", b"").decode("latin-1")
+                if b"content-encoding" in response_headers or min_size_for(content_type) is None:
+                    passthrough = True
+                    await send(message)
+                return
+
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body_parts.append(message.get("body", b""))
+            if message.get("more_body", False):
+                if len(body_parts) == 1:
+                    # Streaming response: send it through uncompressed
+                    passthrough = True
+                    await send(start_message)
+                    await send(message)
+                return
+
+            await self.finish(start_message, b"".join(body_parts), encoding, cacheable, send)
+
+        await self.app(scope, receive, send_compressed)
+
+    async def finish(self, start_message, body: bytes, encoding: str, cacheable: bool, send):
+        """Send a complete buffered response, compressed if it qualifies"""
+        response_headers = [(name, value) for name, value in start_message.get("headers", []) if name != b"content-length"]
+        content_type = dict(response_headers).get(b"content-type", b"").decode("latin-1")
+        if len(body) < (min_size_for(content_type) or 0):
+            await send({**start_message, "headers": response_headers + [(b"content-length", str(len(body)).encode())]})
+            await send({"type": "http.response.body", "body": body})
+            return
+
+        cacheable = cacheable and start_message["status"] == 200
+        compressed = await self.compress(body, encoding, cacheable)
+        response_headers += [
+            (b"content-encoding", encoding.encode()),
+            (b"content-length", str(len(compressed)).encode()),
+            (b"vary", b"Accept-Encoding"),
+        ]
+        await send({**start_message, "headers": response_headers})
+        await send({"type": "http.response.body", "body": compressed})
+
+    async def compress(self, body: bytes, encoding: str, cacheable: bool) -> bytes:
+        """Compress body, reusing a cached result for identical cacheable bodies"""
+        key = (blake2b(body, digest_size=16).digest(), encoding) if cacheable else None
+        compressed = self.cache.get(key) if key else None
+        if compressed is not None:
+            self.cache.move_to_end(key)
+            return compressed
+
+        if len(body) >= THREAD_MIN_SIZE:
+            compressed = await asyncio.to_thread(COMPRESSORS[encoding], body)
+        else:
+            compressed = COMPRESSORS[encoding](body)
+        if key and len(compressed) <= self.max_cached_bytes:
+            if key not in self.cache:
+                self.cached_bytes += len(compressed)
+            self.cache[key] = compressed
+            while self.cached_bytes > self.max_cached_bytes:
+                _, evicted = self.cache.popitem(last=False)
+                self.cached_bytes -= len(evicted)
+        return compressed
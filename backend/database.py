@@ -1,31 +1,165 @@
 from motor.motor_asyncio import AsyncIOMotorClient
-from pymongo import IndexModel, ASCENDING, DESCENDING
-from datetime import datetime
-import os
-from typing import Optional, Dict, Any, List
-from models import User, Question, Competition, Panelist, AdminMember, ClubInfo, UserAnswer, UserScore, UserSession
+from pymongo import IndexModel, ASCENDING, DESCENDING, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from pymongo.read_concern import ReadConcern
+from pymongo.read_preferences import Nearest, Primary, PrimaryPreferred, Secondary, SecondaryPreferred
+from datetime import datetime, timedelta
+from typing import Optional, Dict, Any, List, Tuple, AsyncIterator
+import asyncio
+from hll import HyperLogLog
+from ratings import INITIAL_RATING, MIN_RATED_ANSWERS, rating_change_expression
+from storage import (
+    Storage, ACTIVITY_SPANS, ACTIVITY_ALL_SUBJECTS, activity_bucket_range, bucket_start, field_key,
+    previous_day, encode_cursor, decode_cursor, with_rates, iter_batches
+)
+from models import User, Question, AdminQuestion, Competition, CompetitionStatus, CompetitionLeaderboard, Panelist, AdminMember, ClubInfo, UserAnswer, UserScore, SubjectStanding, UserSession, UserRollup, ActivityBucket, Achievement
 
-class Database:
-    def __init__(self, mongo_url: str, db_name: str):
-        self.client = AsyncIOMotorClient(mongo_url)
+# Public reads that may be served slightly stale; auth and grading reads always use the primary
+STALE_TOLERANT_READS = (
+    "get_questions",
+    "get_questions_by_ids",
+    "get_subject_question_counts",
+    "get_panelists",
+    "get_admin_members",
+    "get_club_info",
+    "get_leaderboard",
+    "get_rating_leaderboard",
+    "get_competitions",
+    "get_competition_results",
+    "get_public_question"
+)
+READ_PREFERENCES = {
+    "primary": Primary,
+    "primaryPreferred": PrimaryPreferred,
+    "secondary": Secondary,
+    "secondaryPreferred": SecondaryPreferred,
+    "nearest": Nearest
+}
+
+def parse_read_route(route: str, max_staleness_seconds: int = -1) -> Tuple[Any, ReadConcern]:
+    """Parse a read route of the form mode[:read concern level], e.g. secondaryPreferred:available"""
+    mode, _, level = route.partition(":")
+    if mode not in READ_PREFERENCES:
+        raise ValueError(f"Unknown read preference: {mode}")
+    preference = Primary() if mode == "primary" else READ_PREFERENCES[mode](max_staleness=max_staleness_seconds)
+    return preference, ReadConcern(level or None)
+
+ANSWER_ARCHIVE = "user_answers_archive"
+
+def with_archived_answers(match: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Pipeline stages selecting answers from the live log and the answer archive"""
+    return [
+        {"$match": match},
+        {"$unionWith": {"coll": ANSWER_ARCHIVE, "pipeline": [{"$match": match}]}}
+    ]
+
+def competition_standings_pipeline(competition_id: str, until: Optional[datetime] = None) -> List[Dict[str, Any]]:
+    """Aggregate a competition's answers into per-user standings ranked by score, then total time"""
+    match = {"competition_id": competition_id}
+    if until:
+        match["created_at"] = {"$lte": until}
+    return with_archived_answers(match) + [
+        {
+            "$group": {
+                "_id": "$user_id",
+                "score": {"$sum": {"$ifNull": ["$points_earned", 0]}},
+                "questions_answered": {"$sum": 1},
+                "correct_answers": {"$sum": {"$cond": ["$is_correct", 1, 0]}},
+                "time_taken": {"$sum": "$time_taken"}
+            }
+        },
+        {
+            "$setWindowFields": {
+                "sortBy": {"score": -1, "time_taken": 1},
+                "output": {"rank": {"$rank": {}}}
+            }
+        },
+        {"$sort": {"rank": 1, "_id": 1}},
+        {
+            "$lookup": {
+                "from": "users",
+                "localField": "_id",
+                "foreignField": "id",
+                "pipeline": [{"$project": {"_id": 0, "name": 1, "email": 1}}],
+                "as": "user"
+            }
+        },
+        {
+            "$project": {
+                "_id": 0,
+                "rank": 1,
+                "user_id": "$_id",
+                "user_name": {"$ifNull": [{"$arrayElemAt": ["$user.name", 0]}, ""]},
+                "email": {"$arrayElemAt": ["$user.email", 0]},
+                "score": 1,
+                "questions_answered": 1,
+                "correct_answers": 1,
+                "time_taken": 1
+            }
+        }
+    ]
+
+class Database(Storage):
+    """Storage in MongoDB through Motor, with per-method read routing"""
+    
+    supports_change_streams = True
+    
+    def __init__(
+        self,
+        mongo_url: str,
+        db_name: str,
+        event_listeners: Optional[List[Any]] = None,
+        read_routes: Optional[Dict[str, str]] = None,
+        max_staleness_seconds: int = -1
+    ):
+        super().__init__()
+        self.client = AsyncIOMotorClient(mongo_url, event_listeners=event_listeners or [])
         self.db = self.client[db_name]
         
+        # Per-method read preference and read concern, e.g. {"get_panelists": "secondaryPreferred:local"}
+        self.read_routes = {
+            method: parse_read_route(route, max_staleness_seconds)
+            for method, route in (read_routes or {}).items()
+        }
+        
         # Collection references
         self.users = self.db.users
         self.sessions = self.db.sessions
         self.questions = self.db.questions
         self.competitions = self.db.competitions
+        self.competition_results = self.db.competition_results
+        self.locks = self.db.locks
         self.panelists = self.db.panelists
         self.admin_members = self.db.admin_members
         self.club_info = self.db.club_info
         self.user_answers = self.db.user_answers
+        self.user_answers_archive = self.db[ANSWER_ARCHIVE]
         self.user_scores = self.db.user_scores
+        self.user_scores_rebuild = self.db.user_scores_rebuild
+        self.user_rollups = self.db.user_rollups
+        self.user_answered = self.db.user_answered
+        self.counters = self.db.counters
+        self.activity_rollups = self.db.activity_rollups
+        self.activity_users = self.db.activity_users
+        self.active_user_sketches = self.db.active_user_sketches
+        self.change_stream_tokens = self.db.change_stream_tokens
+        self.image_variants = self.db.image_variants
         self.achievements = self.db.achievements
+        self.achievement_progress = self.db.achievement_progress
+    
+    def reader(self, collection, method: str):
+        """Get collection with the read preference and read concern routed for method"""
+        route = self.read_routes.get(method)
+        if not route:
+            return collection
+        read_preference, read_concern = route
+        return collection.with_options(read_preference=read_preference, read_concern=read_concern)
     
     async def create_indexes(self):
         """Create database indexes for better performance"""
         try:
             # Users indexes
+            await self.users.create_index([("id", ASCENDING)])
             await self.users.create_index([("email", ASCENDING)], unique=True)
             await self.users.create_index([("role", ASCENDING)])
             await self.users.create_index([("created_at", DESCENDING)])
@@ -36,27 +170,75 @@ class Database:
             await self.sessions.create_index([("expires_at", ASCENDING)])
             
             # Questions indexes
+            await self.questions.create_index([("id", ASCENDING)])
             await self.questions.create_index([("subject", ASCENDING)])
             await self.questions.create_index([("difficulty", ASCENDING)])
             await self.questions.create_index([("created_by", ASCENDING)])
             await self.questions.create_index([("is_active", ASCENDING)])
             await self.questions.create_index([("tags", ASCENDING)])
+            await self.questions.create_index(
+                [("ordinal", ASCENDING)],
+                unique=True,
+                partialFilterExpression={"ordinal": {"$exists": True}}
+            )
             
             # Competitions indexes
             await self.competitions.create_index([("status", ASCENDING)])
             await self.competitions.create_index([("subject", ASCENDING)])
             await self.competitions.create_index([("start_date", ASCENDING)])
             await self.competitions.create_index([("created_by", ASCENDING)])
+            await self.competitions.create_index([("id", ASCENDING)], unique=True)
+            await self.competition_results.create_index([("competition_id", ASCENDING), ("user_id", ASCENDING)], unique=True)
+            await self.competition_results.create_index([("competition_id", ASCENDING), ("rank", ASCENDING)])
             
             # User answers indexes
             await self.user_answers.create_index([("user_id", ASCENDING)])
             await self.user_answers.create_index([("question_id", ASCENDING)])
             await self.user_answers.create_index([("competition_id", ASCENDING)])
             await self.user_answers.create_index([("created_at", DESCENDING)])
+            await self.user_answers.create_index([("user_id", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)])
+            await self.user_answers.create_index([("user_id", ASCENDING), ("subject", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)])
+            await self.user_answers.create_index([("user_id", ASCENDING), ("competition_id", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)])
+            
+            # Archived answers are read by rebuilds, which filter by subject or competition, by replays in created_at
+            # order, and per user by answer history and recommendations (which use the user_id prefix)
+            await self.user_answers_archive.create_index([("subject", ASCENDING), ("created_at", ASCENDING)])
+            await self.user_answers_archive.create_index([("competition_id", ASCENDING)])
+            await self.user_answers_archive.create_index([("created_at", ASCENDING)])
+            await self.user_answers_archive.create_index([("user_id", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)])
             
             # User scores indexes
             await self.user_scores.create_index([("user_id", ASCENDING), ("subject", ASCENDING)], unique=True)
             await self.user_scores.create_index([("total_score", DESCENDING)])
+            await self.user_scores.create_index([("subject", ASCENDING), ("rating", DESCENDING)])
+            await self.user_scores.create_index([("subject", ASCENDING), ("total_score", DESCENDING)])
+            await self.user_scores_rebuild.create_index([("user_id", ASCENDING), ("subject", ASCENDING)], unique=True)
+            
+            # User rollups indexes
+            await self.user_rollups.create_index([("user_id", ASCENDING)], unique=True)
+            await self.user_answered.create_index([("user_id", ASCENDING)], unique=True)
+            
+            # Activity rollup indexes
+            await self.activity_rollups.create_index(
+                [("granularity", ASCENDING), ("subject", ASCENDING), ("bucket", ASCENDING)],
+                unique=True
+            )
+            await self.activity_users.create_index([("expires_at", ASCENDING)], expireAfterSeconds=0)
+            
+            # Achievement indexes
+            await self.achievements.create_index([("user_id", ASCENDING), ("date_earned", DESCENDING)])
+            await self.achievements.create_index(
+                [("user_id", ASCENDING), ("rule_id", ASCENDING)],
+                unique=True,
+                partialFilterExpression={"rule_id": {"$type": "string"}}
+            )
+            await self.achievement_progress.create_index([("user_id", ASCENDING)], unique=True)
+            
+            # Resume tokens of workers that stopped for good (e.g. keyed by a process ID) expire
+            await self.change_stream_tokens.create_index([("updated_at", ASCENDING)], expireAfterSeconds=7 * 24 * 3600)
+            
+            # Image variant indexes
+            await self.image_variants.create_index([("owner_id", ASCENDING), ("variant", ASCENDING)], unique=True)
             
             # Club info indexes
             await self.club_info.create_index([("section", ASCENDING)])
@@ -80,8 +262,53 @@ class Database:
         """Create a new user"""
         user = User(**user_data)
         await self.users.insert_one(user.dict())
+        await self.record_signup_activity(user.created_at)
         return user
     
+    async def login_user(self, user_data: Dict[str, Any], at: datetime, last_login_interval: timedelta) -> Tuple[User, bool]:
+        """Find or create a user by email and record the login in one atomic upsert, returning (user, created).
+        
+        A new user gets the candidate's ID, which is how creation is detected.
+        The unique email index stops concurrent first logins from creating two
+        users; the loser of such a race retries once and finds the winner's user.
+        """
+        candidate = User(**{**user_data, "last_login": at}).dict()
+        created = {"$eq": ["$id", candidate["id"]]}
+        pipeline = [
+            {"$set": {"id": {"$ifNull": ["$id", candidate["id"]]}}},
+            {
+                "$set": {
+                    **{
+                        field: {"$cond": [created, {"$literal": value}, f"${field}"]}
+                        for field, value in candidate.items() if field not in ("id", "email", "last_login")
+                    },
+                    # Only move last_login once it is older than the interval, so frequent logins skip the write
+                    "last_login": {
+                        "$cond": [
+                            {"$or": [created, {"$not": [{"$gt": ["$last_login", at - last_login_interval]}]}]},
+                            at,
+                            "$last_login"
+                        ]
+                    }
+                }
+            }
+        ]
+        
+        async def upsert():
+            return await self.users.find_one_and_update(
+                {"email": candidate["email"]},
+                pipeline,
+                projection={"_id": 0},
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+        
+        try:
+            user_doc = await upsert()
+        except DuplicateKeyError:
+            user_doc = await upsert()
+        return User(**user_doc), user_doc["id"] == candidate["id"]
+    
     async def create_session(self, session_data: Dict[str, Any]) -> UserSession:
         """Create a new user session"""
         session = UserSession(**session_data)
@@ -104,8 +331,40 @@ class Database:
             {"$set": {"is_active": False}}
         )
     
+    async def allocate_ordinals(self, name: str, count: int = 1) -> int:
+        """Reserve count consecutive values from a named counter and return the first"""
+        doc = await self.counters.find_one_and_update(
+            {"_id": name},
+            {"$inc": {"seq": count}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        return doc["seq"] - count + 1
+    
+    async def assign_missing_question_ordinals(self) -> int:
+        """Give every question created before ordinals existed its own ordinal"""
+        question_ids = [doc["id"] async for doc in self.questions.find({"ordinal": {"$exists": False}}, {"id": 1})]
+        if not question_ids:
+            return 0
+        
+        first = await self.allocate_ordinals("question_ordinal", len(question_ids))
+        await self.questions.bulk_write([
+            UpdateOne({"id": question_id, "ordinal": {"$exists": False}}, {"$set": {"ordinal": first + offset}})
+            for offset, question_id in enumerate(question_ids)
+        ], ordered=False)
+        return len(question_ids)
+    
+    async def iter_question_index_entries(self, fields: Optional[List[str]] = None) -> AsyncIterator[Dict[str, Any]]:
+        """Iterate active questions with the fields needed by in-memory question indexes"""
+        projection = {"_id": 0, "id": 1, "ordinal": 1, "subject": 1, "difficulty": 1, "tags": 1, "is_active": 1}
+        projection.update({field: 1 for field in fields or []})
+        cursor = self.questions.find({"is_active": True, "ordinal": {"$exists": True}}, projection)
+        async for doc in cursor:
+            yield doc
+    
     async def create_question(self, question_data: Dict[str, Any]) -> Question:
         """Create a new question"""
+        question_data.setdefault("ordinal", await self.allocate_ordinals("question_ordinal"))
         question = Question(**question_data)
         await self.questions.insert_one(question.dict())
         return question
@@ -116,17 +375,58 @@ class Database:
         if subject:
             filter_query["subject"] = subject
         
-        cursor = self.questions.find(filter_query).skip(skip).limit(limit)
+        cursor = self.reader(self.questions, "get_questions").find(filter_query).skip(skip).limit(limit)
         questions = []
         async for doc in cursor:
             questions.append(Question(**doc))
         return questions
     
+    async def get_admin_questions(
+        self,
+        subject: Optional[str] = None,
+        include_inactive: bool = False,
+        limit: int = 20,
+        skip: int = 0
+    ) -> List[AdminQuestion]:
+        """Get questions together with their embedded answer statistics"""
+        filter_query = {} if include_inactive else {"is_active": True}
+        if subject:
+            filter_query["subject"] = subject
+        
+        cursor = self.questions.find(filter_query).sort("created_at", DESCENDING).skip(skip).limit(limit)
+        questions = []
+        async for doc in cursor:
+            doc["stats"] = with_rates(doc.get("stats", {}))
+            questions.append(AdminQuestion(**doc))
+        return questions
+    
+    async def get_subject_question_counts(self) -> Dict[str, int]:
+        """Count active questions per subject in a single aggregation"""
+        pipeline = [
+            {"$match": {"is_active": True}},
+            {"$group": {"_id": "$subject", "count": {"$sum": 1}}}
+        ]
+        questions = self.reader(self.questions, "get_subject_question_counts")
+        return {doc["_id"]: doc["count"] async for doc in questions.aggregate(pipeline)}
+    
     async def get_question_by_id(self, question_id: str) -> Optional[Question]:
         """Get question by ID"""
         question_doc = await self.questions.find_one({"id": question_id, "is_active": True})
         return Question(**question_doc) if question_doc else None
     
+    async def get_public_question(self, question_id: str) -> Optional[Question]:
+        """Get question by ID for display, tolerating a slightly stale copy"""
+        question_doc = await self.reader(self.questions, "get_public_question").find_one({"id": question_id, "is_active": True})
+        return Question(**question_doc) if question_doc else None
+    
+    async def get_questions_by_ids(self, question_ids: List[str]) -> List[Question]:
+        """Get active questions by ID in a single query, preserving the given order"""
+        questions = {}
+        cursor = self.reader(self.questions, "get_questions_by_ids").find({"id": {"$in": question_ids}, "is_active": True})
+        async for doc in cursor:
+            questions[doc["id"]] = Question(**doc)
+        return [questions[question_id] for question_id in question_ids if question_id in questions]
+    
     async def update_question(self, question_id: str, update_data: Dict[str, Any]) -> bool:
         """Update a question"""
         result = await self.questions.update_one(
@@ -143,6 +443,192 @@ class Database:
         )
         return result.modified_count > 0
     
+    async def update_question_stats(self, question_id: str, correct: bool, time_taken: int):
+        """Increment a question's embedded answer statistics"""
+        await self.questions.update_one(
+            {"id": question_id},
+            {"$inc": {"stats.attempts": 1, "stats.correct": 1 if correct else 0, "stats.total_time": time_taken}}
+        )
+    
+    async def apply_question_rating_changes(self, changes: Dict[str, float]):
+        """Move question ratings by the given amounts in one batch; unrated questions start from the initial rating"""
+        if not changes:
+            return
+        await self.questions.bulk_write([
+            UpdateOne({"id": question_id}, [{"$set": {"rating": {"$add": [{"$ifNull": ["$rating", INITIAL_RATING]}, rating_change]}}}])
+            for question_id, rating_change in changes.items()
+        ], ordered=False)
+    
+    async def rebuild_question_stats(self, batch_size: int = 1000) -> int:
+        """Recompute every question's answer statistics from the answer log"""
+        rebuilt_at = datetime.utcnow()
+        pipeline = with_archived_answers({}) + [
+            {
+                "$group": {
+                    "_id": "$question_id",
+                    "attempts": {"$sum": 1},
+                    "correct": {"$sum": {"$cond": ["$is_correct", 1, 0]}},
+                    "total_time": {"$sum": "$time_taken"}
+                }
+            }
+        ]
+        
+        updated = 0
+        batch = []
+        async for doc in self.user_answers.aggregate(pipeline, allowDiskUse=True):
+            stats = {"attempts": doc["attempts"], "correct": doc["correct"], "total_time": doc["total_time"], "rebuilt_at": rebuilt_at}
+            batch.append(UpdateOne({"id": doc["_id"]}, {"$set": {"stats": stats}}))
+            if len(batch) >= batch_size:
+                updated += (await self.questions.bulk_write(batch, ordered=False)).matched_count
+                batch = []
+        if batch:
+            updated += (await self.questions.bulk_write(batch, ordered=False)).matched_count
+        
+        # Questions that no longer appear in the log start again from zero
+        await self.questions.update_many(
+            {"stats.rebuilt_at": {"$ne": rebuilt_at}},
+            {"$set": {"stats": {"attempts": 0, "correct": 0, "total_time": 0, "rebuilt_at": rebuilt_at}}}
+        )
+        return updated
+    
+    async def find_archivable(self, collection: str, filter_query: Dict[str, Any], limit: int) -> List[Dict[str, Any]]:
+        """Get up to limit whole documents matching filter_query for archiving"""
+        return await self.db[collection].find(filter_query).limit(limit).to_list(limit)
+    
+    async def archive_documents(
+        self,
+        collection: str,
+        docs: List[Dict[str, Any]],
+        filter_query: Dict[str, Any],
+        keep_copy: bool = True
+    ) -> int:
+        """Move documents out of a hot collection, copying them into <collection>_archive first unless keep_copy is False.
+        
+        Copies are written before anything is deleted and keep their _id, so
+        an interrupted run can simply be repeated.
+        """
+        if not docs:
+            return 0
+        if keep_copy:
+            try:
+                await self.db[f"{collection}_archive"].insert_many(docs, ordered=False)
+            except BulkWriteError as e:
+                # Documents copied by an earlier, interrupted run are already archived
+                if any(error["code"] != 11000 for error in e.details.get("writeErrors", [])):
+                    raise
+        # Re-check the filter so a document changed since it was read stays in place
+        result = await self.db[collection].delete_many({"_id": {"$in": [doc["_id"] for doc in docs]}, **filter_query})
+        return result.deleted_count
+    
+    async def delete_image_variants(self, owner_ids: List[str]):
+        """Delete the stored image variants of removed owners"""
+        await self.image_variants.delete_many({"owner_id": {"$in": owner_ids}})
+    
+    async def iter_answer_log(
+        self,
+        projection: Dict[str, Any],
+        sort: List[Tuple[str, int]],
+        batch_size: int = 10000
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Iterate archived and then live answers, oldest first, each collection streamed in index order.
+        
+        Every archived answer is older than every live one, so no sort across
+        the two collections is needed.
+        """
+        for collection in (self.user_answers_archive, self.user_answers):
+            async for doc in collection.find({}, projection).sort(sort).batch_size(batch_size):
+                yield doc
+    
+    async def iter_answer_outcomes(self, batch_size: int = 50000) -> AsyncIterator[Dict[str, List[Any]]]:
+        """Iterate the answer log, archived answers included, oldest first as column batches of user_id, question_id and is_correct"""
+        docs = self.iter_answer_log({"_id": 0, "user_id": 1, "question_id": 1, "is_correct": 1}, [("_id", ASCENDING)], batch_size)
+        async for batch in iter_batches(docs, batch_size):
+            yield {
+                "user_id": [doc["user_id"] for doc in batch],
+                "question_id": [doc["question_id"] for doc in batch],
+                "is_correct": [doc["is_correct"] for doc in batch]
+            }
+    
+    async def save_question_calibrations(self, calibrations: List[Dict[str, Any]], batch_size: int = 1000) -> Tuple[int, int]:
+        """Store fitted calibrations, and difficulty levels where given, returning (updated, relabelled)"""
+        updated = relabelled = 0
+        for start in range(0, len(calibrations), batch_size):
+            batch = calibrations[start:start + batch_size]
+            result = await self.questions.bulk_write([
+                UpdateOne({"id": item["id"]}, {"$set": {"calibration": item["calibration"]}})
+                for item in batch
+            ], ordered=False)
+            updated += result.matched_count
+            
+            relabels = [
+                UpdateOne({"id": item["id"], "difficulty": {"$ne": item["level"]}}, {"$set": {"difficulty": item["level"]}})
+                for item in batch if item.get("level")
+            ]
+            if relabels:
+                relabelled += (await self.questions.bulk_write(relabels, ordered=False)).modified_count
+        return updated, relabelled
+    
+    async def create_competition(self, competition_data: Dict[str, Any]) -> Competition:
+        """Create a new competition"""
+        competition = Competition(**competition_data, total_questions=len(competition_data.get("questions", [])))
+        await self.competitions.insert_one(competition.dict())
+        return competition
+    
+    async def get_competition(self, competition_id: str) -> Optional[Competition]:
+        """Get an active competition by ID"""
+        doc = await self.competitions.find_one({"id": competition_id, "is_active": True})
+        return Competition(**doc) if doc else None
+    
+    async def get_competitions(self, status: Optional[str] = None, limit: int = 20, skip: int = 0) -> List[Competition]:
+        """Get active competitions, soonest first, optionally by status"""
+        filter_query = {"is_active": True}
+        if status:
+            filter_query["status"] = status
+        cursor = self.reader(self.competitions, "get_competitions").find(filter_query).sort("start_date", ASCENDING).skip(skip).limit(limit)
+        return [Competition(**doc) async for doc in cursor]
+    
+    async def get_scheduled_competitions(self) -> List[Competition]:
+        """Get competitions that still have a status change or finalization ahead of them"""
+        cursor = self.competitions.find({
+            "is_active": True,
+            "$or": [
+                {"status": {"$in": [CompetitionStatus.UPCOMING.value, CompetitionStatus.LIVE.value]}},
+                {"status": CompetitionStatus.COMPLETED.value, "results_finalized_at": None}
+            ]
+        })
+        return [Competition(**doc) async for doc in cursor]
+    
+    async def set_competition_status(self, competition_id: str, from_statuses: List[str], status: str) -> bool:
+        """Move a competition to status only if it is still in one of from_statuses"""
+        result = await self.competitions.update_one(
+            {"id": competition_id, "status": {"$in": from_statuses}},
+            {"$set": {"status": status, "status_changed_at": datetime.utcnow()}}
+        )
+        return result.modified_count > 0
+    
+    async def get_answer_key(self, question_ids: List[str]) -> Dict[str, Question]:
+        """Get active questions with their answers for grading, read from the primary"""
+        cursor = self.questions.find({"id": {"$in": question_ids}, "is_active": True})
+        return {doc["id"]: Question(**doc) async for doc in cursor}
+    
+    async def acquire_lease(self, name: str, holder: str, ttl_seconds: float) -> bool:
+        """Take or renew a named lease, returning False while another holder's lease is unexpired"""
+        now = datetime.utcnow()
+        try:
+            await self.locks.update_one(
+                {"_id": name, "$or": [{"holder": holder}, {"expires_at": {"$lt": now}}]},
+                {"$set": {"holder": holder, "expires_at": now + timedelta(seconds=ttl_seconds)}},
+                upsert=True
+            )
+        except DuplicateKeyError:
+            # The lease exists and is held by someone else, so the upsert tried to insert
+            return False
+        return True
+    
+    async def release_lease(self, name: str, holder: str):
+        """Give up a lease if holder still has it"""
+        await self.locks.delete_one({"_id": name, "holder": holder})
+    
     async def create_panelist(self, panelist_data: Dict[str, Any]) -> Panelist:
         """Create a new panelist"""
         panelist = Panelist(**panelist_data)
@@ -151,7 +637,7 @@ class Database:
     
     async def get_panelists(self) -> List[Panelist]:
         """Get all active panelists"""
-        cursor = self.panelists.find({"is_active": True})
+        cursor = self.reader(self.panelists, "get_panelists").find({"is_active": True}, {"image": 0})
         panelists = []
         async for doc in cursor:
             panelists.append(Panelist(**doc))
@@ -181,12 +667,56 @@ class Database:
     
     async def get_admin_members(self) -> List[AdminMember]:
         """Get all active admin members"""
-        cursor = self.admin_members.find({"is_active": True})
+        cursor = self.reader(self.admin_members, "get_admin_members").find({"is_active": True}, {"image": 0})
         admins = []
         async for doc in cursor:
             admins.append(AdminMember(**doc))
         return admins
     
+    async def set_image_variants(
+        self,
+        owner_collection: str,
+        owner_id: str,
+        variants: Dict[str, Tuple[bytes, str]],
+        content_type: str
+    ) -> Dict[str, Optional[str]]:
+        """Store resized variants of an owner's image and point the owner at them.
+        
+        variants maps variant name to (image bytes, version). An empty dict
+        removes any stored variants. Returns the <variant>_url fields that were set.
+        """
+        updated_at = datetime.utcnow()
+        for variant, (data, version) in variants.items():
+            await self.image_variants.update_one(
+                {"owner_id": owner_id, "variant": variant},
+                {"$set": {"content_type": content_type, "data": data, "version": version, "updated_at": updated_at}},
+                upsert=True
+            )
+        await self.image_variants.delete_many({"owner_id": owner_id, "variant": {"$nin": list(variants)}})
+        
+        urls = {
+            f"{variant}_url": f"/api/images/{owner_id}/{variant}?v={version}"
+            for variant, (_, version) in variants.items()
+        }
+        await self.db[owner_collection].update_one(
+            {"id": owner_id},
+            {"$set": urls} if urls else {"$unset": {"thumbnail_url": "", "medium_url": ""}}
+        )
+        return urls
+    
+    async def get_image_variant(self, owner_id: str, variant: str) -> Optional[Dict[str, Any]]:
+        """Get a stored image variant with its content type, data and version"""
+        return await self.image_variants.find_one({"owner_id": owner_id, "variant": variant}, {"_id": 0})
+    
+    async def iter_owner_images(self, owner_collection: str, missing_only: bool = True) -> AsyncIterator[Dict[str, Any]]:
+        """Iterate id and image of owners with an image, optionally only those without variants"""
+        filter_query = {"image": {"$nin": [None, ""]}}
+        if missing_only:
+            filter_query["thumbnail_url"] = {"$exists": False}
+        cursor = self.db[owner_collection].find(filter_query, {"_id": 0, "id": 1, "image": 1})
+        async for doc in cursor:
+            yield doc
+    
     async def create_club_info(self, club_data: Dict[str, Any]) -> ClubInfo:
         """Create club information"""
         club_info = ClubInfo(**club_data)
@@ -199,7 +729,7 @@ class Database:
         if section:
             filter_query["section"] = section
         
-        cursor = self.club_info.find(filter_query).sort("order", ASCENDING)
+        cursor = self.reader(self.club_info, "get_club_info").find(filter_query).sort("order", ASCENDING)
         club_infos = []
         async for doc in cursor:
             club_infos.append(ClubInfo(**doc))
@@ -225,26 +755,285 @@ class Database:
         if question_id:
             filter_query["question_id"] = question_id
         
-        cursor = self.user_answers.find(filter_query).sort("created_at", DESCENDING)
-        answers = []
-        async for doc in cursor:
-            answers.append(UserAnswer(**doc))
-        return answers
+        return [UserAnswer(**doc) for doc in await self.find_answers_newest_first(filter_query)]
+    
+    async def find_answers_newest_first(self, filter_query: Dict[str, Any], limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Find answers newest first in the live log, continuing into the archive if the live log runs out.
+        
+        The archive only receives answers older than a cutoff, so every archived
+        answer sorts after every live one and no merge is needed.
+        """
+        docs: List[Dict[str, Any]] = []
+        for collection in (self.user_answers, self.user_answers_archive):
+            cursor = collection.find(filter_query).sort([("created_at", DESCENDING), ("id", DESCENDING)])
+            if limit is not None:
+                cursor = cursor.limit(limit - len(docs))
+            docs += await cursor.to_list(None)
+            if limit is not None and len(docs) >= limit:
+                break
+        return docs
+    
+    async def get_user_answer_history(
+        self,
+        user_id: str,
+        subject: Optional[str] = None,
+        competition_id: Optional[str] = None,
+        limit: int = 20,
+        cursor: Optional[str] = None
+    ) -> Tuple[List[UserAnswer], Optional[str]]:
+        """Get a page of user answers, newest first, with a keyset cursor for the next page"""
+        filter_query: Dict[str, Any] = {"user_id": user_id}
+        if subject:
+            filter_query["subject"] = subject
+        if competition_id:
+            filter_query["competition_id"] = competition_id
+        if cursor:
+            created_at, doc_id = decode_cursor(cursor)
+            filter_query["$or"] = [
+                {"created_at": {"$lt": created_at}},
+                {"created_at": created_at, "id": {"$lt": doc_id}}
+            ]
+        
+        # Fetch one extra document to learn whether another page exists
+        answers = [UserAnswer(**doc) for doc in await self.find_answers_newest_first(filter_query, limit + 1)]
+        
+        next_cursor = None
+        if len(answers) > limit:
+            answers = answers[:limit]
+            next_cursor = encode_cursor(answers[-1].created_at, answers[-1].id)
+        return answers, next_cursor
     
-    async def update_user_score(self, user_id: str, subject: str, score_delta: int, correct: bool):
-        """Update user score"""
-        await self.user_scores.update_one(
+    async def update_user_rollup(self, user_id: str, subject: str, difficulty: str, correct: bool, time_taken: int):
+        """Increment the user's overall, per-subject and per-difficulty answer counters"""
+        subject_path = f"subjects.{field_key(subject)}"
+        increments = {}
+        for prefix in ("overall", subject_path, f"{subject_path}.difficulties.{field_key(difficulty)}"):
+            increments[f"{prefix}.attempts"] = 1
+            increments[f"{prefix}.correct"] = 1 if correct else 0
+            increments[f"{prefix}.total_time"] = time_taken
+        
+        await self.user_rollups.update_one(
+            {"user_id": user_id},
+            {"$inc": increments, "$set": {"updated_at": datetime.utcnow()}},
+            upsert=True
+        )
+    
+    async def get_user_rollup(self, user_id: str) -> UserRollup:
+        """Get the user's answer rollup with accuracy and average time filled in"""
+        doc = await self.user_rollups.find_one({"user_id": user_id})
+        if not doc:
+            return UserRollup(user_id=user_id)
+        
+        subjects = {}
+        for name, subject in doc.get("subjects", {}).items():
+            difficulties = {level: with_rates(counters) for level, counters in subject.get("difficulties", {}).items()}
+            subjects[name] = {**with_rates(subject), "difficulties": difficulties}
+        return UserRollup(
+            user_id=user_id,
+            overall=with_rates(doc.get("overall", {})),
+            subjects=subjects,
+            updated_at=doc.get("updated_at")
+        )
+    
+    async def get_answered_words(self, user_id: str) -> Optional[Dict[int, int]]:
+        """Get the user's answered-question bitmap as {word index: word}, or None if never built"""
+        doc = await self.user_answered.find_one({"user_id": user_id})
+        if not doc:
+            return None
+        return {int(index): word for index, word in doc.get("words", {}).items()}
+    
+    async def set_answered_bits(self, user_id: str, words: Dict[int, int], create: bool = True):
+        """OR the given words into the user's answered-question bitmap"""
+        if words:
+            update = {"$bit": {f"words.{index}": {"or": word} for index, word in words.items()}}
+        else:
+            update = {"$setOnInsert": {"words": {}}}
+        await self.user_answered.update_one({"user_id": user_id}, update, upsert=create)
+    
+    async def get_answered_question_ids(self, user_id: str) -> List[str]:
+        """Get the distinct IDs of every question the user has answered, archived answers included"""
+        pipeline = with_archived_answers({"user_id": user_id}) + [{"$group": {"_id": "$question_id"}}]
+        return [doc["_id"] async for doc in self.user_answers.aggregate(pipeline)]
+    
+    async def update_user_score(
+        self,
+        user_id: str,
+        subject: str,
+        score_delta: int,
+        correct: bool,
+        question_rating: float = INITIAL_RATING
+    ) -> Dict[str, Any]:
+        """Update user score and subject rating in one write, returning the updated document.
+        
+        The rating moves against question_rating; the applied change is kept in
+        rating_change so the question can be moved by the same answer.
+        """
+        return await self.user_scores.find_one_and_update(
             {"user_id": user_id, "subject": subject},
+            [
+                {
+                    # Every expression in one stage sees the document as it was before this answer
+                    "$set": {
+                        "total_score": {"$add": [{"$ifNull": ["$total_score", 0]}, score_delta]},
+                        "questions_answered": {"$add": [{"$ifNull": ["$questions_answered", 0]}, 1]},
+                        "correct_answers": {"$add": [{"$ifNull": ["$correct_answers", 0]}, 1 if correct else 0]},
+                        "rating_change": rating_change_expression(question_rating, correct),
+                        "updated_at": datetime.utcnow()
+                    }
+                },
+                {"$set": {"rating": {"$add": [{"$ifNull": ["$rating", INITIAL_RATING]}, "$rating_change"]}}}
+            ],
+            projection={"_id": 0, "rating": 1, "rating_change": 1, "questions_answered": 1},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+    
+    async def backfill_answer_scoring_fields(self):
+        """Fill in subject, difficulty and points_earned on answers saved before they were recorded"""
+        pipeline = [
+            {"$match": {"$or": [{"subject": {"$exists": False}}, {"points_earned": {"$exists": False}}]}},
+            {
+                "$lookup": {
+                    "from": "questions",
+                    "localField": "question_id",
+                    "foreignField": "id",
+                    "as": "question"
+                }
+            },
+            {"$unwind": "$question"},
+            {
+                "$project": {
+                    "subject": "$question.subject",
+                    "difficulty": "$question.difficulty",
+                    "points_earned": {"$cond": ["$is_correct", "$question.points", 0]}
+                }
+            },
+            {"$merge": {"into": "user_answers", "on": "_id", "whenMatched": "merge", "whenNotMatched": "discard"}}
+        ]
+        await self.user_answers.aggregate(pipeline, allowDiskUse=True).to_list(None)
+    
+    async def get_scored_subjects(self) -> List[str]:
+        """Get every subject that has answers or scores"""
+        subjects = set(await self.user_answers.distinct("subject")) | set(await self.user_scores.distinct("subject"))
+        return sorted(subject for subject in subjects if subject)
+    
+    async def rebuild_subject_scores(self, subject: str, snapshot_at: datetime):
+        """Recompute a subject's scores from answers up to snapshot_at into user_scores_rebuild"""
+        await self.user_scores_rebuild.delete_many({"subject": subject})
+        pipeline = with_archived_answers({"subject": subject, "created_at": {"$lte": snapshot_at}}) + [
+            {
+                "$group": {
+                    "_id": "$user_id",
+                    "total_score": {"$sum": {"$ifNull": ["$points_earned", 0]}},
+                    "questions_answered": {"$sum": 1},
+                    "correct_answers": {"$sum": {"$cond": ["$is_correct", 1, 0]}}
+                }
+            },
             {
-                "$inc": {
-                    "total_score": score_delta,
+                "$project": {
+                    "_id": 0,
+                    "user_id": "$_id",
+                    "subject": {"$literal": subject},
+                    "total_score": 1,
                     "questions_answered": 1,
-                    "correct_answers": 1 if correct else 0
-                },
-                "$set": {"updated_at": datetime.utcnow()}
+                    "correct_answers": 1
+                }
             },
-            upsert=True
+            {"$merge": {"into": "user_scores_rebuild", "on": ["user_id", "subject"], "whenMatched": "replace", "whenNotMatched": "insert"}}
+        ]
+        await self.user_answers.aggregate(pipeline, allowDiskUse=True).to_list(None)
+    
+    async def iter_score_differences(self, subject: str, batch_size: int = 500) -> AsyncIterator[List[Dict[str, Any]]]:
+        """Get rebuilt counters for every user scored in a subject, zero for live scores with no rebuilt row, in batches"""
+        counters = ["total_score", "questions_answered", "correct_answers"]
+        
+        def match_pair(collection: str) -> Dict[str, Any]:
+            return {
+                "$lookup": {
+                    "from": collection,
+                    "let": {"user_id": "$user_id", "subject": "$subject"},
+                    "pipeline": [
+                        {"$match": {"$expr": {"$and": [{"$eq": ["$user_id", "$$user_id"]}, {"$eq": ["$subject", "$$subject"]}]}}}
+                    ],
+                    "as": "other"
+                }
+            }
+        
+        pipeline = [
+            {"$match": {"subject": subject}},
+            {
+                "$project": {
+                    "_id": 0,
+                    "user_id": 1,
+                    "expected": {counter: f"${counter}" for counter in counters}
+                }
+            },
+            {
+                "$unionWith": {
+                    "coll": "user_scores",
+                    "pipeline": [
+                        {"$match": {"subject": subject}},
+                        match_pair("user_scores_rebuild"),
+                        {"$match": {"other": {"$size": 0}}},
+                        {
+                            "$project": {
+                                "_id": 0,
+                                "user_id": 1,
+                                "expected": {counter: {"$literal": 0} for counter in counters}
+                            }
+                        }
+                    ]
+                }
+            }
+        ]
+        
+        batch = []
+        async for doc in self.user_scores_rebuild.aggregate(pipeline, allowDiskUse=True):
+            batch.append(doc)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+    
+    async def get_score_changes_since(self, subject: str, user_ids: List[str], since: datetime) -> Dict[str, Dict[str, int]]:
+        """Sum score counters from answers saved after a point in time, per user"""
+        pipeline = [
+            {"$match": {"user_id": {"$in": user_ids}, "subject": subject, "created_at": {"$gt": since}}},
+            {
+                "$group": {
+                    "_id": "$user_id",
+                    "total_score": {"$sum": {"$ifNull": ["$points_earned", 0]}},
+                    "questions_answered": {"$sum": 1},
+                    "correct_answers": {"$sum": {"$cond": ["$is_correct", 1, 0]}}
+                }
+            }
+        ]
+        changes = {}
+        async for doc in self.user_answers.aggregate(pipeline):
+            changes[doc.pop("_id")] = doc
+        return changes
+    
+    async def get_score_counters(self, subject: str, user_ids: List[str]) -> Dict[str, Dict[str, int]]:
+        """Get the live score counters of the given users in a subject"""
+        cursor = self.user_scores.find(
+            {"subject": subject, "user_id": {"$in": user_ids}},
+            {"_id": 0, "user_id": 1, "total_score": 1, "questions_answered": 1, "correct_answers": 1}
         )
+        return {doc.pop("user_id"): doc async for doc in cursor}
+    
+    async def apply_score_corrections(self, subject: str, corrections: Dict[str, Dict[str, int]]):
+        """Increment user scores by the given per-user counter corrections"""
+        if not corrections:
+            return
+        await self.user_scores.bulk_write([
+            UpdateOne(
+                {"user_id": user_id, "subject": subject},
+                {"$inc": correction, "$set": {"updated_at": datetime.utcnow()}},
+                upsert=True
+            )
+            for user_id, correction in corrections.items()
+        ], ordered=False)
     
     async def get_user_score(self, user_id: str, subject: Optional[str] = None) -> List[UserScore]:
         """Get user scores"""
@@ -258,6 +1047,31 @@ class Database:
             scores.append(UserScore(**doc))
         return scores
     
+    async def get_user_standings(self, user_id: str) -> List[SubjectStanding]:
+        """Get the user's scores with their rank by total score in each subject"""
+        pipeline = [
+            {"$match": {"user_id": user_id}},
+            {
+                # Count the higher scores in each subject from the (subject, total_score) index
+                "$lookup": {
+                    "from": "user_scores",
+                    "let": {"subject": "$subject", "total_score": "$total_score"},
+                    "pipeline": [
+                        {"$match": {"$expr": {"$and": [
+                            {"$eq": ["$subject", "$$subject"]},
+                            {"$gt": ["$total_score", "$$total_score"]}
+                        ]}}},
+                        {"$count": "count"}
+                    ],
+                    "as": "ahead"
+                }
+            },
+            {"$set": {"rank": {"$add": [{"$ifNull": [{"$arrayElemAt": ["$ahead.count", 0]}, 0]}, 1]}}},
+            {"$unset": "ahead"},
+            {"$sort": {"total_score": -1, "subject": 1}}
+        ]
+        return [SubjectStanding(**doc) async for doc in self.user_scores.aggregate(pipeline)]
+    
     async def get_leaderboard(self, subject: Optional[str] = None, limit: int = 10) -> List[Dict[str, Any]]:
         """Get leaderboard"""
         pipeline = [
@@ -284,25 +1098,393 @@ class Database:
             {"$limit": limit}
         ]
         
-        cursor = self.user_scores.aggregate(pipeline)
+        cursor = self.reader(self.user_scores, "get_leaderboard").aggregate(pipeline)
         leaderboard = []
         async for doc in cursor:
             leaderboard.append(doc)
         return leaderboard
     
-    async def get_stats(self) -> Dict[str, Any]:
-        """Get platform statistics"""
-        total_users = await self.users.count_documents({"is_active": True})
-        total_questions = await self.questions.count_documents({"is_active": True})
-        total_competitions = await self.competitions.count_documents({"is_active": True})
+    async def get_rating_leaderboard(self, subject: str, limit: int = 10) -> List[Dict[str, Any]]:
+        """Get the highest rated users in a subject who have answered enough questions to be rated"""
+        pipeline = [
+            {"$match": {"subject": subject, "rating": {"$exists": True}, "questions_answered": {"$gte": MIN_RATED_ANSWERS}}},
+            {"$sort": {"rating": -1}},
+            {"$limit": limit},
+            {
+                "$lookup": {
+                    "from": "users",
+                    "localField": "user_id",
+                    "foreignField": "id",
+                    "pipeline": [{"$project": {"_id": 0, "name": 1}}],
+                    "as": "user"
+                }
+            },
+            {"$unwind": "$user"},
+            {
+                "$project": {
+                    "_id": 0,
+                    "user_id": 1,
+                    "user_name": "$user.name",
+                    "rating": {"$round": ["$rating", 0]},
+                    "questions_answered": 1,
+                    "correct_answers": 1
+                }
+            }
+        ]
+        cursor = self.reader(self.user_scores, "get_rating_leaderboard").aggregate(pipeline)
+        return [doc async for doc in cursor]
+    
+    async def iter_rating_answers(self) -> AsyncIterator[Dict[str, Any]]:
+        """Iterate the answer log, archived answers included, oldest first with the fields needed to replay ratings"""
+        projection = {"_id": 0, "user_id": 1, "question_id": 1, "subject": 1, "is_correct": 1}
+        async for doc in self.iter_answer_log(projection, [("created_at", ASCENDING)]):
+            yield doc
+    
+    async def set_user_ratings(self, ratings: Dict[Tuple[str, str], float], batch_size: int = 1000) -> int:
+        """Overwrite user ratings keyed by (user_id, subject), returning how many were written"""
+        written = 0
+        items = list(ratings.items())
+        for start in range(0, len(items), batch_size):
+            result = await self.user_scores.bulk_write([
+                UpdateOne({"user_id": user_id, "subject": subject}, {"$set": {"rating": rating}, "$unset": {"rating_change": ""}})
+                for (user_id, subject), rating in items[start:start + batch_size]
+            ], ordered=False)
+            written += result.matched_count
+        return written
+    
+    async def set_question_ratings(self, ratings: Dict[str, float], batch_size: int = 1000) -> int:
+        """Overwrite question ratings, resetting questions with no answers, returning how many were written"""
+        written = 0
+        items = list(ratings.items())
+        for start in range(0, len(items), batch_size):
+            result = await self.questions.bulk_write([
+                UpdateOne({"id": question_id}, {"$set": {"rating": rating}})
+                for question_id, rating in items[start:start + batch_size]
+            ], ordered=False)
+            written += result.matched_count
+        await self.questions.update_many({"id": {"$nin": list(ratings)}}, {"$set": {"rating": INITIAL_RATING}})
+        return written
+    
+    def iter_score_export(self, subject: Optional[str] = None, batch_size: int = 5000) -> AsyncIterator[List[Dict[str, Any]]]:
+        """Iterate user scores joined with user names, ranked within each subject, in batches"""
+        pipeline = [
+            {"$match": {"subject": subject} if subject else {}},
+            {
+                "$setWindowFields": {
+                    "partitionBy": "$subject",
+                    "sortBy": {"total_score": -1},
+                    "output": {"rank": {"$rank": {}}}
+                }
+            },
+            {"$sort": {"subject": 1, "rank": 1}},
+            {
+                "$lookup": {
+                    "from": "users",
+                    "localField": "user_id",
+                    "foreignField": "id",
+                    "pipeline": [{"$project": {"_id": 0, "name": 1, "email": 1}}],
+                    "as": "user"
+                }
+            },
+            {
+                "$project": {
+                    "_id": 0,
+                    "subject": 1,
+                    "rank": 1,
+                    "user_id": 1,
+                    "user_name": {"$arrayElemAt": ["$user.name", 0]},
+                    "email": {"$arrayElemAt": ["$user.email", 0]},
+                    "total_score": 1,
+                    "questions_answered": 1,
+                    "correct_answers": 1,
+                    "updated_at": 1
+                }
+            }
+        ]
+        cursor = self.reader(self.user_scores, "iter_score_export").aggregate(pipeline, allowDiskUse=True, batchSize=batch_size)
+        return iter_batches(cursor, batch_size)
+    
+    async def iter_competition_results(self, competition_id: str, batch_size: int = 5000) -> AsyncIterator[List[Dict[str, Any]]]:
+        """Iterate a competition's standings in batches, from its finalized results or else live from its answers"""
+        competition = await self.competitions.find_one({"id": competition_id}, {"results_finalized_at": 1})
+        if competition and competition.get("results_finalized_at"):
+            cursor = self.reader(self.competition_results, "iter_competition_results").find(
+                {"competition_id": competition_id},
+                {"_id": 0, "competition_id": 0, "finalized_at": 0}
+            ).sort([("rank", ASCENDING), ("user_id", ASCENDING)]).batch_size(batch_size)
+        else:
+            cursor = self.reader(self.user_answers, "iter_competition_results").aggregate(
+                competition_standings_pipeline(competition_id),
+                allowDiskUse=True,
+                batchSize=batch_size
+            )
+        async for batch in iter_batches(cursor, batch_size):
+            yield batch
+    
+    async def finalize_competition_results(self, competition_id: str, ended_at: datetime) -> int:
+        """Rank a competition's answers up to its end into competition_results, returning the participant count"""
+        finalized_at = datetime.utcnow()
+        pipeline = competition_standings_pipeline(competition_id, ended_at) + [
+            {"$set": {"competition_id": competition_id, "finalized_at": finalized_at}},
+            {
+                "$merge": {
+                    "into": "competition_results",
+                    "on": ["competition_id", "user_id"],
+                    "whenMatched": "replace",
+                    "whenNotMatched": "insert"
+                }
+            }
+        ]
+        await self.user_answers.aggregate(pipeline, allowDiskUse=True).to_list(None)
+        
+        # Drop rows from an earlier finalization for users whose answers have since been removed
+        await self.competition_results.delete_many({"competition_id": competition_id, "finalized_at": {"$ne": finalized_at}})
+        participants = await self.competition_results.count_documents({"competition_id": competition_id})
+        await self.competitions.update_one(
+            {"id": competition_id},
+            {"$set": {"results_finalized_at": finalized_at, "participant_count": participants}}
+        )
+        return participants
+    
+    async def get_competition_results(self, competition_id: str, limit: int = 100, skip: int = 0) -> List[CompetitionLeaderboard]:
+        """Get a competition's finalized standings by rank"""
+        cursor = self.reader(self.competition_results, "get_competition_results").find(
+            {"competition_id": competition_id}
+        ).sort([("rank", ASCENDING), ("user_id", ASCENDING)]).skip(skip).limit(limit)
+        return [CompetitionLeaderboard(**doc) async for doc in cursor]
+    
+    async def get_user_achievements(self, user_id: str, limit: int = 20) -> List[Achievement]:
+        """Get the user's public achievements, most recently earned first"""
+        cursor = self.achievements.find({"user_id": user_id, "is_public": True}).sort("date_earned", DESCENDING).limit(limit)
+        return [Achievement(**doc) async for doc in cursor]
+    
+    async def update_achievement_progress(self, user_id: str, day: str, answers: int, correct: Dict[str, int]) -> Dict[str, Any]:
+        """Add a day's answers and correct answers per subject to the user's streak and counters, returning the progress"""
+        # Every expression in the stage sees the document as it was before the update
+        pipeline = [
+            {
+                "$set": {
+                    "streak": {
+                        "$switch": {
+                            "branches": [
+                                {"case": {"$gte": ["$last_day", day]}, "then": "$streak"},
+                                {"case": {"$eq": ["$last_day", previous_day(day)]}, "then": {"$add": ["$streak", 1]}}
+                            ],
+                            "default": 1
+                        }
+                    },
+                    "last_day": {"$max": ["$last_day", day]},
+                    "answers": {"$add": [{"$ifNull": ["$answers", 0]}, answers]},
+                    "correct": {"$add": [{"$ifNull": ["$correct", 0]}, sum(correct.values())]},
+                    **{
+                        f"subjects.{field_key(subject)}": {"$add": [{"$ifNull": [f"$subjects.{field_key(subject)}", 0]}, count]}
+                        for subject, count in correct.items() if count
+                    },
+                    "updated_at": datetime.utcnow()
+                }
+            }
+        ]
+        
+        async def upsert():
+            return await self.achievement_progress.find_one_and_update(
+                {"user_id": user_id},
+                pipeline,
+                projection={"_id": 0},
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+        
+        try:
+            return await upsert()
+        except DuplicateKeyError:
+            # Another worker created the document first
+            return await upsert()
+    
+    async def award_achievements(self, user_id: str, achievements: List[Dict[str, Any]]) -> List[Achievement]:
+        """Award achievements once per (user_id, rule_id) and note them in the progress, returning the new ones"""
+        if not achievements:
+            return []
+        docs = [Achievement(**{**data, "user_id": user_id}).dict() for data in achievements]
+        try:
+            result = await self.achievements.bulk_write([
+                UpdateOne({"user_id": user_id, "rule_id": doc["rule_id"]}, {"$setOnInsert": doc}, upsert=True)
+                for doc in docs
+            ], ordered=False)
+            inserted = result.upserted_ids
+        except BulkWriteError as e:
+            # Racing upserts of the same award lose with a duplicate key; the award already exists
+            if any(error["code"] != 11000 for error in e.details.get("writeErrors", [])):
+                raise
+            inserted = {upsert["index"]: upsert["_id"] for upsert in e.details.get("upserted", [])}
         
+        await self.achievement_progress.update_one(
+            {"user_id": user_id},
+            {"$addToSet": {"awarded": {"$each": [doc["rule_id"] for doc in docs]}}}
+        )
+        return [Achievement(**docs[index]) for index in sorted(inserted)]
+
+    def iter_achievement_counters(self, batch_size: int = 1000) -> AsyncIterator[List[Dict[str, Any]]]:
+        """Iterate every user's answers, correct answers per subject and answer days from the answer log, in batches"""
+        pipeline = with_archived_answers({}) + [
+            {
+                "$group": {
+                    "_id": {"user_id": "$user_id", "subject": "$subject"},
+                    "answers": {"$sum": 1},
+                    "correct": {"$sum": {"$cond": ["$is_correct", 1, 0]}},
+                    "days": {"$addToSet": {"$dateToString": {"format": "%Y-%m-%d", "date": "$created_at"}}}
+                }
+            },
+            {
+                "$group": {
+                    "_id": "$_id.user_id",
+                    "answers": {"$sum": "$answers"},
+                    "subjects": {"$push": {"subject": "$_id.subject", "correct": "$correct"}},
+                    "days": {"$push": "$days"}
+                }
+            },
+            {
+                "$project": {
+                    "_id": 0,
+                    "user_id": "$_id",
+                    "answers": 1,
+                    "subjects": 1,
+                    "days": {"$reduce": {"input": "$days", "initialValue": [], "in": {"$setUnion": ["$$value", "$$this"]}}}
+                }
+            }
+        ]
+        return iter_batches(self.user_answers.aggregate(pipeline, allowDiskUse=True), batch_size)
+
+    async def set_achievement_progress(self, progress: List[Dict[str, Any]]) -> int:
+        """Overwrite the streak and counters of users' progress documents, keeping their awards, returning how many were written"""
+        if not progress:
+            return 0
+        updated_at = datetime.utcnow()
+        result = await self.achievement_progress.bulk_write([
+            UpdateOne(
+                {"user_id": doc["user_id"]},
+                {"$set": {**{key: value for key, value in doc.items() if key != "user_id"}, "updated_at": updated_at}},
+                upsert=True
+            )
+            for doc in progress
+        ], ordered=False)
+        return result.matched_count + result.upserted_count
+
+    async def record_answer_activity(self, user_id: str, subject: str, correct: bool, at: Optional[datetime] = None):
+        """Count an answer in the hourly and daily activity buckets for its subject and overall"""
+        at = at or datetime.utcnow()
+        keys = [
+            (granularity, bucket_start(at, granularity), bucket_subject)
+            for granularity in ACTIVITY_SPANS
+            for bucket_subject in (subject, ACTIVITY_ALL_SUBJECTS)
+        ]
+        
+        # A marker per (bucket, user) makes distinct-user counting exact; markers expire with the bucket
+        markers = await self.activity_users.bulk_write([
+            UpdateOne(
+                {"_id": f"{granularity}|{bucket.isoformat()}|{bucket_subject}|{user_id}"},
+                {"$setOnInsert": {"expires_at": bucket + 2 * ACTIVITY_SPANS[granularity]}},
+                upsert=True
+            )
+            for granularity, bucket, bucket_subject in keys
+        ], ordered=False)
+        first_visits = markers.upserted_ids
+        
+        await self.activity_rollups.bulk_write([
+            UpdateOne(
+                {"granularity": granularity, "subject": bucket_subject, "bucket": bucket},
+                {"$inc": {"answers": 1, "correct": 1 if correct else 0, "distinct_users": 1 if index in first_visits else 0}},
+                upsert=True
+            )
+            for index, (granularity, bucket, bucket_subject) in enumerate(keys)
+        ], ordered=False)
+    
+    async def record_signup_activity(self, at: Optional[datetime] = None):
+        """Count a new user in the overall hourly and daily activity buckets"""
+        at = at or datetime.utcnow()
+        await self.activity_rollups.bulk_write([
+            UpdateOne(
+                {"granularity": granularity, "subject": ACTIVITY_ALL_SUBJECTS, "bucket": bucket_start(at, granularity)},
+                {"$inc": {"signups": 1}},
+                upsert=True
+            )
+            for granularity in ACTIVITY_SPANS
+        ], ordered=False)
+    
+    async def get_activity(
+        self,
+        granularity: str,
+        start: datetime,
+        end: datetime,
+        subject: str = ACTIVITY_ALL_SUBJECTS
+    ) -> List[ActivityBucket]:
+        """Get activity buckets from start to end inclusive, with empty buckets filled in"""
+        buckets = activity_bucket_range(granularity, start, end)
+        cursor = self.activity_rollups.find({
+            "granularity": granularity,
+            "subject": subject,
+            "bucket": {"$gte": buckets[0], "$lte": buckets[-1]}
+        })
+        stored = {doc["bucket"]: ActivityBucket(**doc) async for doc in cursor}
+        return [
+            stored.get(bucket) or ActivityBucket(granularity=granularity, bucket=bucket, subject=subject)
+            for bucket in buckets
+        ]
+    
+    async def merge_active_user_sketch(self, day: str, sketch: HyperLogLog):
+        """Max-merge a sketch into the stored one for a day, retrying on concurrent writers"""
+        while True:
+            doc = await self.active_user_sketches.find_one({"_id": day})
+            if not doc:
+                try:
+                    await self.active_user_sketches.insert_one({"_id": day, "registers": bytes(sketch.registers), "version": 1})
+                    return
+                except DuplicateKeyError:
+                    continue
+            
+            merged = HyperLogLog(doc["registers"]).merge(sketch)
+            result = await self.active_user_sketches.update_one(
+                {"_id": day, "version": doc["version"]},
+                {"$set": {"registers": bytes(merged.registers)}, "$inc": {"version": 1}}
+            )
+            if result.matched_count:
+                return
+    
+    async def get_active_user_sketches(self, days: List[str]) -> Dict[str, HyperLogLog]:
+        """Get the stored active-user sketches of the given days"""
         return {
-            "total_users": total_users,
-            "total_questions": total_questions,
-            "total_competitions": total_competitions,
-            "active_users": total_users  # Simplified for now
+            doc["_id"]: HyperLogLog(doc["registers"])
+            async for doc in self.active_user_sketches.find({"_id": {"$in": days}})
         }
     
+    async def count_active(self, collection: str) -> int:
+        """Count the active users, questions or competitions"""
+        return await self.db[collection].count_documents({"is_active": True})
+    
+    def watch_changes(self, pipeline: List[Dict[str, Any]], resume_after: Optional[Dict[str, Any]] = None):
+        """Open a database-wide change stream with full documents for updates"""
+        return self.db.watch(
+            pipeline,
+            full_document="updateLookup",
+            resume_after=resume_after,
+            max_await_time_ms=500
+        )
+    
+    async def get_resume_token(self, worker_id: str) -> Optional[Dict[str, Any]]:
+        """Get the last change stream resume token stored for a worker"""
+        doc = await self.change_stream_tokens.find_one({"_id": worker_id})
+        return doc.get("token") if doc else None
+    
+    async def save_resume_token(self, worker_id: str, token: Optional[Dict[str, Any]]):
+        """Store a worker's change stream resume token"""
+        await self.change_stream_tokens.update_one(
+            {"_id": worker_id},
+            {"$set": {"token": token, "updated_at": datetime.utcnow()}},
+            upsert=True
+        )
+    
     async def close(self):
         """Close database connection"""
-        self.client.close()
\ No newline at end of file
+        try:
+            await asyncio.gather(self.flush_active_users(), self.flush_question_ratings())
+        finally:
+            self.client.close()
\ No newline at end of file
@@ -0,0 +1,110 @@
+from typing import AsyncIterator, Dict, List, Any
+import asyncio
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# Export format -> (media type, file extension)
+EXPORT_FORMATS = {
+    "csv": ("text/csv", "csv"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+}
+
+# Column dtypes are fixed up front so every chunk produces the same CSV columns and Parquet schema
+SCORE_COLUMNS = {
+    "subject": "string",
+    "rank": "Int64",
+    "user_id": "string",
+    "user_name": "string",
+    "email": "string",
+    "total_score": "Int64",
+    "questions_answered": "Int64",
+    "correct_answers": "Int64",
+    "accuracy": "float64",
+    "updated_at": "datetime64[ns]",
+}
+
+COMPETITION_RESULT_COLUMNS = {
+    "rank": "Int64",
+    "user_id": "string",
+    "user_name": "string",
+    "email": "string",
+    "score": "Int64",
+    "questions_answered": "Int64",
+    "correct_answers": "Int64",
+    "accuracy": "float64",
+    "time_taken": "Int64",
+}
+
+class ChunkSink:
+    """Write-only file object that collects bytes until they are drained"""
+
+    def __init__(self):
+        self.parts: List[bytes] = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data) -> int:
+        self.parts.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.position
+
+    def writable(self) -> bool:
+        return True
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data = b"".join(self.parts)
+        self.parts.clear()
+        return data
+
+def to_frame(rows: List[Dict[str, Any]], columns: Dict[str, str]) -> pd.DataFrame:
+    """Build a chunk's DataFrame with the export's columns and dtypes, deriving accuracy"""
+    frame = pd.DataFrame.from_records(rows, columns=[column for column in columns if column != "accuracy"])
+    answered = frame["questions_answered"].astype("float64")
+    frame["accuracy"] = (frame["correct_answers"].astype("float64") / answered.where(answered > 0)).fillna(0.0).round(4)
+    return frame[list(columns)].astype(columns)
+
+async def export_rows(
+    batches: AsyncIterator[List[Dict[str, Any]]],
+    columns: Dict[str, str],
+    export_format: str
+) -> AsyncIterator[bytes]:
+    """Encode batches of rows as CSV or Parquet, yielding the bytes of each batch as it is ready.
+
+    Only one batch is held in memory at a time. Each Parquet batch becomes a
+    row group, and encoding runs in a worker thread so the event loop stays free.
+    """
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"Unsupported export format: {export_format}")
+
+    if export_format == "csv":
+        header = True
+        async for batch in batches:
+            frame = to_frame(batch, columns)
+            yield (await asyncio.to_thread(frame.to_csv, index=False, header=header, date_format="%Y-%m-%dT%H:%M:%SZ")).encode()
+            header = False
+        if header:
+            yield ",".join(columns).encode() + b"\n"
+        return
+
+    sink = ChunkSink()
+    schema = pa.Schema.from_pandas(to_frame([], columns), preserve_index=False)
+    writer = pq.ParquetWriter(sink, schema, compression="zstd")
+    try:
+        async for batch in batches:
+            table = pa.Table.from_pandas(to_frame(batch, columns), schema=schema, preserve_index=False)
+            await asyncio.to_thread(writer.write_table, table)
+            yield sink.drain()
+    finally:
+        writer.close()
+    yield sink.drain()
@@ -0,0 +1,81 @@
+from hashlib import blake2b
+from io import BytesIO
+from typing import Dict, Optional, Tuple
+import asyncio
+import base64
+import binascii
+import logging
+
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from storage import Storage
+
+logger = logging.getLogger(__name__)
+
+# Variant name -> bounding box; aspect ratio is preserved
+VARIANT_SIZES = {
+    "thumbnail": (128, 128),
+    "medium": (480, 480),
+}
+VARIANT_FORMAT = "WEBP"
+VARIANT_CONTENT_TYPE = "image/webp"
+VARIANT_QUALITY = 80
+
+IMAGE_OWNERS = ("panelists", "admin_members")
+
+def decode_image(image: str) -> bytes:
+    """Decode a base64 image, with or without a data: URI prefix"""
+    if image.startswith("data:"):
+        image = image.partition(",")[2]
+    try:
+        return base64.b64decode(image, validate=True)
+    except (binascii.Error, ValueError):
+        raise ValueError("Image is not valid base64")
+
+def render_variants(image: str) -> Dict[str, Tuple[bytes, str]]:
+    """Resize a base64 image into every variant, returning name -> (bytes, version).
+
+    CPU bound; call through render_image_variants from async code.
+    """
+    try:
+        source = Image.open(BytesIO(decode_image(image)))
+        # Decoding is lazy; force it here so truncated data fails inside the try
+        source.load()
+        source = ImageOps.exif_transpose(source)
+        if source.mode not in ("RGB", "RGBA"):
+            source = source.convert("RGBA" if "transparency" in source.info or source.mode in ("LA", "PA") else "RGB")
+    except Image.DecompressionBombError:
+        raise ValueError("Image is too large")
+    except (UnidentifiedImageError, OSError):
+        raise ValueError("Image could not be read")
+
+    variants = {}
+    for name, size in VARIANT_SIZES.items():
+        resized = source.copy()
+        resized.thumbnail(size, Image.LANCZOS)
+        output = BytesIO()
+        resized.save(output, VARIANT_FORMAT, quality=VARIANT_QUALITY, method=4)
+        data = output.getvalue()
+        variants[name] = (data, blake2b(data, digest_size=8).hexdigest())
+    return variants
+
+async def render_image_variants(image: Optional[str]) -> Dict[str, Tuple[bytes, str]]:
+    """Render variants in a worker thread so resizing never blocks the event loop"""
+    if not image:
+        return {}
+    return await asyncio.to_thread(render_variants, image)
+
+async def backfill_image_variants(db: Storage, force: bool = False) -> Dict[str, int]:
+    """Generate variants for every member image that has none yet, or for all images with force"""
+    generated = {}
+    for owner in IMAGE_OWNERS:
+        generated[owner] = 0
+        async for doc in db.iter_owner_images(owner, missing_only=not force):
+            try:
+                variants = await render_image_variants(doc["image"])
+            except ValueError as e:
+                logger.warning(f"Skipping image of {owner} {doc['id']}: {e}")
+                continue
+            await db.set_image_variants(owner, doc["id"], variants, VARIANT_CONTENT_TYPE)
+            generated[owner] += 1
+    return generated
@@ -0,0 +1,130 @@
+from typing import Any, Callable, Dict, List, Optional
+import asyncio
+import logging
+import time
+
+from pymongo.errors import OperationFailure, PyMongoError
+
+from storage import Storage
+
+logger = logging.getLogger(__name__)
+
+CHANGE_STREAM_UNSUPPORTED = 40573  # Not running as a replica set
+CHANGE_STREAM_HISTORY_LOST = 286  # Resume token fell off the oplog
+TOKEN_SAVE_SECONDS = 1.0
+RETRY_SECONDS = 5.0
+
+# Top-level fields whose updates never affect cached data, per collection
+IGNORED_FIELDS = {
+    "questions": ["stats", "calibration", "rating"],
+    "users": ["last_login"],
+}
+
+# Append-only logs whose subscribers only need new documents; inserts carry them without a lookup,
+# and archiving and backfills of these collections must not fan out to every worker
+INSERT_ONLY = ["user_answers"]
+
+Handler = Callable[[Optional[Dict[str, Any]]], None]
+
+class InvalidationBus:
+    """Tail change streams on cached collections and notify subscribers in this worker.
+
+    Every worker runs its own bus, so an edit made through any worker evicts
+    caches everywhere. The last processed resume token is stored per worker
+    so a restarted worker replays the changes it missed. Handlers receive the
+    change event, or None when changes may have been lost and every cached
+    entry should be dropped.
+    """
+
+    def __init__(self, db: Storage, worker_id: str):
+        self.db = db
+        self.worker_id = worker_id
+        self.handlers: Dict[str, List[Handler]] = {}
+
+    def subscribe(self, collection: str, handler: Handler):
+        """Call handler for every change to collection"""
+        self.handlers.setdefault(collection, []).append(handler)
+
+    def pipeline(self) -> List[Dict[str, Any]]:
+        """Build the change stream filter for subscribed collections and relevant updates"""
+        ignored_fields = {
+            "$switch": {
+                "branches": [
+                    {"case": {"$eq": ["$ns.coll", collection]}, "then": fields}
+                    for collection, fields in IGNORED_FIELDS.items()
+                ],
+                "default": []
+            }
+        }
+        relevant_fields = {
+            "$filter": {
+                "input": {"$objectToArray": {"$ifNull": ["$updateDescription.updatedFields", {}]}},
+                "cond": {"$not": [{"$in": [{"$arrayElemAt": [{"$split": ["$$this.k", "."]}, 0]}, ignored_fields]}]}
+            }
+        }
+        return [
+            {"$match": {"ns.coll": {"$in": list(self.handlers)}}},
+            {"$match": {"$or": [{"ns.coll": {"$nin": INSERT_ONLY}}, {"operationType": "insert"}]}},
+            {
+                "$match": {
+                    "$expr": {
+                        "$or": [
+                            {"$ne": ["$operationType", "update"]},
+                            {"$gt": [{"$size": relevant_fields}, 0]},
+                            {"$gt": [{"$size": {"$ifNull": ["$updateDescription.removedFields", []]}}, 0]}
+                        ]
+                    }
+                }
+            }
+        ]
+
+    def dispatch(self, collection: Optional[str], change: Optional[Dict[str, Any]]):
+        """Run the handlers for one collection, or for all collections when collection is None"""
+        for name, handlers in self.handlers.items():
+            if collection is None or name == collection:
+                for handler in handlers:
+                    try:
+                        handler(change)
+                    except Exception:
+                        logger.exception(f"Invalidation handler for {name} failed")
+
+    async def run(self):
+        """Tail changes until cancelled, resuming from the stored token and retrying on errors"""
+        if not self.db.supports_change_streams:
+            logger.info(f"{type(self.db).__name__} has no change streams; cross-worker cache invalidation is disabled")
+            return
+        while True:
+            try:
+                await self._tail()
+            except asyncio.CancelledError:
+                raise
+            except OperationFailure as e:
+                if e.code == CHANGE_STREAM_UNSUPPORTED:
+                    logger.warning("Change streams need a replica set; cross-worker cache invalidation is disabled")
+                    return
+                if e.code == CHANGE_STREAM_HISTORY_LOST:
+                    logger.warning("Stored resume token expired; dropping all cached entries")
+                    await self.db.save_resume_token(self.worker_id, None)
+                    self.dispatch(None, None)
+                    continue
+                logger.error(f"Change stream failed: {e}")
+            except PyMongoError as e:
+                logger.error(f"Change stream failed: {e}")
+            await asyncio.sleep(RETRY_SECONDS)
+
+    async def _tail(self):
+        token = await self.db.get_resume_token(self.worker_id)
+        saved_at = time.monotonic()
+        async with self.db.watch_changes(self.pipeline(), token) as stream:
+            logger.info(f"Watching {', '.join(self.handlers)} for cache invalidation")
+            while True:
+                # Returns as soon as a change arrives, or None after the server's await time
+                change = await stream.try_next()
+                if change is not None:
+                    self.dispatch(change["ns"]["coll"], change)
+
+                # Throttle token writes; idle streams still advance via post-batch tokens
+                if stream.resume_token != token and time.monotonic() - saved_at >= TOKEN_SAVE_SECONDS:
+                    token = stream.resume_token
+                    await self.db.save_resume_token(self.worker_id, token)
+                    saved_at = time.monotonic()
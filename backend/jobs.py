@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Offline maintenance jobs for the Bangladesh Olympiadians Hub database.
+
+Usage: python jobs.py <command> [options]   (python jobs.py --help lists commands)
+"""
+
+import asyncio
+import os
+from pathlib import Path
+from typing import Any, Awaitable, Callable
+
+import typer
+from dotenv import load_dotenv
+
+from database import Database
+from images import backfill_image_variants
+from archive import archive as archive_records
+from calibration import calibrate_questions
+from ratings import replay_ratings
+from exports import EXPORT_FORMATS, SCORE_COLUMNS, COMPETITION_RESULT_COLUMNS, export_rows
+from reconcile import reconcile_scores
+from achievements import backfill_achievements
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+app = typer.Typer(help="Offline maintenance jobs")
+
+def run(job: Callable[[Database], Awaitable[Any]]) -> Any:
+    """Run a job coroutine against a fresh database connection"""
+    async def main():
+        db = Database(os.environ['MONGO_URL'], os.environ['DB_NAME'])
+        try:
+            return await job(db)
+        finally:
+            await db.close()
+
+    return asyncio.run(main())
+
+@app.command()
+def rebuild_question_stats(batch_size: int = typer.Option(1000, help="Questions updated per bulk write")):
+    """Recompute per-question attempt counts, correctness and time from the answer log"""
+    updated = run(lambda db: db.rebuild_question_stats(batch_size))
+    typer.echo(f"Rebuilt statistics for {updated} questions")
+
+@app.command()
+def reconcile(
+    apply: bool = typer.Option(False, "--apply", help="Write corrections; without it only report the diff"),
+    batch_size: int = typer.Option(500, help="Users compared and corrected per batch"),
+    concurrency: int = typer.Option(4, help="Subjects reconciled in parallel"),
+    pause: float = typer.Option(0.05, help="Seconds to pause between applied batches")
+):
+    """Rebuild user_scores from the answer log and report or correct drift"""
+    reports = run(lambda db: reconcile_scores(db, apply, batch_size, concurrency, pause))
+    for report in reports:
+        typer.echo(
+            f"{report.subject}: {report.users_corrected} of {report.users_checked} users drifted, "
+            f"total score drift {report.score_drift}"
+        )
+        for sample in report.samples:
+            typer.echo(f"    {sample}")
+    if not apply:
+        typer.echo("Dry run; re-run with --apply to write corrections")
+
+@app.command("backfill-achievements")
+def backfill_achievements_command(
+    batch_size: int = typer.Option(1000, help="Users rebuilt per batch"),
+    concurrency: int = typer.Option(8, help="Users awarded in parallel")
+):
+    """Rebuild achievement progress from the answer log and award achievements the live engine missed"""
+    report = run(lambda db: backfill_achievements(db, batch_size=batch_size, concurrency=concurrency))
+    typer.echo(f"Rebuilt achievement progress for {report.users} users, awarded {report.awarded} missed achievements")
+
+@app.command()
+def generate_thumbnails(force: bool = typer.Option(False, "--force", help="Regenerate variants that already exist")):
+    """Generate thumbnail and medium variants of panelist and admin member images"""
+    generated = run(lambda db: backfill_image_variants(db, force))
+    for owner, count in generated.items():
+        typer.echo(f"{owner}: generated variants for {count} images")
+
+@app.command()
+def calibrate(
+    min_responses: int = typer.Option(30, help="First attempts a question needs before its calibration is stored"),
+    update_levels: bool = typer.Option(False, "--update-levels", help="Also relabel easy/medium/hard from the fitted difficulty"),
+    easy_below: float = typer.Option(-0.75, help="Fitted difficulty below which a question is easy"),
+    hard_above: float = typer.Option(0.75, help="Fitted difficulty above which a question is hard"),
+    batch_size: int = typer.Option(50000, help="Answers read per batch")
+):
+    """Fit per-question difficulty and discrimination (2PL IRT) from the answer log"""
+    report = run(lambda db: calibrate_questions(db, min_responses, update_levels, easy_below, hard_above, batch_size))
+    typer.echo(
+        f"Fitted {report.questions} questions from {report.answers} first attempts by {report.users} users "
+        f"in {report.iterations} iterations{'' if report.converged else ' (not converged)'}"
+    )
+    typer.echo(f"Stored {report.calibrated} calibrations, relabelled {report.relabelled} difficulty levels")
+
+@app.command("replay-ratings")
+def replay_ratings_command(batch_size: int = typer.Option(1000, help="Ratings written per bulk write")):
+    """Rebuild every user and question rating by replaying the answer log in one pass"""
+    report = run(lambda db: replay_ratings(db, batch_size))
+    typer.echo(
+        f"Replayed {report.answers} answers ({report.skipped} without a subject skipped); "
+        f"rated {report.users} user subjects and {report.questions} questions"
+    )
+
+@app.command()
+def export(
+    output: Path = typer.Argument(..., help="File to write"),
+    competition: str = typer.Option(None, help="Export this competition's results instead of user scores"),
+    subject: str = typer.Option(None, help="Only export scores for this subject"),
+    export_format: str = typer.Option("csv", "--format", help=f"One of: {', '.join(EXPORT_FORMATS)}"),
+    batch_size: int = typer.Option(5000, help="Rows read and encoded per chunk")
+):
+    """Export user scores with user names, or one competition's results, to CSV or Parquet"""
+    async def job(db: Database) -> int:
+        if competition:
+            batches, columns = db.iter_competition_results(competition, batch_size), COMPETITION_RESULT_COLUMNS
+        else:
+            batches, columns = db.iter_score_export(subject, batch_size), SCORE_COLUMNS
+        written = 0
+        with output.open("wb") as f:
+            async for chunk in export_rows(batches, columns, export_format):
+                written += f.write(chunk)
+        return written
+
+    written = run(job)
+    typer.echo(f"Wrote {written} bytes to {output}")
+
+@app.command()
+def archive(
+    answers_older_than: int = typer.Option(None, help="Also archive answers older than this many days"),
+    to_files: Path = typer.Option(None, help="Write soft-deleted documents to gzip NDJSON files in this directory instead of archive collections"),
+    batch_size: int = typer.Option(1000, help="Documents moved per batch"),
+    pause: float = typer.Option(0.05, help="Seconds to pause between batches")
+):
+    """Move soft-deleted documents and aged answers out of the hot collections"""
+    reports = run(lambda db: archive_records(db, answers_older_than, to_files, batch_size, pause))
+    for report in reports:
+        typer.echo(f"{report.collection}: archived {report.archived} documents to {report.destination}")
+
+if __name__ == "__main__":
+    app()
@@ -0,0 +1,747 @@
+from copy import deepcopy
+from datetime import datetime, timedelta
+from typing import Optional, Dict, Any, List, Tuple, AsyncIterator, Iterable
+
+from pymongo.errors import DuplicateKeyError
+
+from hll import HyperLogLog
+from ratings import INITIAL_RATING, MIN_RATED_ANSWERS, expected_score, user_k_factor
+from storage import (
+    Storage, ACTIVITY_SPANS, ACTIVITY_ALL_SUBJECTS, activity_bucket_range, bucket_start, field_key,
+    previous_day, encode_cursor, decode_cursor, with_rates
+)
+from models import User, Question, AdminQuestion, Competition, CompetitionStatus, CompetitionLeaderboard, Panelist, AdminMember, ClubInfo, UserAnswer, UserScore, SubjectStanding, UserSession, UserRollup, ActivityBucket, Achievement
+
+def batched(docs: Iterable[Dict[str, Any]], batch_size: int) -> List[List[Dict[str, Any]]]:
+    """Split documents into lists of at most batch_size"""
+    docs = list(docs)
+    return [docs[start:start + batch_size] for start in range(0, len(docs), batch_size)]
+
+def ranked(docs: List[Dict[str, Any]], key) -> List[Dict[str, Any]]:
+    """Sort documents by key and give each a rank, tied documents sharing the rank of the first, like $rank"""
+    docs = sorted(docs, key=key)
+    for position, doc in enumerate(docs):
+        tied = position and key(docs[position - 1]) == key(doc)
+        doc["rank"] = docs[position - 1]["rank"] if tied else position + 1
+    return docs
+
+class InMemoryStorage(Storage):
+    """Storage in plain dicts inside this process, for tests, load tests and profiling.
+
+    Documents are kept in the shape they have in Mongo and copied on the way
+    in and out, so callers can never mutate stored state. Nothing is
+    persisted and nothing is shared between processes, so change streams
+    are not supported and every worker sees only its own writes.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.users: Dict[str, Dict[str, Any]] = {}
+        self.sessions: Dict[str, Dict[str, Any]] = {}  # session token -> session
+        self.questions: Dict[str, Dict[str, Any]] = {}
+        self.competitions: Dict[str, Dict[str, Any]] = {}
+        self.competition_results: Dict[str, List[Dict[str, Any]]] = {}  # competition ID -> standings by rank
+        self.locks: Dict[str, Dict[str, Any]] = {}
+        self.panelists: Dict[str, Dict[str, Any]] = {}
+        self.admin_members: Dict[str, Dict[str, Any]] = {}
+        self.club_info: Dict[str, Dict[str, Any]] = {}
+        self.user_answers: List[Dict[str, Any]] = []  # In insertion order
+        self.user_scores: Dict[Tuple[str, str], Dict[str, Any]] = {}  # (user_id, subject) -> score
+        self.user_rollups: Dict[str, Dict[str, Any]] = {}
+        self.user_answered: Dict[str, Dict[int, int]] = {}  # user ID -> bitmap words
+        self.counters: Dict[str, int] = {}
+        self.activity_rollups: Dict[Tuple[str, str, datetime], Dict[str, Any]] = {}  # (granularity, subject, bucket) -> counters
+        self.activity_users: Dict[str, datetime] = {}  # (bucket, user) marker -> expiry
+        self.activity_users_pruned: Optional[datetime] = None  # Hour bucket of the last expiry sweep
+        self.active_user_sketches: Dict[str, HyperLogLog] = {}
+        self.change_stream_tokens: Dict[str, Optional[Dict[str, Any]]] = {}
+        self.image_variants: Dict[Tuple[str, str], Dict[str, Any]] = {}  # (owner_id, variant) -> variant
+        self.achievements: Dict[str, Dict[str, Any]] = {}
+        self.achievement_progress: Dict[str, Dict[str, Any]] = {}
+        self.collections = {
+            "users": self.users,
+            "questions": self.questions,
+            "competitions": self.competitions,
+            "panelists": self.panelists,
+            "admin_members": self.admin_members,
+            "club_info": self.club_info
+        }
+
+    async def create_indexes(self):
+        """Nothing to prepare; uniqueness is enforced by the dict keys"""
+
+    async def close(self):
+        """Flush buffered active users and question ratings"""
+        await self.flush_active_users()
+        await self.flush_question_ratings()
+
+    def _update(self, collection: Dict[str, Dict[str, Any]], doc_id: str, update_data: Dict[str, Any]) -> bool:
+        """Set fields on a document, returning whether any value changed"""
+        doc = collection.get(doc_id)
+        if doc is None:
+            return False
+        changed = any(field not in doc or doc[field] != value for field, value in update_data.items())
+        doc.update(deepcopy(update_data))
+        return changed
+
+    def _active(self, collection: Dict[str, Dict[str, Any]]) -> List[Dict[str, Any]]:
+        return [doc for doc in collection.values() if doc.get("is_active")]
+
+    async def get_user_by_email(self, email: str) -> Optional[User]:
+        """Get user by email"""
+        user_doc = next((doc for doc in self.users.values() if doc["email"] == email), None)
+        return User(**user_doc) if user_doc else None
+
+    async def get_user_by_id(self, user_id: str) -> Optional[User]:
+        """Get user by ID"""
+        user_doc = self.users.get(user_id)
+        return User(**user_doc) if user_doc else None
+
+    async def create_user(self, user_data: Dict[str, Any]) -> User:
+        """Create a new user"""
+        user = User(**user_data)
+        if any(doc["email"] == user.email for doc in self.users.values()):
+            raise DuplicateKeyError(f"A user with email {user.email} already exists")
+        self.users[user.id] = user.dict()
+        await self.record_signup_activity(user.created_at)
+        return user
+
+    async def login_user(self, user_data: Dict[str, Any], at: datetime, last_login_interval: timedelta) -> Tuple[User, bool]:
+        """Find or create a user by email and record the login, returning (user, created)"""
+        user_doc = next((doc for doc in self.users.values() if doc["email"] == user_data["email"]), None)
+        if user_doc is None:
+            user = User(**{**user_data, "last_login": at})
+            self.users[user.id] = user.dict()
+            return user, True
+
+        if user_doc.get("last_login") is None or user_doc["last_login"] <= at - last_login_interval:
+            user_doc["last_login"] = at
+        return User(**user_doc), False
+
+    async def create_session(self, session_data: Dict[str, Any]) -> UserSession:
+        """Create a new user session"""
+        session = UserSession(**session_data)
+        if session.session_token in self.sessions:
+            raise DuplicateKeyError("A session with this token already exists")
+        self.sessions[session.session_token] = session.dict()
+        return session
+
+    async def get_session_by_token(self, session_token: str) -> Optional[UserSession]:
+        """Get session by token"""
+        session_doc = self.sessions.get(session_token)
+        if not session_doc or not session_doc["is_active"] or session_doc["expires_at"] <= datetime.utcnow():
+            return None
+        return UserSession(**session_doc)
+
+    async def deactivate_session(self, session_token: str):
+        """Deactivate a session"""
+        if session_token in self.sessions:
+            self.sessions[session_token]["is_active"] = False
+
+    async def allocate_ordinals(self, name: str, count: int = 1) -> int:
+        """Reserve count consecutive values from a named counter and return the first"""
+        self.counters[name] = self.counters.get(name, 0) + count
+        return self.counters[name] - count + 1
+
+    async def assign_missing_question_ordinals(self) -> int:
+        """Give every question created before ordinals existed its own ordinal"""
+        missing = [doc for doc in self.questions.values() if doc.get("ordinal") is None]
+        if not missing:
+            return 0
+
+        first = await self.allocate_ordinals("question_ordinal", len(missing))
+        for offset, doc in enumerate(missing):
+            doc["ordinal"] = first + offset
+        return len(missing)
+
+    async def iter_question_index_entries(self, fields: Optional[List[str]] = None) -> AsyncIterator[Dict[str, Any]]:
+        """Iterate active questions with the fields needed by in-memory question indexes"""
+        projection = ["id", "ordinal", "subject", "difficulty", "tags", "is_active"] + list(fields or [])
+        for doc in self._active(self.questions):
+            if doc.get("ordinal") is not None:
+                yield deepcopy({field: doc[field] for field in projection if field in doc})
+
+    async def create_question(self, question_data: Dict[str, Any]) -> Question:
+        """Create a new question"""
+        question_data.setdefault("ordinal", await self.allocate_ordinals("question_ordinal"))
+        question = Question(**question_data)
+        self.questions[question.id] = question.dict()
+        return question
+
+    async def get_questions(self, subject: Optional[str] = None, limit: int = 20, skip: int = 0) -> List[Question]:
+        """Get questions with optional filtering"""
+        docs = [doc for doc in self._active(self.questions) if not subject or doc["subject"] == subject]
+        return [Question(**doc) for doc in docs[skip:skip + limit]]
+
+    async def get_admin_questions(
+        self,
+        subject: Optional[str] = None,
+        include_inactive: bool = False,
+        limit: int = 20,
+        skip: int = 0
+    ) -> List[AdminQuestion]:
+        """Get questions together with their embedded answer statistics"""
+        docs = [
+            doc for doc in self.questions.values()
+            if (include_inactive or doc.get("is_active")) and (not subject or doc["subject"] == subject)
+        ]
+        docs.sort(key=lambda doc: doc["created_at"], reverse=True)
+        return [
+            AdminQuestion(**{**doc, "stats": with_rates(dict(doc.get("stats", {})))})
+            for doc in docs[skip:skip + limit]
+        ]
+
+    async def get_subject_question_counts(self) -> Dict[str, int]:
+        """Count active questions per subject"""
+        counts: Dict[str, int] = {}
+        for doc in self._active(self.questions):
+            counts[doc["subject"]] = counts.get(doc["subject"], 0) + 1
+        return counts
+
+    async def get_question_by_id(self, question_id: str) -> Optional[Question]:
+        """Get question by ID"""
+        question_doc = self.questions.get(question_id)
+        return Question(**question_doc) if question_doc and question_doc.get("is_active") else None
+
+    async def get_public_question(self, question_id: str) -> Optional[Question]:
+        """Get question by ID for display"""
+        return await self.get_question_by_id(question_id)
+
+    async def get_questions_by_ids(self, question_ids: List[str]) -> List[Question]:
+        """Get active questions by ID, preserving the given order"""
+        questions = [self.questions.get(question_id) for question_id in question_ids]
+        return [Question(**doc) for doc in questions if doc and doc.get("is_active")]
+
+    async def update_question(self, question_id: str, update_data: Dict[str, Any]) -> bool:
+        """Update a question"""
+        return self._update(self.questions, question_id, update_data)
+
+    async def delete_question(self, question_id: str) -> bool:
+        """Soft delete a question"""
+        return self._update(self.questions, question_id, {"is_active": False})
+
+    async def update_question_stats(self, question_id: str, correct: bool, time_taken: int):
+        """Increment a question's embedded answer statistics"""
+        doc = self.questions.get(question_id)
+        if doc is None:
+            return
+        stats = doc.setdefault("stats", {})
+        stats["attempts"] = stats.get("attempts", 0) + 1
+        stats["correct"] = stats.get("correct", 0) + (1 if correct else 0)
+        stats["total_time"] = stats.get("total_time", 0) + time_taken
+
+    async def apply_question_rating_changes(self, changes: Dict[str, float]):
+        """Move question ratings by the given amounts in one batch; unrated questions start from the initial rating"""
+        for question_id, rating_change in changes.items():
+            doc = self.questions.get(question_id)
+            if doc is not None:
+                doc["rating"] = (doc["rating"] if doc.get("rating") is not None else INITIAL_RATING) + rating_change
+
+    async def create_competition(self, competition_data: Dict[str, Any]) -> Competition:
+        """Create a new competition"""
+        competition = Competition(**competition_data, total_questions=len(competition_data.get("questions", [])))
+        self.competitions[competition.id] = competition.dict()
+        return competition
+
+    async def get_competition(self, competition_id: str) -> Optional[Competition]:
+        """Get an active competition by ID"""
+        doc = self.competitions.get(competition_id)
+        return Competition(**doc) if doc and doc.get("is_active") else None
+
+    async def get_competitions(self, status: Optional[str] = None, limit: int = 20, skip: int = 0) -> List[Competition]:
+        """Get active competitions, soonest first, optionally by status"""
+        docs = [doc for doc in self._active(self.competitions) if not status or doc["status"] == status]
+        docs.sort(key=lambda doc: doc["start_date"])
+        return [Competition(**doc) for doc in docs[skip:skip + limit]]
+
+    async def get_scheduled_competitions(self) -> List[Competition]:
+        """Get competitions that still have a status change or finalization ahead of them"""
+        pending = (CompetitionStatus.UPCOMING.value, CompetitionStatus.LIVE.value)
+        return [
+            Competition(**doc) for doc in self._active(self.competitions)
+            if doc["status"] in pending
+            or (doc["status"] == CompetitionStatus.COMPLETED.value and doc.get("results_finalized_at") is None)
+        ]
+
+    async def set_competition_status(self, competition_id: str, from_statuses: List[str], status: str) -> bool:
+        """Move a competition to status only if it is still in one of from_statuses"""
+        doc = self.competitions.get(competition_id)
+        if doc is None or doc["status"] not in from_statuses:
+            return False
+        doc.update({"status": status, "status_changed_at": datetime.utcnow()})
+        return True
+
+    async def get_answer_key(self, question_ids: List[str]) -> Dict[str, Question]:
+        """Get active questions with their answers for grading"""
+        return {question.id: question for question in await self.get_questions_by_ids(question_ids)}
+
+    def _competition_standings(self, competition_id: str, until: Optional[datetime] = None) -> List[Dict[str, Any]]:
+        """Rank a competition's answers into per-user standings by score, then total time"""
+        totals: Dict[str, Dict[str, Any]] = {}
+        for answer in self.user_answers:
+            if answer.get("competition_id") != competition_id or (until and answer["created_at"] > until):
+                continue
+            row = totals.setdefault(answer["user_id"], {"score": 0, "questions_answered": 0, "correct_answers": 0, "time_taken": 0})
+            row["score"] += answer.get("points_earned") or 0
+            row["questions_answered"] += 1
+            row["correct_answers"] += 1 if answer["is_correct"] else 0
+            row["time_taken"] += answer["time_taken"]
+
+        standings = ranked(
+            [{"user_id": user_id, **row} for user_id, row in totals.items()],
+            key=lambda row: (-row["score"], row["time_taken"])
+        )
+        standings.sort(key=lambda row: (row["rank"], row["user_id"]))
+        for row in standings:
+            user = self.users.get(row["user_id"])
+            row["user_name"] = user["name"] if user else ""
+            if user:
+                row["email"] = user["email"]
+        return standings
+
+    async def iter_competition_results(self, competition_id: str, batch_size: int = 5000) -> AsyncIterator[List[Dict[str, Any]]]:
+        """Iterate a competition's standings in batches, from its finalized results or else live from its answers"""
+        competition = self.competitions.get(competition_id)
+        if competition and competition.get("results_finalized_at"):
+            rows = [
+                {field: value for field, value in row.items() if field not in ("competition_id", "finalized_at")}
+                for row in self.competition_results.get(competition_id, [])
+            ]
+        else:
+            rows = self._competition_standings(competition_id)
+        for batch in batched(deepcopy(rows), batch_size):
+            yield batch
+
+    async def finalize_competition_results(self, competition_id: str, ended_at: datetime) -> int:
+        """Rank a competition's answers up to its end into its results, returning the participant count"""
+        finalized_at = datetime.utcnow()
+        results = self.competition_results[competition_id] = [
+            {**row, "competition_id": competition_id, "finalized_at": finalized_at}
+            for row in self._competition_standings(competition_id, ended_at)
+        ]
+        if competition_id in self.competitions:
+            self.competitions[competition_id].update({"results_finalized_at": finalized_at, "participant_count": len(results)})
+        return len(results)
+
+    async def get_competition_results(self, competition_id: str, limit: int = 100, skip: int = 0) -> List[CompetitionLeaderboard]:
+        """Get a competition's finalized standings by rank"""
+        rows = self.competition_results.get(competition_id, [])
+        return [CompetitionLeaderboard(**row) for row in rows[skip:skip + limit]]
+
+    async def acquire_lease(self, name: str, holder: str, ttl_seconds: float) -> bool:
+        """Take or renew a named lease, returning False while another holder's lease is unexpired"""
+        now = datetime.utcnow()
+        lease = self.locks.get(name)
+        if lease and lease["holder"] != holder and lease["expires_at"] >= now:
+            return False
+        self.locks[name] = {"holder": holder, "expires_at": now + timedelta(seconds=ttl_seconds)}
+        return True
+
+    async def release_lease(self, name: str, holder: str):
+        """Give up a lease if holder still has it"""
+        if self.locks.get(name, {}).get("holder") == holder:
+            del self.locks[name]
+
+    async def create_panelist(self, panelist_data: Dict[str, Any]) -> Panelist:
+        """Create a new panelist"""
+        panelist = Panelist(**panelist_data)
+        self.panelists[panelist.id] = panelist.dict()
+        return panelist
+
+    async def get_panelists(self) -> List[Panelist]:
+        """Get all active panelists"""
+        return [
+            Panelist(**{field: value for field, value in doc.items() if field != "image"})
+            for doc in self._active(self.panelists)
+        ]
+
+    async def update_panelist(self, panelist_id: str, update_data: Dict[str, Any]) -> bool:
+        """Update a panelist"""
+        return self._update(self.panelists, panelist_id, update_data)
+
+    async def delete_panelist(self, panelist_id: str) -> bool:
+        """Soft delete a panelist"""
+        return self._update(self.panelists, panelist_id, {"is_active": False})
+
+    async def create_admin_member(self, admin_data: Dict[str, Any]) -> AdminMember:
+        """Create a new admin member"""
+        admin = AdminMember(**admin_data)
+        self.admin_members[admin.id] = admin.dict()
+        return admin
+
+    async def get_admin_members(self) -> List[AdminMember]:
+        """Get all active admin members"""
+        return [
+            AdminMember(**{field: value for field, value in doc.items() if field != "image"})
+            for doc in self._active(self.admin_members)
+        ]
+
+    async def set_image_variants(
+        self,
+        owner_collection: str,
+        owner_id: str,
+        variants: Dict[str, Tuple[bytes, str]],
+        content_type: str
+    ) -> Dict[str, Optional[str]]:
+        """Store resized variants of an owner's image and point the owner at them"""
+        updated_at = datetime.utcnow()
+        for key in [key for key in self.image_variants if key[0] == owner_id and key[1] not in variants]:
+            del self.image_variants[key]
+        for variant, (data, version) in variants.items():
+            self.image_variants[(owner_id, variant)] = {
+                "owner_id": owner_id,
+                "variant": variant,
+                "content_type": content_type,
+                "data": data,
+                "version": version,
+                "updated_at": updated_at
+            }
+
+        urls = {
+            f"{variant}_url": f"/api/images/{owner_id}/{variant}?v={version}"
+            for variant, (_, version) in variants.items()
+        }
+        owner = self.collections[owner_collection].get(owner_id)
+        if owner is not None:
+            if urls:
+                owner.update(urls)
+            else:
+                owner.pop("thumbnail_url", None)
+                owner.pop("medium_url", None)
+        return urls
+
+    async def get_image_variant(self, owner_id: str, variant: str) -> Optional[Dict[str, Any]]:
+        """Get a stored image variant with its content type, data and version"""
+        doc = self.image_variants.get((owner_id, variant))
+        return dict(doc) if doc else None
+
+    async def iter_owner_images(self, owner_collection: str, missing_only: bool = True) -> AsyncIterator[Dict[str, Any]]:
+        """Iterate id and image of owners with an image, optionally only those without variants"""
+        for doc in list(self.collections[owner_collection].values()):
+            if doc.get("image") and not (missing_only and "thumbnail_url" in doc):
+                yield {"id": doc["id"], "image": doc["image"]}
+
+    async def create_club_info(self, club_data: Dict[str, Any]) -> ClubInfo:
+        """Create club information"""
+        club_info = ClubInfo(**club_data)
+        self.club_info[club_info.id] = club_info.dict()
+        return club_info
+
+    async def get_club_info(self, section: Optional[str] = None) -> List[ClubInfo]:
+        """Get club information by section"""
+        docs = [doc for doc in self._active(self.club_info) if not section or doc["section"] == section]
+        docs.sort(key=lambda doc: doc["order"])
+        return [ClubInfo(**doc) for doc in docs]
+
+    async def update_club_info(self, info_id: str, update_data: Dict[str, Any]) -> bool:
+        """Update club information"""
+        return self._update(self.club_info, info_id, update_data)
+
+    async def save_user_answer(self, answer_data: Dict[str, Any]) -> UserAnswer:
+        """Save user answer"""
+        answer = UserAnswer(**answer_data)
+        self.user_answers.append(answer.dict())
+        return answer
+
+    async def get_user_answers(self, user_id: str, question_id: Optional[str] = None) -> List[UserAnswer]:
+        """Get user answers"""
+        docs = [
+            doc for doc in self.user_answers
+            if doc["user_id"] == user_id and (not question_id or doc["question_id"] == question_id)
+        ]
+        docs.sort(key=lambda doc: doc["created_at"], reverse=True)
+        return [UserAnswer(**doc) for doc in docs]
+
+    async def get_user_answer_history(
+        self,
+        user_id: str,
+        subject: Optional[str] = None,
+        competition_id: Optional[str] = None,
+        limit: int = 20,
+        cursor: Optional[str] = None
+    ) -> Tuple[List[UserAnswer], Optional[str]]:
+        """Get a page of user answers, newest first, with a keyset cursor for the next page"""
+        after = decode_cursor(cursor) if cursor else None
+        docs = [
+            doc for doc in self.user_answers
+            if doc["user_id"] == user_id
+            and (not subject or doc.get("subject") == subject)
+            and (not competition_id or doc.get("competition_id") == competition_id)
+            and (not after or (doc["created_at"], doc["id"]) < after)
+        ]
+        docs.sort(key=lambda doc: (doc["created_at"], doc["id"]), reverse=True)
+        answers = [UserAnswer(**doc) for doc in docs[:limit]]
+
+        next_cursor = None
+        if len(docs) > limit:
+            next_cursor = encode_cursor(answers[-1].created_at, answers[-1].id)
+        return answers, next_cursor
+
+    async def update_user_rollup(self, user_id: str, subject: str, difficulty: str, correct: bool, time_taken: int):
+        """Increment the user's overall, per-subject and per-difficulty answer counters"""
+        doc = self.user_rollups.setdefault(user_id, {"user_id": user_id})
+        subject_counters = doc.setdefault("subjects", {}).setdefault(field_key(subject), {})
+        for counters in (
+            doc.setdefault("overall", {}),
+            subject_counters,
+            subject_counters.setdefault("difficulties", {}).setdefault(field_key(difficulty), {})
+        ):
+            counters["attempts"] = counters.get("attempts", 0) + 1
+            counters["correct"] = counters.get("correct", 0) + (1 if correct else 0)
+            counters["total_time"] = counters.get("total_time", 0) + time_taken
+        doc["updated_at"] = datetime.utcnow()
+
+    async def get_user_rollup(self, user_id: str) -> UserRollup:
+        """Get the user's answer rollup with accuracy and average time filled in"""
+        doc = deepcopy(self.user_rollups.get(user_id))
+        if not doc:
+            return UserRollup(user_id=user_id)
+
+        subjects = {}
+        for name, subject in doc.get("subjects", {}).items():
+            difficulties = {level: with_rates(counters) for level, counters in subject.get("difficulties", {}).items()}
+            subjects[name] = {**with_rates(subject), "difficulties": difficulties}
+        return UserRollup(
+            user_id=user_id,
+            overall=with_rates(doc.get("overall", {})),
+            subjects=subjects,
+            updated_at=doc.get("updated_at")
+        )
+
+    async def get_answered_words(self, user_id: str) -> Optional[Dict[int, int]]:
+        """Get the user's answered-question bitmap as {word index: word}, or None if never built"""
+        words = self.user_answered.get(user_id)
+        return dict(words) if words is not None else None
+
+    async def set_answered_bits(self, user_id: str, words: Dict[int, int], create: bool = True):
+        """OR the given words into the user's answered-question bitmap"""
+        if user_id not in self.user_answered:
+            if not create:
+                return
+            self.user_answered[user_id] = {}
+        stored = self.user_answered[user_id]
+        for index, word in words.items():
+            stored[index] = stored.get(index, 0) | word
+
+    async def get_answered_question_ids(self, user_id: str) -> List[str]:
+        """Get the distinct IDs of every question the user has answered"""
+        return list(dict.fromkeys(doc["question_id"] for doc in self.user_answers if doc["user_id"] == user_id))
+
+    async def update_user_score(
+        self,
+        user_id: str,
+        subject: str,
+        score_delta: int,
+        correct: bool,
+        question_rating: float = INITIAL_RATING
+    ) -> Dict[str, Any]:
+        """Update user score and subject rating in one write, returning the updated document"""
+        doc = self.user_scores.setdefault((user_id, subject), {"user_id": user_id, "subject": subject})
+        rating = doc["rating"] if doc.get("rating") is not None else INITIAL_RATING
+        questions_answered = doc.get("questions_answered", 0)
+        rating_change = user_k_factor(questions_answered) * ((1 if correct else 0) - expected_score(rating, question_rating))
+        doc.update({
+            "total_score": doc.get("total_score", 0) + score_delta,
+            "questions_answered": questions_answered + 1,
+            "correct_answers": doc.get("correct_answers", 0) + (1 if correct else 0),
+            "rating_change": rating_change,
+            "rating": rating + rating_change,
+            "updated_at": datetime.utcnow()
+        })
+        return {field: doc[field] for field in ("rating", "rating_change", "questions_answered")}
+
+    async def get_user_score(self, user_id: str, subject: Optional[str] = None) -> List[UserScore]:
+        """Get user scores"""
+        return [
+            UserScore(**doc) for (score_user_id, score_subject), doc in self.user_scores.items()
+            if score_user_id == user_id and (not subject or score_subject == subject)
+        ]
+
+    async def get_user_standings(self, user_id: str) -> List[SubjectStanding]:
+        """Get the user's scores with their rank by total score in each subject"""
+        standings = [
+            SubjectStanding(
+                **doc,
+                rank=1 + sum(
+                    1 for other in self.user_scores.values()
+                    if other["subject"] == doc["subject"] and other.get("total_score", 0) > doc.get("total_score", 0)
+                )
+            )
+            for doc in self.user_scores.values() if doc["user_id"] == user_id
+        ]
+        standings.sort(key=lambda standing: (-standing.total_score, standing.subject))
+        return standings
+
+    async def get_leaderboard(self, subject: Optional[str] = None, limit: int = 10) -> List[Dict[str, Any]]:
+        """Get leaderboard"""
+        rows = [
+            {
+                "user_id": doc["user_id"],
+                "user_name": self.users[doc["user_id"]]["name"],
+                "total_score": doc.get("total_score", 0),
+                "questions_answered": doc.get("questions_answered", 0),
+                "correct_answers": doc.get("correct_answers", 0)
+            }
+            for doc in self.user_scores.values()
+            if (not subject or doc["subject"] == subject) and doc["user_id"] in self.users
+        ]
+        rows.sort(key=lambda row: row["total_score"], reverse=True)
+        return rows[:limit]
+
+    async def get_rating_leaderboard(self, subject: str, limit: int = 10) -> List[Dict[str, Any]]:
+        """Get the highest rated users in a subject who have answered enough questions to be rated"""
+        rated = [
+            doc for doc in self.user_scores.values()
+            if doc["subject"] == subject and doc.get("rating") is not None and doc.get("questions_answered", 0) >= MIN_RATED_ANSWERS
+        ]
+        rated.sort(key=lambda doc: doc["rating"], reverse=True)
+        return [
+            {
+                "user_id": doc["user_id"],
+                "user_name": self.users[doc["user_id"]]["name"],
+                "rating": round(doc["rating"], 0),
+                "questions_answered": doc["questions_answered"],
+                "correct_answers": doc.get("correct_answers", 0)
+            }
+            for doc in rated[:limit] if doc["user_id"] in self.users
+        ]
+
+    async def iter_score_export(self, subject: Optional[str] = None, batch_size: int = 5000) -> AsyncIterator[List[Dict[str, Any]]]:
+        """Iterate user scores joined with user names, ranked within each subject, in batches"""
+        by_subject: Dict[str, List[Dict[str, Any]]] = {}
+        for doc in self.user_scores.values():
+            if not subject or doc["subject"] == subject:
+                by_subject.setdefault(doc["subject"], []).append(deepcopy(doc))
+
+        rows = []
+        for name in sorted(by_subject):
+            for doc in ranked(by_subject[name], key=lambda doc: -doc.get("total_score", 0)):
+                row = {
+                    field: doc[field]
+                    for field in ("subject", "rank", "user_id", "total_score", "questions_answered", "correct_answers", "updated_at")
+                    if field in doc
+                }
+                user = self.users.get(doc["user_id"])
+                if user:
+                    row.update({"user_name": user["name"], "email": user["email"]})
+                rows.append(row)
+        for batch in batched(rows, batch_size):
+            yield batch
+
+    async def get_user_achievements(self, user_id: str, limit: int = 20) -> List[Achievement]:
+        """Get the user's public achievements, most recently earned first"""
+        earned = [doc for doc in self.achievements.values() if doc["user_id"] == user_id and doc.get("is_public", True)]
+        earned.sort(key=lambda doc: doc["date_earned"], reverse=True)
+        return [Achievement(**doc) for doc in earned[:limit]]
+
+    async def update_achievement_progress(self, user_id: str, day: str, answers: int, correct: Dict[str, int]) -> Dict[str, Any]:
+        """Add a day's answers and correct answers per subject to the user's streak and counters, returning the progress"""
+        doc = self.achievement_progress.setdefault(user_id, {"user_id": user_id})
+        last_day = doc.get("last_day")
+        if last_day is None or last_day < day:
+            doc["streak"] = doc["streak"] + 1 if last_day == previous_day(day) else 1
+            doc["last_day"] = day
+        doc["answers"] = doc.get("answers", 0) + answers
+        doc["correct"] = doc.get("correct", 0) + sum(correct.values())
+        subjects = doc.setdefault("subjects", {})
+        for subject, count in correct.items():
+            if count:
+                subjects[field_key(subject)] = subjects.get(field_key(subject), 0) + count
+        doc["updated_at"] = datetime.utcnow()
+        return deepcopy(doc)
+
+    async def award_achievements(self, user_id: str, achievements: List[Dict[str, Any]]) -> List[Achievement]:
+        """Award achievements once per (user_id, rule_id) and note them in the progress, returning the new ones"""
+        awarded = {doc["rule_id"] for doc in self.achievements.values() if doc["user_id"] == user_id and doc.get("rule_id")}
+        inserted = []
+        for data in achievements:
+            achievement = Achievement(**{**data, "user_id": user_id})
+            if achievement.rule_id not in awarded:
+                self.achievements[achievement.id] = achievement.dict()
+                awarded.add(achievement.rule_id)
+                inserted.append(achievement)
+
+        progress = self.achievement_progress.setdefault(user_id, {"user_id": user_id})
+        noted = progress.setdefault("awarded", [])
+        noted.extend(data["rule_id"] for data in achievements if data["rule_id"] not in noted)
+        return inserted
+
+    async def record_answer_activity(self, user_id: str, subject: str, correct: bool, at: Optional[datetime] = None):
+        """Count an answer in the hourly and daily activity buckets for its subject and overall"""
+        at = at or datetime.utcnow()
+        self._prune_activity_users(at)
+        for granularity, span in ACTIVITY_SPANS.items():
+            bucket = bucket_start(at, granularity)
+            for bucket_subject in (subject, ACTIVITY_ALL_SUBJECTS):
+                marker = f"{granularity}|{bucket.isoformat()}|{bucket_subject}|{user_id}"
+                first_visit = marker not in self.activity_users
+                self.activity_users.setdefault(marker, bucket + 2 * span)
+
+                counters = self._activity_counters(granularity, bucket_subject, bucket)
+                counters["answers"] += 1
+                counters["correct"] += 1 if correct else 0
+                counters["distinct_users"] += 1 if first_visit else 0
+
+    def _prune_activity_users(self, at: datetime):
+        """Drop expired activity markers, like the Mongo TTL index, once per new hour bucket"""
+        hour = bucket_start(at, "hour")
+        if self.activity_users_pruned is not None and hour <= self.activity_users_pruned:
+            return
+        self.activity_users_pruned = hour
+        self.activity_users = {marker: expires_at for marker, expires_at in self.activity_users.items() if expires_at > at}
+
+    async def record_signup_activity(self, at: Optional[datetime] = None):
+        """Count a new user in the overall hourly and daily activity buckets"""
+        at = at or datetime.utcnow()
+        for granularity in ACTIVITY_SPANS:
+            self._activity_counters(granularity, ACTIVITY_ALL_SUBJECTS, bucket_start(at, granularity))["signups"] += 1
+
+    def _activity_counters(self, granularity: str, subject: str, bucket: datetime) -> Dict[str, Any]:
+        return self.activity_rollups.setdefault((granularity, subject, bucket), {
+            "granularity": granularity,
+            "subject": subject,
+            "bucket": bucket,
+            "answers": 0,
+            "correct": 0,
+            "distinct_users": 0,
+            "signups": 0
+        })
+
+    async def get_activity(
+        self,
+        granularity: str,
+        start: datetime,
+        end: datetime,
+        subject: str = ACTIVITY_ALL_SUBJECTS
+    ) -> List[ActivityBucket]:
+        """Get activity buckets from start to end inclusive, with empty buckets filled in"""
+        return [
+            ActivityBucket(**self.activity_rollups.get(
+                (granularity, subject, bucket),
+                {"granularity": granularity, "bucket": bucket, "subject": subject}
+            ))
+            for bucket in activity_bucket_range(granularity, start, end)
+        ]
+
+    async def merge_active_user_sketch(self, day: str, sketch: HyperLogLog):
+        """Max-merge a sketch into the stored one for a day"""
+        self.active_user_sketches.setdefault(day, HyperLogLog()).merge(sketch)
+
+    async def get_active_user_sketches(self, days: List[str]) -> Dict[str, HyperLogLog]:
+        """Get copies of the stored active-user sketches of the given days"""
+        return {
+            day: HyperLogLog(bytes(self.active_user_sketches[day].registers))
+            for day in days if day in self.active_user_sketches
+        }
+
+    async def count_active(self, collection: str) -> int:
+        """Count the active users, questions or competitions"""
+        return len(self._active(self.collections[collection]))
+
+    async def get_resume_token(self, worker_id: str) -> Optional[Dict[str, Any]]:
+        """Get the last change stream resume token stored for a worker"""
+        return self.change_stream_tokens.get(worker_id)
+
+    async def save_resume_token(self, worker_id: str, token: Optional[Dict[str, Any]]):
+        """Store a worker's change stream resume token"""
+        self.change_stream_tokens[worker_id] = token
@@ -60,6 +60,8 @@ class Question(BaseModel):
     created_at: datetime = Field(default_factory=datetime.utcnow)
     is_active: bool = True
     tags: List[str] = []
+    ordinal: Optional[int] = None  # Dense sequence number used by in-memory question pools
+    rating: Optional[float] = None  # Elo-style rating, moved by every answer; unrated questions start at 1500
 
 class QuestionCreate(BaseModel):
     subject: str
@@ -91,6 +93,8 @@ class Competition(BaseModel):
     created_by: str  # User ID
     created_at: datetime = Field(default_factory=datetime.utcnow)
     is_active: bool = True
+    results_finalized_at: Optional[datetime] = None
+    participant_count: Optional[int] = None
 
 class CompetitionCreate(BaseModel):
     title: str
@@ -109,7 +113,9 @@ class Panelist(BaseModel):
     title: str
     subject_expertise: List[str] = []
     bio: str
-    image: Optional[str] = None  # Base64 encoded image
+    image: Optional[str] = None  # Base64 encoded image, omitted from list responses
+    thumbnail_url: Optional[str] = None
+    medium_url: Optional[str] = None
     social_links: Dict[str, str] = {}
     achievements: List[str] = []
     created_by: str  # User ID
@@ -132,7 +138,9 @@ class AdminMember(BaseModel):
     position: str
     department: str
     bio: str
-    image: Optional[str] = None
+    image: Optional[str] = None  # Base64 encoded image, omitted from list responses
+    thumbnail_url: Optional[str] = None
+    medium_url: Optional[str] = None
     contact_info: Dict[str, str] = {}
     responsibilities: List[str] = []
     created_by: str  # User ID
@@ -176,6 +184,9 @@ class UserAnswer(BaseModel):
     is_correct: bool
     time_taken: int  # in seconds
     competition_id: Optional[str] = None
+    subject: Optional[str] = None  # Denormalized from the question for filtering
+    difficulty: Optional[str] = None
+    points_earned: Optional[int] = None  # Score credited for this answer, the source of truth for user_scores
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
 class UserScore(BaseModel):
@@ -185,8 +196,40 @@ class UserScore(BaseModel):
     total_score: int = 0
     questions_answered: int = 0
     correct_answers: int = 0
+    rating: Optional[float] = None  # Elo-style skill rating in this subject
     updated_at: datetime = Field(default_factory=datetime.utcnow)
 
+class SubjectStanding(UserScore):
+    rank: int  # 1 + users with a higher total score in the subject
+
+# User Rollup Models
+class RollupStats(BaseModel):
+    attempts: int = 0
+    correct: int = 0
+    total_time: int = 0  # in seconds
+    accuracy: float = 0.0
+    average_time: float = 0.0
+
+class SubjectRollup(RollupStats):
+    difficulties: Dict[str, RollupStats] = {}
+
+class UserRollup(BaseModel):
+    user_id: str
+    overall: RollupStats = Field(default_factory=RollupStats)
+    subjects: Dict[str, SubjectRollup] = {}
+    updated_at: Optional[datetime] = None
+
+class QuestionCalibration(BaseModel):
+    difficulty: float  # IRT difficulty on the ability scale
+    discrimination: float
+    responses: int
+    accuracy: float
+    calibrated_at: datetime
+
+class AdminQuestion(Question):
+    stats: RollupStats = Field(default_factory=RollupStats)
+    calibration: Optional[QuestionCalibration] = None
+
 # Response Models
 class LoginResponse(BaseModel):
     user: User
@@ -197,6 +240,18 @@ class QuestionResponse(BaseModel):
     question: Question
     user_answer: Optional[UserAnswer] = None
 
+class AnswerHistoryPage(BaseModel):
+    items: List[UserAnswer]
+    next_cursor: Optional[str] = None
+
+class QuestionSearchHit(BaseModel):
+    question: Question
+    score: float
+
+class QuestionSearchPage(BaseModel):
+    items: List[QuestionSearchHit]
+    next_cursor: Optional[str] = None
+
 class CompetitionLeaderboard(BaseModel):
     user_id: str
     user_name: str
@@ -204,11 +259,22 @@ class CompetitionLeaderboard(BaseModel):
     time_taken: int
     rank: int
 
+class ActivityBucket(BaseModel):
+    granularity: str  # "hour" or "day"
+    bucket: datetime  # Start of the bucket in UTC
+    subject: str  # Subject ID, or "all" for platform-wide totals
+    answers: int = 0
+    correct: int = 0
+    distinct_users: int = 0
+    signups: int = 0
+
 class StatsResponse(BaseModel):
     total_users: int
     total_questions: int
     total_competitions: int
-    active_users: int
+    active_users: int  # Distinct users active today (UTC), estimated
+    weekly_active_users: int = 0
+    monthly_active_users: int = 0
     recent_activities: List[Dict[str, Any]]
 
 # API Request Models
@@ -247,4 +313,12 @@ class Achievement(BaseModel):
     type: str  # "competition", "practice", "streak", etc.
     icon: str
     date_earned: datetime = Field(default_factory=datetime.utcnow)
-    is_public: bool = True
\ No newline at end of file
+    is_public: bool = True
+    rule_id: Optional[str] = None  # Set on awards made by the achievements engine, unique per user
+
+# Dashboard Models
+class UserDashboard(BaseModel):
+    user: User
+    scores: List[SubjectStanding] = []
+    recent_answers: List[UserAnswer] = []
+    achievements: List[Achievement] = []
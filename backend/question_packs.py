@@ -0,0 +1,64 @@
+from hashlib import blake2b
+from typing import Dict, List
+import json
+import random
+
+from models import Competition, Question
+
+# Question fields sent to participants; correct_answer and explanation never leave the server
+PACK_FIELDS = ("id", "subject", "title", "question_text", "question_image", "question_type", "difficulty", "points", "tags")
+
+def dumps(value) -> bytes:
+    """Serialize to compact UTF-8 JSON"""
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False, default=str).encode()
+
+def participant_seed(competition_id: str, user_id: str) -> int:
+    """Stable shuffle seed for one participant in one competition"""
+    return int.from_bytes(blake2b(f"{competition_id}:{user_id}".encode(), digest_size=8).digest(), "big")
+
+class QuestionPack:
+    """A competition's questions without answers, serialized once and reordered per participant.
+
+    Each question is kept as pre-encoded JSON fragments: everything but the
+    options, and each option with its original index. Rendering a
+    participant's pack only shuffles and joins bytes, so every request after
+    the first is served from memory without encoding or database reads.
+    Participants answer with an option's original index.
+    """
+
+    def __init__(self, competition: Competition, questions: Dict[str, Question]):
+        self.competition_id = competition.id
+        self.size = 0
+        self.header = dumps({
+            "competition_id": competition.id,
+            "title": competition.title,
+            "subject": competition.subject,
+            "duration_minutes": competition.duration_minutes,
+            "ends_at": competition.end_date.isoformat()
+        })[:-1]  # Left open so the questions can be appended
+        self.heads: List[bytes] = []
+        self.options: List[List[bytes]] = []
+        for question_id in competition.questions:
+            question = questions.get(question_id)
+            if not question:
+                continue
+            data = question.dict(include=set(PACK_FIELDS))
+            self.heads.append(dumps({field: data[field] for field in PACK_FIELDS})[:-1])
+            self.options.append([dumps({"index": index, "text": text}) for index, text in enumerate(question.options)])
+            self.size += len(self.heads[-1]) + sum(len(option) for option in self.options[-1])
+
+    def render(self, user_id: str) -> bytes:
+        """Build one participant's pack with their own question and option order"""
+        rng = random.Random(participant_seed(self.competition_id, user_id))
+        order = list(range(len(self.heads)))
+        rng.shuffle(order)
+
+        parts = [self.header, b',"questions":[']
+        for position, index in enumerate(order):
+            options = self.options[index][:]
+            rng.shuffle(options)
+            if position:
+                parts.append(b",")
+            parts += [self.heads[index], b',"options":[', b",".join(options), b"]}"]
+        parts.append(b"]}")
+        return b"".join(parts)
@@ -0,0 +1,137 @@
+from bisect import bisect_left, bisect_right, insort
+from itertools import accumulate
+from typing import Optional, Dict, Any, List, Tuple, Set
+import itertools
+import logging
+import random
+
+from storage import Storage
+
+logger = logging.getLogger(__name__)
+
+class QuestionPool:
+    """In-memory index of active questions keyed by their dense ordinals.
+
+    Ordinals are grouped into sorted pools per (subject, difficulty) so that
+    practice and quiz endpoints can pick questions without querying Mongo.
+    """
+
+    def __init__(self):
+        self.changes = itertools.count(1)  # Never reset, so pool versions stay unique across reloads
+        self.clear()
+
+    def clear(self):
+        """Forget every question"""
+        self.ids: Dict[int, str] = {}  # ordinal -> question ID
+        self.ordinals: Dict[str, int] = {}  # question ID -> ordinal
+        self.entries: Dict[int, Tuple[str, str]] = {}  # ordinal -> (subject, difficulty)
+        self.pools: Dict[Tuple[str, str], List[int]] = {}
+        self.versions: Dict[Tuple[str, str], int] = {}  # Bumped whenever a pool changes
+        self.masks: Dict[Tuple[str, str], Tuple[int, int]] = {}  # pool -> (version, bitmask of its ordinals)
+        self.tags: Dict[int, List[str]] = {}  # ordinal -> tags
+        self.tagged: Dict[str, Set[int]] = {}  # tag -> ordinals
+        self.max_ordinal = 0
+
+    async def load(self, db: Storage):
+        """Rebuild the pool from the questions collection"""
+        await db.assign_missing_question_ordinals()
+        self.clear()
+        async for entry in db.iter_question_index_entries():
+            self.add(entry)
+        logger.info(f"Question pool loaded with {len(self.ids)} active questions")
+
+    def add(self, question: Dict[str, Any]):
+        """Insert or refresh a question; inactive questions are removed"""
+        self.remove(question["id"])
+        ordinal = question.get("ordinal")
+        if ordinal is None or not question.get("is_active", True):
+            return
+
+        difficulty = question["difficulty"]
+        key = (question["subject"], getattr(difficulty, "value", difficulty))
+        self.ids[ordinal] = question["id"]
+        self.ordinals[question["id"]] = ordinal
+        self.entries[ordinal] = key
+        insort(self.pools.setdefault(key, []), ordinal)
+        self.versions[key] = next(self.changes)
+        self.tags[ordinal] = list(question.get("tags") or [])
+        for tag in self.tags[ordinal]:
+            self.tagged.setdefault(tag, set()).add(ordinal)
+        self.max_ordinal = max(self.max_ordinal, ordinal)
+
+    def remove(self, question_id: str):
+        """Drop a question from the pool if present"""
+        ordinal = self.ordinals.pop(question_id, None)
+        if ordinal is None:
+            return
+
+        key = self.entries.pop(ordinal)
+        del self.ids[ordinal]
+        pool = self.pools[key]
+        del pool[bisect_left(pool, ordinal)]
+        self.versions[key] = next(self.changes)
+        for tag in self.tags.pop(ordinal):
+            self.tagged[tag].discard(ordinal)
+            if not self.tagged[tag]:
+                del self.tagged[tag]
+
+    def pool(self, subject: str, difficulty: str) -> List[int]:
+        """Get the sorted ordinals of active questions for a subject and difficulty"""
+        return self.pools.get((subject, difficulty), [])
+
+    def version(self, subject: str, difficulty: str) -> int:
+        """Get a counter that changes whenever the pool for a subject and difficulty changes"""
+        return self.versions.get((subject, difficulty), 0)
+
+    def mask(self, subject: str, difficulty: str) -> int:
+        """Get the pool's ordinals as a bitmask, rebuilt only after the pool changes"""
+        key = (subject, difficulty)
+        version = self.version(subject, difficulty)
+        cached = self.masks.get(key)
+        if cached and cached[0] == version:
+            return cached[1]
+
+        bits = bytearray(self.max_ordinal // 8 + 1)
+        for ordinal in self.pool(subject, difficulty):
+            bits[ordinal // 8] |= 1 << (ordinal % 8)
+        mask = int.from_bytes(bits, "little")
+        self.masks[key] = (version, mask)
+        return mask
+
+    def ordinal_of(self, question_id: str) -> Optional[int]:
+        """Get a question's ordinal, or None if it is not in the pool"""
+        return self.ordinals.get(question_id)
+
+    def sample(
+        self,
+        count: int,
+        subject: Optional[str] = None,
+        difficulty: Optional[str] = None,
+        tags: Optional[List[str]] = None,
+        seed: Optional[int] = None
+    ) -> List[str]:
+        """Get up to count distinct random question IDs matching all given filters.
+
+        Candidates are taken in (subject, difficulty) pool order and then
+        ordinal order, so the same seed over the same pool always yields the
+        same sample.
+        """
+        def matches(key: Tuple[str, str]) -> bool:
+            return (not subject or key[0] == subject) and (not difficulty or key[1] == difficulty)
+
+        rng = random.Random(seed) if seed is not None else random
+        if tags:
+            tagged = set.intersection(*(self.tagged.get(tag, set()) for tag in tags))
+            candidates = sorted(ordinal for ordinal in tagged if matches(self.entries[ordinal]))
+            return [self.ids[ordinal] for ordinal in rng.sample(candidates, min(count, len(candidates)))]
+
+        # Sample positions across the matching pools laid end to end, without building a candidate list
+        pools = [self.pools[key] for key in sorted(self.pools) if matches(key) and self.pools[key]]
+        ends = list(accumulate(len(pool) for pool in pools))
+        total = ends[-1] if ends else 0
+        question_ids = []
+        for position in rng.sample(range(total), min(count, total)):
+            index = bisect_right(ends, position)
+            pool_start = ends[index - 1] if index else 0
+            question_ids.append(self.ids[pools[index][position - pool_start]])
+        return question_ids
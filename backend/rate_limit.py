@@ -0,0 +1,162 @@
+from collections import OrderedDict
+from typing import Optional, Callable, Awaitable
+import asyncio
+import logging
+import math
+import threading
+import time
+
+from fastapi import Depends, HTTPException, Request, status
+from fastapi.responses import JSONResponse
+from fastapi.security import HTTPAuthorizationCredentials
+from pymongo import monitoring
+
+from auth import get_current_user, security
+from models import User
+
+logger = logging.getLogger(__name__)
+
+class RateLimiter:
+    """In-memory token buckets, one per key, evicting the least recently used keys"""
+
+    def __init__(self, rate: float, burst: int, max_keys: int = 100000):
+        self.rate = rate  # Tokens added per second
+        self.burst = burst  # Bucket capacity
+        self.max_keys = max_keys
+        self.buckets: "OrderedDict[str, list]" = OrderedDict()  # key -> [tokens, last refill time]
+
+    def acquire(self, key: str) -> float:
+        """Take a token for key, returning 0 if allowed or the seconds until one is available"""
+        now = time.monotonic()
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = self.buckets[key] = [float(self.burst), now]
+            if len(self.buckets) > self.max_keys:
+                self.buckets.popitem(last=False)
+        else:
+            self.buckets.move_to_end(key)
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+
+        if bucket[0] >= 1:
+            bucket[0] -= 1
+            return 0.0
+        return (1 - bucket[0]) / self.rate
+
+    def check(self, key: str):
+        """Raise 429 Too Many Requests if key has no token available"""
+        wait = self.acquire(key)
+        if wait:
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Too many requests",
+                headers={"Retry-After": str(math.ceil(wait))}
+            )
+
+def client_ip(request: Request, trust_forwarded_for: bool = False) -> str:
+    """Get the client address, optionally from the first X-Forwarded-For hop"""
+    forwarded_for = request.headers.get("x-forwarded-for") if trust_forwarded_for else None
+    if forwarded_for:
+        return forwarded_for.split(",")[0].strip()
+    return request.client.host if request.client else "unknown"
+
+def limit_by_ip(limiter: RateLimiter, trust_forwarded_for: bool = False) -> Callable[[Request], Awaitable[None]]:
+    """Dependency that rate limits a route per client IP"""
+    async def dependency(request: Request):
+        limiter.check(client_ip(request, trust_forwarded_for))
+    return dependency
+
+def limit_by_user(
+    limiter: RateLimiter,
+    ip_limiter: RateLimiter,
+    trust_forwarded_for: bool = False
+) -> Callable[..., Awaitable[User]]:
+    """Dependency that rate limits the route per client IP, authenticates the user and then rate limits per user.
+
+    A token is only trusted once it resolves to a user: keying buckets by the
+    raw token would give a client minting garbage tokens a fresh bucket, and a
+    session read, on every request. The IP bucket bounds those reads.
+    """
+    async def dependency(request: Request, credentials: HTTPAuthorizationCredentials = Depends(security)) -> User:
+        ip_limiter.check(client_ip(request, trust_forwarded_for))
+        user = await get_current_user(credentials)
+        limiter.check(user.id)
+        return user
+    return dependency
+
+class LoadMonitor(monitoring.ConnectionPoolListener):
+    """Track Mongo pool checkout waiters and event-loop lag.
+
+    Registered as a pymongo event listener, so the pool callbacks run on
+    driver threads; the waiter count is guarded by a lock.
+    """
+
+    def __init__(self, max_pool_waiters: int, max_loop_lag: float, sample_interval: float = 0.1):
+        self.max_pool_waiters = max_pool_waiters
+        self.max_loop_lag = max_loop_lag  # seconds
+        self.sample_interval = sample_interval
+        self.pool_waiters = 0
+        self.loop_lag = 0.0
+        self.lock = threading.Lock()
+
+    def overload_reason(self) -> Optional[str]:
+        """Describe why the service is overloaded, or None if it is not"""
+        if self.pool_waiters > self.max_pool_waiters:
+            return f"{self.pool_waiters} requests waiting for a database connection"
+        if self.loop_lag > self.max_loop_lag:
+            return f"event loop lagging by {self.loop_lag * 1000:.0f} ms"
+        return None
+
+    async def sample_loop_lag(self):
+        """Measure how late the event loop wakes a sleeping task; runs until cancelled"""
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.sample_interval)
+            self.loop_lag = max(0.0, loop.time() - started - self.sample_interval)
+
+    def _change_waiters(self, delta: int):
+        with self.lock:
+            self.pool_waiters += delta
+
+    def connection_check_out_started(self, event):
+        self._change_waiters(1)
+
+    def connection_checked_out(self, event):
+        self._change_waiters(-1)
+
+    def connection_check_out_failed(self, event):
+        self._change_waiters(-1)
+
+    # Remaining pool events are not needed for load tracking
+    def pool_created(self, event): pass
+    def pool_ready(self, event): pass
+    def pool_cleared(self, event): pass
+    def pool_closed(self, event): pass
+    def connection_created(self, event): pass
+    def connection_ready(self, event): pass
+    def connection_closed(self, event): pass
+    def connection_checked_in(self, event): pass
+
+class LoadSheddingMiddleware:
+    """Reject API requests with 503 while the load monitor reports overload"""
+
+    def __init__(self, app, monitor: LoadMonitor, path_prefix: str = "/api/", exempt_paths: tuple = ("/api/",)):
+        self.app = app
+        self.monitor = monitor
+        self.path_prefix = path_prefix
+        self.exempt_paths = exempt_paths
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"].startswith(self.path_prefix) and scope["path"] not in self.exempt_paths:
+            reason = self.monitor.overload_reason()
+            if reason:
+                logger.debug(f"Shedding {scope['method']} {scope['path']}: {reason}")
+                response = JSONResponse(
+                    {"detail": "Service temporarily overloaded, please retry"},
+                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    headers={"Retry-After": "1"}
+                )
+                await response(scope, receive, send)
+                return
+        await self.app(scope, receive, send)
@@ -0,0 +1,78 @@
+from dataclasses import dataclass
+from typing import Any, Dict, Tuple, TYPE_CHECKING
+import logging
+
+if TYPE_CHECKING:
+    from database import Database
+
+logger = logging.getLogger(__name__)
+
+INITIAL_RATING = 1500.0
+RATING_SCALE = 400.0
+PROVISIONAL_ANSWERS = 30  # Users move faster until they have answered this many questions in a subject
+PROVISIONAL_K = 40.0
+USER_K = 20.0
+QUESTION_K = 16.0  # Questions see many more answers than any one user, so they move more slowly
+MIN_RATED_ANSWERS = 10  # Answers in a subject before a user appears on the rating leaderboard
+
+def expected_score(rating: float, opponent_rating: float) -> float:
+    """Probability that a player rated rating beats one rated opponent_rating"""
+    return 1.0 / (1.0 + 10 ** ((opponent_rating - rating) / RATING_SCALE))
+
+def user_k_factor(questions_answered: int) -> float:
+    """K factor for a user's next answer in a subject"""
+    return PROVISIONAL_K if questions_answered < PROVISIONAL_ANSWERS else USER_K
+
+def question_rating_change(user_rating: float, question_rating: float, correct: bool) -> float:
+    """Rating change for a question after a user rated user_rating answers it"""
+    return QUESTION_K * (expected_score(user_rating, question_rating) - (1.0 if correct else 0.0))
+
+@dataclass
+class RatingReplay:
+    answers: int = 0
+    skipped: int = 0  # Answers without a subject
+    users: int = 0  # (user, subject) ratings written
+    questions: int = 0
+
+async def replay_ratings(db: "Database", batch_size: int = 1000) -> RatingReplay:
+    """Rebuild every user and question rating by replaying the answer log oldest first.
+
+    Runs in one streaming pass holding only the ratings in memory. Ratings
+    are overwritten at the end, so answers submitted while the replay runs
+    are lost from them; run it while submissions are paused.
+    """
+    report = RatingReplay()
+    await db.backfill_answer_scoring_fields()
+
+    user_ratings: Dict[Tuple[str, str], list] = {}  # (user_id, subject) -> [rating, answers]
+    question_ratings: Dict[str, float] = {}
+    async for answer in db.iter_rating_answers():
+        if not answer.get("subject"):
+            report.skipped += 1
+            continue
+        report.answers += 1
+
+        user = user_ratings.setdefault((answer["user_id"], answer["subject"]), [INITIAL_RATING, 0])
+        question_rating = question_ratings.get(answer["question_id"], INITIAL_RATING)
+        expected = expected_score(user[0], question_rating)
+        outcome = 1.0 if answer["is_correct"] else 0.0
+        question_ratings[answer["question_id"]] = question_rating + QUESTION_K * (expected - outcome)
+        user[0] += user_k_factor(user[1]) * (outcome - expected)
+        user[1] += 1
+
+    report.users = await db.set_user_ratings(
+        {key: round(rating, 2) for key, (rating, _) in user_ratings.items()}, batch_size
+    )
+    report.questions = await db.set_question_ratings(
+        {question_id: round(rating, 2) for question_id, rating in question_ratings.items()}, batch_size
+    )
+    return report
+
+def rating_change_expression(question_rating: float, correct: bool) -> Dict[str, Any]:
+    """Aggregation expression for the rating change of a user_scores document after answering a question"""
+    rating = {"$ifNull": ["$rating", INITIAL_RATING]}
+    expected = {
+        "$divide": [1, {"$add": [1, {"$pow": [10, {"$divide": [{"$subtract": [question_rating, rating]}, RATING_SCALE]}]}]}]
+    }
+    k_factor = {"$cond": [{"$lt": [{"$ifNull": ["$questions_answered", 0]}, PROVISIONAL_ANSWERS]}, PROVISIONAL_K, USER_K]}
+    return {"$multiply": [k_factor, {"$subtract": [1 if correct else 0, expected]}]}
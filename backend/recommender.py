@@ -0,0 +1,176 @@
+from collections import OrderedDict
+from typing import Optional, Dict, List, Tuple
+import random
+
+from storage import Storage, field_key
+from models import UserRollup
+from question_pool import QuestionPool
+
+LEVELS = ["easy", "medium", "hard"]
+WORD_BITS = 32  # Bits per stored bitmap word
+MIN_ATTEMPTS = 5  # Attempts at a level before adapting away from it
+MASTERED_ACCURACY = 0.8
+STRUGGLING_ACCURACY = 0.5
+RANDOM_PROBES = 8
+SCAN_WORD_BYTES = 8  # The fallback scan counts unseen questions 64 bits at a time
+
+class Recommender:
+    """Pick unseen practice questions using per-user answered bitmaps.
+
+    Each user's answered set is a bitmap over question ordinals, persisted as
+    32-bit words in Mongo and cached in memory for recently active users.
+    Alongside it, each cached user keeps the unseen count of every pool it
+    has had to scan, so a pool the user has finished is skipped at once.
+    """
+
+    def __init__(self, db: Storage, pool: QuestionPool, max_cached_users: int = 10000):
+        self.db = db
+        self.pool = pool
+        self.max_cached_users = max_cached_users
+        self.bitmaps: "OrderedDict[str, bytearray]" = OrderedDict()
+        self.unseen: Dict[str, Dict[Tuple[str, str], Tuple[int, int]]] = {}  # user ID -> pool -> (pool version, unseen count)
+
+    async def answered(self, user_id: str) -> bytearray:
+        """Get the user's answered bitmap, building it from the answer log the first time"""
+        bitmap = self.bitmaps.get(user_id)
+        if bitmap is not None:
+            self.bitmaps.move_to_end(user_id)
+            return bitmap
+
+        words = await self.db.get_answered_words(user_id)
+        if words is None:
+            # First use for this user: backfill once from their answer history
+            ordinals = [self.pool.ordinal_of(question_id) for question_id in await self.db.get_answered_question_ids(user_id)]
+            words = words_for([ordinal for ordinal in ordinals if ordinal is not None])
+            await self.db.set_answered_bits(user_id, words)
+
+        bitmap = bytearray()
+        for index, word in words.items():
+            offset = index * (WORD_BITS // 8)
+            if len(bitmap) < offset + WORD_BITS // 8:
+                bitmap.extend(bytes(offset + WORD_BITS // 8 - len(bitmap)))
+            bitmap[offset:offset + WORD_BITS // 8] = word.to_bytes(WORD_BITS // 8, "little")
+
+        self.bitmaps[user_id] = bitmap
+        if len(self.bitmaps) > self.max_cached_users:
+            evicted, _ = self.bitmaps.popitem(last=False)
+            self.unseen.pop(evicted, None)
+        return bitmap
+
+    async def mark_answered(self, user_id: str, question_id: str):
+        """Record that the user has answered a question"""
+        ordinal = self.pool.ordinal_of(question_id)
+        if ordinal is None:
+            return
+
+        bitmap = self.bitmaps.get(user_id)
+        if bitmap is not None and not has_bit(bitmap, ordinal):
+            set_bit(bitmap, ordinal)
+            key = self.pool.entries[ordinal]
+            counts = self.unseen.get(user_id, {})
+            if key in counts and counts[key][0] == self.pool.version(*key):
+                counts[key] = (counts[key][0], max(counts[key][1] - 1, 0))
+        # Users without a bitmap yet get one backfilled from the answer log on first use
+        await self.db.set_answered_bits(user_id, words_for([ordinal]), create=False)
+
+    async def choose_difficulty(self, user_id: str, subject: str) -> str:
+        """Choose a difficulty from the user's accuracy at their current level"""
+        rollup = await self.db.get_user_rollup(user_id)
+        return adaptive_level(rollup, subject)
+
+    async def recommend(self, user_id: str, subject: str, difficulty: Optional[str] = None) -> Optional[str]:
+        """Get the ID of a question the user has not answered, or None if none are left"""
+        bitmap = await self.answered(user_id)
+        level = difficulty or await self.choose_difficulty(user_id, subject)
+
+        # Prefer the chosen level, then fall back to the nearest other levels
+        index = LEVELS.index(level) if level in LEVELS else 1
+        for candidate in sorted(LEVELS, key=lambda other: abs(LEVELS.index(other) - index)):
+            if difficulty and candidate != difficulty:
+                continue
+            ordinal = self.pick_unseen(user_id, bitmap, subject, candidate)
+            if ordinal is not None:
+                return self.pool.ids[ordinal]
+        return None
+
+    def pick_unseen(self, user_id: str, bitmap: bytearray, subject: str, difficulty: str) -> Optional[int]:
+        """Pick an ordinal uniformly at random from the unseen questions of a pool.
+
+        A few random probes find an unseen question in constant expected time
+        while most of the pool is unseen. Past that the pool's bitmask is
+        intersected with the unseen bits and a random one of them is chosen,
+        and the unseen count is kept so an exhausted pool is skipped at once
+        until the pool or the user's answers change.
+        """
+        pool = self.pool.pool(subject, difficulty)
+        if not pool:
+            return None
+        key = (subject, difficulty)
+        version = self.pool.version(subject, difficulty)
+        counts = self.unseen.setdefault(user_id, {})
+        if counts.get(key) == (version, 0):
+            return None
+
+        for _ in range(RANDOM_PROBES):
+            ordinal = pool[random.randrange(len(pool))]
+            if not has_bit(bitmap, ordinal):
+                return ordinal
+
+        unseen = self.pool.mask(subject, difficulty) & ~int.from_bytes(bitmap, "little")
+        unseen_count = unseen.bit_count()
+        counts[key] = (version, unseen_count)
+        if not unseen_count:
+            return None
+        return nth_set_bit(unseen, random.randrange(unseen_count))
+
+def words_for(ordinals: List[int]) -> Dict[int, int]:
+    """Group ordinals into bitmap words keyed by word index"""
+    words: Dict[int, int] = {}
+    for ordinal in ordinals:
+        index, bit = divmod(ordinal, WORD_BITS)
+        words[index] = words.get(index, 0) | (1 << bit)
+    return words
+
+def set_bit(bitmap: bytearray, ordinal: int):
+    """Set an ordinal's bit, growing the bitmap if needed"""
+    index, bit = divmod(ordinal, 8)
+    if index >= len(bitmap):
+        bitmap.extend(bytes(index + 1 - len(bitmap)))
+    bitmap[index] |= 1 << bit
+
+def has_bit(bitmap: bytearray, ordinal: int) -> bool:
+    """Check whether an ordinal's bit is set"""
+    index, bit = divmod(ordinal, 8)
+    return index < len(bitmap) and bool(bitmap[index] & (1 << bit))
+
+def nth_set_bit(mask: int, n: int) -> int:
+    """Get the position of the n-th lowest set bit of mask, counting whole words before searching one"""
+    data = mask.to_bytes((mask.bit_length() + 7) // 8, "little")
+    for offset in range(0, len(data), SCAN_WORD_BYTES):
+        word = int.from_bytes(data[offset:offset + SCAN_WORD_BYTES], "little")
+        word_count = word.bit_count()
+        if n < word_count:
+            for _ in range(n):
+                word &= word - 1  # Clear the lowest set bit
+            return offset * 8 + (word & -word).bit_length() - 1
+        n -= word_count
+    raise ValueError("mask has fewer set bits than requested")
+
+def adaptive_level(rollup: UserRollup, subject: str) -> str:
+    """Step up from mastered levels and down from levels the user struggles with"""
+    subject_rollup = rollup.subjects.get(field_key(subject))
+    if not subject_rollup:
+        return "medium"
+
+    # The current level is the hardest one the user has attempted
+    current = next(
+        (index for index in reversed(range(len(LEVELS))) if LEVELS[index] in subject_rollup.difficulties),
+        1
+    )
+    stats = subject_rollup.difficulties.get(LEVELS[current])
+    if stats and stats.attempts >= MIN_ATTEMPTS:
+        if stats.accuracy >= MASTERED_ACCURACY:
+            current = min(current + 1, len(LEVELS) - 1)
+        elif stats.accuracy < STRUGGLING_ACCURACY:
+            current = max(current - 1, 0)
+    return LEVELS[current]
@@ -0,0 +1,106 @@
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Dict, List
+import asyncio
+import logging
+
+from database import Database
+
+logger = logging.getLogger(__name__)
+
+COUNTERS = ("total_score", "questions_answered", "correct_answers")
+SNAPSHOT_LAG = timedelta(seconds=30)  # Answers older than this are assumed fully written
+CONFIRM_DELAY = 1.0  # Seconds before drift is checked a second time
+
+@dataclass
+class SubjectReconciliation:
+    subject: str
+    users_checked: int = 0
+    users_corrected: int = 0
+    score_drift: int = 0  # Sum of absolute total_score corrections
+    samples: List[Dict] = field(default_factory=list)
+
+async def find_drift(
+    db: Database,
+    subject: str,
+    expected: Dict[str, Dict[str, int]],
+    snapshot_at: datetime
+) -> Dict[str, Dict[str, int]]:
+    """Get the correction for every user whose live score differs from rebuilt counters plus answers since the snapshot"""
+    user_ids = list(expected)
+    changes = await db.get_score_changes_since(subject, user_ids, snapshot_at)
+    # Read live scores after the answers, so no answer is counted in changes before it could reach the score
+    current = await db.get_score_counters(subject, user_ids)
+
+    corrections = {}
+    for user_id in user_ids:
+        since = changes.get(user_id, {})
+        live = current.get(user_id, {})
+        correction = {
+            counter: expected[user_id][counter] + since.get(counter, 0) - (live.get(counter) or 0)
+            for counter in COUNTERS
+        }
+        if any(correction.values()):
+            corrections[user_id] = correction
+    return corrections
+
+async def reconcile_subject(
+    db: Database,
+    subject: str,
+    snapshot_at: datetime,
+    apply: bool,
+    batch_size: int,
+    pause: float
+) -> SubjectReconciliation:
+    """Rebuild one subject's scores from the answer log and correct drifted users.
+
+    Scores are rebuilt server-side from answers up to snapshot_at. Answers
+    saved since then are added back before comparing, and corrections are
+    applied as $inc so concurrent submissions are never overwritten. An
+    answer whose score increment is still in flight looks like drift, so
+    only drift that is identical on a second look is corrected.
+    """
+    report = SubjectReconciliation(subject)
+    await db.rebuild_subject_scores(subject, snapshot_at)
+
+    async for batch in db.iter_score_differences(subject, batch_size):
+        report.users_checked += len(batch)
+        expected = {row["user_id"]: row["expected"] for row in batch}
+        corrections = await find_drift(db, subject, expected, snapshot_at)
+        if corrections:
+            await asyncio.sleep(CONFIRM_DELAY)
+            confirmed = await find_drift(db, subject, {user_id: expected[user_id] for user_id in corrections}, snapshot_at)
+            corrections = {user_id: correction for user_id, correction in corrections.items() if confirmed.get(user_id) == correction}
+
+        report.users_corrected += len(corrections)
+        report.score_drift += sum(abs(correction["total_score"]) for correction in corrections.values())
+        report.samples.extend(
+            {"user_id": user_id, **correction} for user_id, correction in list(corrections.items())[:10 - len(report.samples)]
+        )
+
+        if apply and corrections:
+            await db.apply_score_corrections(subject, corrections)
+            # Yield to live traffic between batches
+            await asyncio.sleep(pause)
+
+    return report
+
+async def reconcile_scores(
+    db: Database,
+    apply: bool = False,
+    batch_size: int = 500,
+    concurrency: int = 4,
+    pause: float = 0.05
+) -> List[SubjectReconciliation]:
+    """Reconcile user_scores with user_answers for every subject, several subjects at a time"""
+    await db.backfill_answer_scoring_fields()
+    snapshot_at = datetime.utcnow() - SNAPSHOT_LAG
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(subject: str) -> SubjectReconciliation:
+        async with semaphore:
+            report = await reconcile_subject(db, subject, snapshot_at, apply, batch_size, pause)
+            logger.info(f"Reconciled {subject}: {report.users_corrected}/{report.users_checked} users drifted")
+            return report
+
+    return await asyncio.gather(*(run(subject) for subject in await db.get_scored_subjects()))
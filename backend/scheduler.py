@@ -0,0 +1,202 @@
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+import asyncio
+import heapq
+import logging
+import time
+
+from storage import Storage
+from models import Competition, CompetitionStatus, Question
+from question_packs import QuestionPack
+
+logger = logging.getLogger(__name__)
+
+LEASE_NAME = "competition_scheduler"
+LEASE_SECONDS = 30.0
+RENEW_SECONDS = 10.0  # Leaders renew, and followers retry, this often
+
+START = "start"
+END = "end"
+
+def timestamp(at: datetime) -> float:
+    """Epoch seconds for a datetime, treating naive values as UTC like Mongo does"""
+    return (at if at.tzinfo else at.replace(tzinfo=timezone.utc)).timestamp()
+
+class CompetitionScheduler:
+    """Move competitions from upcoming to live to completed at their start and end times.
+
+    Every worker keeps a heap of pending start and end timers and warms the
+    answer key and question pack of competitions it sees go live, so serving
+    and grading a competition need no question lookups. Only the worker holding
+    the scheduler lease in Mongo writes status changes and finalizes results;
+    the writes are conditional on the current status, so a lease handover
+    can never apply a transition twice.
+    """
+
+    def __init__(self, db: Storage, worker_id: str):
+        self.db = db
+        self.worker_id = worker_id
+        self.timers: List[Tuple[float, int, str, str, int]] = []  # (due, sequence, competition ID, START or END, version)
+        self.sequence = 0
+        self.versions: Dict[str, int] = {}  # Bumped on every reschedule so superseded timers are skipped
+        self.competitions: Dict[str, Competition] = {}
+        self.answer_keys: Dict[str, Dict[str, Question]] = {}  # competition ID -> question ID -> question
+        self.packs: Dict[str, QuestionPack] = {}
+        self.is_leader = False
+        self.wakeup = asyncio.Event()
+
+    def schedule(self, competition: Competition):
+        """Add or replace the timers for a competition; removed or finished competitions are dropped"""
+        finished = competition.status == CompetitionStatus.COMPLETED and competition.results_finalized_at
+        if not competition.is_active or finished:
+            self.unschedule(competition.id)
+            return
+
+        version = self.versions[competition.id] = self.versions.get(competition.id, 0) + 1
+        previous = self.competitions.get(competition.id)
+        if previous and previous.questions != competition.questions:
+            self.packs.pop(competition.id, None)
+        self.competitions[competition.id] = competition
+        if competition.status == CompetitionStatus.UPCOMING:
+            self._push(timestamp(competition.start_date), competition.id, START, version)
+        elif competition.status == CompetitionStatus.LIVE and competition.id not in self.answer_keys:
+            # Already live when this worker learned of it; warm its cache now
+            self._push(time.time(), competition.id, START, version)
+        self._push(timestamp(competition.end_date), competition.id, END, version)
+        self.wakeup.set()
+
+    def unschedule(self, competition_id: str):
+        """Forget a competition and drop its cached answer key"""
+        self.competitions.pop(competition_id, None)
+        self.answer_keys.pop(competition_id, None)
+        self.packs.pop(competition_id, None)
+        self.versions.pop(competition_id, None)
+
+    def on_change(self, change: Optional[Dict[str, Any]]):
+        """Invalidation bus handler for the competitions collection"""
+        if change is None:
+            # Changes may have been missed; rebuild every timer from the database
+            asyncio.ensure_future(self.load())
+            return
+        # Competitions are soft deleted, so every relevant change carries the full document
+        document = change.get("fullDocument")
+        if document:
+            self.schedule(Competition(**document))
+
+    def forget_question(self, question_id: Optional[str] = None):
+        """Drop a question from cached answer keys and packs so it is read again; None drops every question"""
+        for competition_id, answer_key in self.answer_keys.items():
+            if question_id is None:
+                answer_key.clear()
+            elif answer_key.pop(question_id, None) is None:
+                continue
+            self.packs.pop(competition_id, None)
+
+    def cached_question(self, competition_id: Optional[str], question_id: str) -> Optional[Question]:
+        """Get a question from a live competition's warmed answer key"""
+        return self.answer_keys.get(competition_id, {}).get(question_id)
+
+    async def load(self):
+        """Schedule every competition with a pending transition"""
+        competitions = await self.db.get_scheduled_competitions()
+        self.timers.clear()
+        self.competitions.clear()
+        for competition in competitions:
+            self.schedule(competition)
+        for competition_id in [key for key in self.answer_keys if key not in self.competitions]:
+            del self.answer_keys[competition_id]
+            self.packs.pop(competition_id, None)
+        logger.info(f"Scheduled {len(self.competitions)} competitions")
+
+    async def run(self):
+        """Fire timers as they fall due and keep the leader lease fresh; runs until cancelled"""
+        await self.load()
+        renew_at = 0.0
+        try:
+            while True:
+                now = time.time()
+                if now >= renew_at:
+                    await self._renew_lease()
+                    renew_at = now + RENEW_SECONDS
+
+                while self.timers and self.timers[0][0] <= time.time():
+                    _, _, competition_id, action, version = heapq.heappop(self.timers)
+                    await self._fire(competition_id, action, version)
+
+                next_due = self.timers[0][0] if self.timers else renew_at
+                self.wakeup.clear()
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), timeout=max(min(renew_at, next_due) - time.time(), 0))
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            if self.is_leader:
+                await self.db.release_lease(LEASE_NAME, self.worker_id)
+
+    async def _renew_lease(self):
+        try:
+            leader = await self.db.acquire_lease(LEASE_NAME, self.worker_id, LEASE_SECONDS)
+        except Exception:
+            logger.exception("Could not renew the competition scheduler lease")
+            leader = False
+        became_leader = leader and not self.is_leader
+        self.is_leader = leader
+        if became_leader:
+            logger.info(f"Worker {self.worker_id} is now the competition scheduler leader")
+            # A previous leader may have died with transitions due; catch up on them now
+            await self.load()
+
+    async def _fire(self, competition_id: str, action: str, version: int):
+        competition = self.competitions.get(competition_id)
+        if competition is None or self.versions.get(competition_id) != version:
+            return  # Removed, or rescheduled after this timer was pushed
+        try:
+            if action == START:
+                await self._start(competition)
+            else:
+                await self._end(competition)
+        except Exception:
+            logger.exception(f"Competition {competition_id} {action} transition failed; retrying shortly")
+            self._push(time.time() + RENEW_SECONDS, competition_id, action, version)
+
+    async def pack_for(self, competition_id: str) -> Optional[QuestionPack]:
+        """Get the question pack of a live competition, building it from its answer key if needed"""
+        pack = self.packs.get(competition_id)
+        competition = self.competitions.get(competition_id)
+        if pack or not competition or competition.status != CompetitionStatus.LIVE:
+            return pack
+
+        answer_key = self.answer_keys.setdefault(competition_id, {})
+        missing = [question_id for question_id in competition.questions if question_id not in answer_key]
+        if missing:
+            answer_key.update(await self.db.get_answer_key(missing))
+        pack = self.packs[competition_id] = QuestionPack(competition, answer_key)
+        return pack
+
+    async def _start(self, competition: Competition):
+        self.answer_keys[competition.id] = await self.db.get_answer_key(competition.questions)
+        if self.is_leader and competition.status == CompetitionStatus.UPCOMING:
+            if await self.db.set_competition_status(competition.id, [CompetitionStatus.UPCOMING.value], CompetitionStatus.LIVE.value):
+                logger.info(f"Competition {competition.id} is live")
+        self.competitions[competition.id] = competition.copy(update={"status": CompetitionStatus.LIVE})
+        pack = await self.pack_for(competition.id)
+        logger.info(f"Warmed competition {competition.id}: {len(pack.heads)} questions, {pack.size} byte pack")
+
+    async def _end(self, competition: Competition):
+        self.answer_keys.pop(competition.id, None)
+        self.packs.pop(competition.id, None)
+        if not self.is_leader:
+            # The leader's finalization reaches this worker through the invalidation bus
+            return
+        await self.db.set_competition_status(
+            competition.id,
+            [CompetitionStatus.UPCOMING.value, CompetitionStatus.LIVE.value],
+            CompetitionStatus.COMPLETED.value
+        )
+        participants = await self.db.finalize_competition_results(competition.id, competition.end_date)
+        logger.info(f"Competition {competition.id} completed with {participants} participants")
+        self.unschedule(competition.id)
+
+    def _push(self, due: float, competition_id: str, action: str, version: int):
+        self.sequence += 1
+        heapq.heappush(self.timers, (due, self.sequence, competition_id, action, version))
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Show which replica set member serves each Database read.
+
+Start a three-member replica set first (scripts/start_replset.sh 3), then run
+    MONGO_URL="mongodb://localhost:27017/?replicaSet=rs0" python scripts/check_read_routing.py
+Stale-tolerant reads should land on secondaries; auth and grading reads on the primary.
+"""
+
+import asyncio
+import os
+import sys
+from pathlib import Path
+
+from pymongo import monitoring
+
+sys.path.append(str(Path(__file__).parent.parent))
+from database import Database, STALE_TOLERANT_READS
+
+class CommandRecorder(monitoring.CommandListener):
+    """Remember the server address of each command sent"""
+
+    def __init__(self):
+        self.addresses = []
+
+    def started(self, event):
+        self.addresses.append(event.connection_id)
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+async def main():
+    recorder = CommandRecorder()
+    db = Database(
+        os.environ.get('MONGO_URL', 'mongodb://localhost:27017/?replicaSet=rs0'),
+        os.environ.get('DB_NAME', 'read_routing_check'),
+        event_listeners=[recorder],
+        read_routes={method: "secondary" for method in STALE_TOLERANT_READS},
+        max_staleness_seconds=90
+    )
+    await db.client.admin.command("ping")
+    primary = db.client.primary
+
+    checks = {
+        "get_panelists": db.get_panelists(),
+        "get_club_info": db.get_club_info(),
+        "get_leaderboard": db.get_leaderboard(),
+        "get_public_question": db.get_public_question("missing"),
+        "get_question_by_id (grading)": db.get_question_by_id("missing"),
+        "get_session_by_token (auth)": db.get_session_by_token("missing"),
+    }
+    for name, check in checks.items():
+        recorder.addresses.clear()
+        await check
+        served_by = recorder.addresses[-1]
+        role = "primary" if served_by == primary else "secondary"
+        print(f"{name:<32} served by {served_by[0]}:{served_by[1]} ({role})")
+
+    await db.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,34 @@
+#!/usr/bin/env bash
+# Start a local MongoDB replica set for development.
+#
+# Usage: scripts/start_replset.sh [members] [base_port]
+#   members    number of mongod processes (default 1; use 3 to exercise secondaries)
+#   base_port  port of the first member (default 27017)
+#
+# Then point the backend at it, e.g.
+#   MONGO_URL="mongodb://localhost:27017/?replicaSet=rs0"
+set -euo pipefail
+
+MEMBERS="${1:-1}"
+BASE_PORT="${2:-27017}"
+REPLSET="${REPLSET:-rs0}"
+DATA_ROOT="${DATA_ROOT:-/tmp/bdoh-${REPLSET}}"
+
+members_config=""
+for ((i = 0; i < MEMBERS; i++)); do
+    port=$((BASE_PORT + i))
+    mkdir -p "${DATA_ROOT}/${i}"
+    mongod --replSet "${REPLSET}" --port "${port}" --bind_ip localhost \
+        --dbpath "${DATA_ROOT}/${i}" --logpath "${DATA_ROOT}/${i}.log" --fork
+    members_config+="{_id: ${i}, host: 'localhost:${port}'},"
+done
+
+mongosh --quiet --port "${BASE_PORT}" --eval "
+try {
+    rs.status();
+} catch (e) {
+    rs.initiate({_id: '${REPLSET}', members: [${members_config}]});
+}
+while (!db.hello().isWritablePrimary) { sleep(200); }
+print('Replica set ${REPLSET} ready with ${MEMBERS} member(s)');
+"
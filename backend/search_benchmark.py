@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Benchmark the in-process question search index on a synthetic question bank.
+
+Usage: python search_benchmark.py [--questions 100000] [--queries 200]
+"""
+
+import argparse
+import itertools
+import random
+import resource
+import statistics
+import time
+
+from search_index import SearchIndex
+
+SUBJECTS = ["physics", "chemistry", "biology", "astronomy", "mathematics", "computer"]
+DIFFICULTIES = ["easy", "medium", "hard"]
+
+def make_vocabulary(rng: random.Random, size: int) -> list:
+    """Generate pseudo-words for the synthetic bank"""
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    return ["".join(rng.choice(letters) for _ in range(rng.randint(3, 10))) for _ in range(size)]
+
+def make_question(rng: random.Random, vocabulary: list, cum_weights: list, index: int) -> dict:
+    """Generate one question with Zipf-distributed words"""
+    def words(count):
+        return " ".join(rng.choices(vocabulary, cum_weights=cum_weights, k=count))
+
+    return {
+        "id": f"q{index:06d}",
+        "subject": rng.choice(SUBJECTS),
+        "difficulty": rng.choice(DIFFICULTIES),
+        "title": words(rng.randint(4, 10)),
+        "question_text": words(rng.randint(20, 60)),
+        "explanation": words(rng.randint(10, 40)),
+        "tags": rng.choices(vocabulary[:200], k=rng.randint(1, 4)),
+        "is_active": True
+    }
+
+def percentile(samples: list, fraction: float) -> float:
+    """Get a percentile of the samples in milliseconds"""
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--questions", type=int, default=100000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--vocabulary", type=int, default=50000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    vocabulary = make_vocabulary(rng, args.vocabulary)
+    cum_weights = list(itertools.accumulate(1 / (rank + 1) for rank in range(len(vocabulary))))
+    questions = [make_question(rng, vocabulary, cum_weights, index) for index in range(args.questions)]
+
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    index = SearchIndex()
+    started = time.perf_counter()
+    for question in questions:
+        index.add(question)
+    build_seconds = time.perf_counter() - started
+    rss_growth = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss_before
+    print(f"Indexed {args.questions} questions, {len(index.postings)} terms in {build_seconds:.2f}s "
+          f"(max RSS grew {rss_growth / 1024:.0f} MiB)")
+
+    # Queries mix common, mid-frequency and rare words, with and without filters
+    scenarios = {
+        "common": lambda: " ".join(rng.choices(vocabulary[:50], k=2)),
+        "mixed": lambda: " ".join(rng.choices(vocabulary[:5000], k=3)),
+        "rare": lambda: " ".join(rng.choices(vocabulary[5000:], k=2)),
+        "filtered": lambda: " ".join(rng.choices(vocabulary[:5000], k=3)),
+    }
+    for name, make_query in scenarios.items():
+        timings = []
+        for _ in range(args.queries):
+            query = make_query()
+            subject = rng.choice(SUBJECTS) if name == "filtered" else None
+            started = time.perf_counter()
+            _, cursor = index.search(query, subject=subject, limit=20)
+            if cursor:
+                index.search(query, subject=subject, limit=20, cursor=cursor)
+            timings.append((time.perf_counter() - started) / (2 if cursor else 1))
+        print(f"{name:>8}: p50 {percentile(timings, 0.5):7.2f} ms  p95 {percentile(timings, 0.95):7.2f} ms  "
+              f"mean {statistics.mean(timings) * 1000:7.2f} ms")
+
+    # Incremental updates: re-index and remove a slice of the bank
+    started = time.perf_counter()
+    for question in questions[:1000]:
+        index.add({**question, "title": question["title"] + " revised"})
+    for question in questions[1000:2000]:
+        index.remove(question["id"])
+    print(f"Re-indexed 1000 and removed 1000 questions in {(time.perf_counter() - started) * 1000:.0f} ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+from array import array
+from typing import Optional, Dict, Any, List, Tuple, TYPE_CHECKING
+import asyncio
+import base64
+import heapq
+import logging
+import math
+import re
+
+if TYPE_CHECKING:
+    from storage import Storage
+
+logger = logging.getLogger(__name__)
+
+FIELD_WEIGHTS = {"title": 3.0, "tags": 2.5, "question_text": 1.0, "explanation": 0.5}
+K1 = 1.2
+B = 0.75
+COMPACT_RATIO = 0.25  # Compact postings once this share of them belongs to removed questions
+TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+STOPWORDS = frozenset(
+    "a an and are as at be by for from how in is it of on or that the this to was what when which who why with".split()
+)
+
+def tokenize(text: str) -> List[str]:
+    """Split text into lowercase search terms"""
+    return [token for token in TOKEN_RE.findall(text.lower()) if token not in STOPWORDS]
+
+def encode_search_cursor(score: float, question_id: str) -> str:
+    """Encode a (score, id) keyset position as an opaque cursor"""
+    return base64.urlsafe_b64encode(f"{score!r}|{question_id}".encode()).decode()
+
+def decode_search_cursor(cursor: str) -> Tuple[float, str]:
+    """Decode a cursor produced by encode_search_cursor, raising ValueError if malformed"""
+    try:
+        score, question_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|", 1)
+        return float(score), question_id
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+def compacted_index(
+    postings: List[Tuple[str, Tuple[array, array]]],
+    doc_ids: List[Optional[str]],
+    doc_filters: List[Tuple[str, str]],
+    doc_lengths: array,
+    doc_terms: array
+) -> Tuple[Dict[str, Tuple[array, array]], List[Optional[str]], List[Tuple[str, str]], array, array]:
+    """Rebuild index structures keeping only live documents, renumbered in their original order"""
+    renumbered = array("i", [-1]) * len(doc_ids)
+    live_ids: List[Optional[str]] = []
+    live_filters: List[Tuple[str, str]] = []
+    live_lengths, live_terms = array("f"), array("i")
+    for docno, question_id in enumerate(doc_ids):
+        if question_id is not None:
+            renumbered[docno] = len(live_ids)
+            live_ids.append(question_id)
+            live_filters.append(doc_filters[docno])
+            live_lengths.append(doc_lengths[docno])
+            live_terms.append(doc_terms[docno])
+
+    live_postings = {}
+    for term, (docnos, weights) in postings:
+        kept = [(renumbered[docno], weight) for docno, weight in zip(docnos, weights) if renumbered[docno] >= 0]
+        if kept:
+            live_postings[term] = (array("i", (docno for docno, _ in kept)), array("f", (weight for _, weight in kept)))
+    return live_postings, live_ids, live_filters, live_lengths, live_terms
+
+class SearchIndex:
+    """Incrementally maintained BM25 inverted index over the question bank.
+
+    Postings are kept in typed arrays keyed by internal document numbers.
+    Updating or removing a question tombstones its old document number;
+    once enough postings are dead, a periodic task compacts the index in a
+    worker thread, off the request path.
+    """
+
+    def __init__(self):
+        self.version = 0  # Bumped on every change so a compaction of an older snapshot is discarded
+        self.clear()
+
+    def clear(self):
+        """Forget every question"""
+        self.postings: Dict[str, Tuple[array, array]] = {}  # term -> (docnos, weighted term frequencies)
+        self.doc_ids: List[Optional[str]] = []  # docno -> question ID, None once removed
+        self.doc_filters: List[Tuple[str, str]] = []  # docno -> (subject, difficulty)
+        self.doc_lengths = array("f")
+        self.doc_terms = array("i")  # docno -> number of postings
+        self.docnos: Dict[str, int] = {}  # question ID -> live docno
+        self.total_length = 0.0
+        self.live_postings = 0
+        self.dead_postings = 0
+        self.version += 1
+
+    async def load(self, db: "Storage"):
+        """Rebuild the index from the questions collection"""
+        self.clear()
+        async for entry in db.iter_question_index_entries(list(FIELD_WEIGHTS)):
+            self.add(entry)
+        logger.info(f"Search index loaded with {len(self.docnos)} questions and {len(self.postings)} terms")
+
+    def add(self, question: Dict[str, Any]):
+        """Insert or refresh a question; inactive questions are removed"""
+        self.remove(question["id"])
+        if not question.get("is_active", True):
+            return
+
+        frequencies: Dict[str, float] = {}
+        for field, weight in FIELD_WEIGHTS.items():
+            value = question.get(field) or ""
+            text = " ".join(value) if isinstance(value, list) else value
+            for term in tokenize(text):
+                frequencies[term] = frequencies.get(term, 0.0) + weight
+
+        self.version += 1
+        docno = len(self.doc_ids)
+        difficulty = question["difficulty"]
+        self.doc_ids.append(question["id"])
+        self.doc_filters.append((question["subject"], getattr(difficulty, "value", difficulty)))
+        length = sum(frequencies.values())
+        self.doc_lengths.append(length)
+        self.doc_terms.append(len(frequencies))
+        self.docnos[question["id"]] = docno
+        self.total_length += length
+        self.live_postings += len(frequencies)
+
+        for term, frequency in frequencies.items():
+            docnos, weights = self.postings.setdefault(term, (array("i"), array("f")))
+            docnos.append(docno)
+            weights.append(frequency)
+
+    def remove(self, question_id: str):
+        """Drop a question from the index if present"""
+        docno = self.docnos.pop(question_id, None)
+        if docno is None:
+            return
+
+        self.doc_ids[docno] = None
+        self.total_length -= self.doc_lengths[docno]
+        self.live_postings -= self.doc_terms[docno]
+        self.dead_postings += self.doc_terms[docno]
+        self.version += 1
+
+    @property
+    def needs_compaction(self) -> bool:
+        return self.dead_postings > COMPACT_RATIO * (self.live_postings + self.dead_postings)
+
+    async def compact(self) -> bool:
+        """Renumber live questions densely and rewrite postings without removed ones.
+
+        The rewrite runs in a worker thread from a snapshot. If the index
+        changed meanwhile the result is dropped and False is returned, so the
+        next call retries.
+        """
+        version = self.version
+        compacted = await asyncio.to_thread(
+            compacted_index,
+            list(self.postings.items()),
+            list(self.doc_ids),
+            list(self.doc_filters),
+            array("f", self.doc_lengths),
+            array("i", self.doc_terms)
+        )
+        if self.version != version:
+            return False
+        self.postings, self.doc_ids, self.doc_filters, self.doc_lengths, self.doc_terms = compacted
+        self.docnos = {question_id: docno for docno, question_id in enumerate(self.doc_ids)}
+        self.dead_postings = 0
+        return True
+
+    def search(
+        self,
+        query: str,
+        subject: Optional[str] = None,
+        difficulty: Optional[str] = None,
+        limit: int = 20,
+        cursor: Optional[str] = None
+    ) -> Tuple[List[Tuple[str, float]], Optional[str]]:
+        """Get a page of (question ID, score) pairs by descending relevance, and the next page's cursor"""
+        after = decode_search_cursor(cursor) if cursor else None
+        live = len(self.docnos)
+        if not live:
+            return [], None
+        average_length = self.total_length / live or 1.0
+
+        # Hot loop: bind lookups locally and fold the BM25 length normalisation into two constants
+        doc_ids, doc_filters, doc_lengths = self.doc_ids, self.doc_filters, self.doc_lengths
+        base_norm = K1 * (1 - B)
+        length_norm = K1 * B / average_length
+        scores: Dict[int, float] = {}
+        for term in set(tokenize(query)):
+            if term not in self.postings:
+                continue
+            docnos, weights = self.postings[term]
+            # Document frequency includes tombstoned postings until the next compaction
+            frequency_in_docs = min(len(docnos), live)
+            idf = math.log(1 + (live - frequency_in_docs + 0.5) / (frequency_in_docs + 0.5))
+            boost = idf * (K1 + 1)
+            for docno, frequency in zip(docnos, weights):
+                if doc_ids[docno] is None:
+                    continue
+                if subject or difficulty:
+                    doc_subject, doc_difficulty = doc_filters[docno]
+                    if (subject and doc_subject != subject) or (difficulty and doc_difficulty != difficulty):
+                        continue
+                score = boost * frequency / (frequency + base_norm + length_norm * doc_lengths[docno])
+                scores[docno] = scores.get(docno, 0.0) + score
+
+        hits = ((score, self.doc_ids[docno]) for docno, score in scores.items())
+        if after:
+            after_score, after_id = after
+            hits = (hit for hit in hits if hit[0] < after_score or (hit[0] == after_score and hit[1] > after_id))
+
+        # Rank by score, breaking ties by question ID so paging is stable
+        page = heapq.nsmallest(limit + 1, hits, key=lambda hit: (-hit[0], hit[1]))
+        next_cursor = None
+        if len(page) > limit:
+            page = page[:limit]
+            next_cursor = encode_search_cursor(*page[-1])
+        return [(question_id, score) for score, question_id in page], next_cursor
@@ -1,44 +1,226 @@
-from fastapi import FastAPI, APIRouter, Depends, HTTPException, status, UploadFile, File
+from fastapi import FastAPI, APIRouter, Depends, HTTPException, status, UploadFile, File, Query, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from motor.motor_asyncio import AsyncIOMotorClient
 from typing import List, Optional, Dict, Any
-from datetime import datetime
+from datetime import datetime, timedelta
+import asyncio
 import os
 import logging
 from pathlib import Path
 import base64
+import random
+import socket
 import uuid
 
 # Import our models and services
 from models import *
-from database import Database
+from storage import Storage
+from database import Database, STALE_TOLERANT_READS
+from memory_storage import InMemoryStorage
 from auth import AuthService, get_current_user, get_current_admin
+from question_pool import QuestionPool
+from recommender import Recommender
+from search_index import SearchIndex
+from singleflight import SingleFlight
+from invalidation import InvalidationBus
+from scheduler import CompetitionScheduler
+from achievements import AchievementEngine
+from rate_limit import RateLimiter, LoadMonitor, LoadSheddingMiddleware, limit_by_ip, limit_by_user
+from compression import CompressionMiddleware
+from tracing import MongoCommandTracer, TracedJSONResponse, TracingMiddleware, instrument_response_validation, tracer_from_env
+from images import VARIANT_CONTENT_TYPE, VARIANT_SIZES, render_image_variants
+from ratings import INITIAL_RATING, question_rating_change
+from exports import EXPORT_FORMATS, SCORE_COLUMNS, COMPETITION_RESULT_COLUMNS, export_rows
 
 # Load environment variables
 ROOT_DIR = Path(__file__).parent
 from dotenv import load_dotenv
 load_dotenv(ROOT_DIR / '.env')
 
-# MongoDB connection
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db_client = Database(mongo_url, os.environ['DB_NAME'])
+# Admission control: per-route token buckets and load shedding
+load_monitor = LoadMonitor(
+    max_pool_waiters=int(os.environ.get('SHED_MAX_POOL_WAITERS', '50')),
+    max_loop_lag=float(os.environ.get('SHED_MAX_LOOP_LAG_MS', '200')) / 1000
+)
+TRUST_FORWARDED_FOR = os.environ.get('TRUST_FORWARDED_FOR', '').lower() in ('1', 'true', 'yes')
+# Answers are limited per client IP before authentication (generous, for shared school networks) and per user after
+answer_rate_limit = limit_by_user(
+    RateLimiter(
+        rate=float(os.environ.get('ANSWER_RATE_PER_SECOND', '2')),
+        burst=int(os.environ.get('ANSWER_RATE_BURST', '10'))
+    ),
+    RateLimiter(
+        rate=float(os.environ.get('ANSWER_IP_RATE_PER_SECOND', '20')),
+        burst=int(os.environ.get('ANSWER_IP_RATE_BURST', '100'))
+    ),
+    trust_forwarded_for=TRUST_FORWARDED_FOR
+)
+login_rate_limit = limit_by_ip(
+    RateLimiter(
+        rate=float(os.environ.get('LOGIN_RATE_PER_SECOND', '1')),
+        burst=int(os.environ.get('LOGIN_RATE_BURST', '20'))
+    ),
+    trust_forwarded_for=TRUST_FORWARDED_FOR
+)
+
+# Request tracing: spans for auth, Mongo commands, response validation and JSON encoding, exported
+# as OTLP/JSON to OTEL_EXPORTER_OTLP_ENDPOINT and/or TRACE_EXPORT_FILE. Slow requests are always kept.
+tracer = tracer_from_env()
+if tracer:
+    instrument_response_validation()
+
+# Coalesce identical concurrent reads of hot shared data into one query
+shared_reads = SingleFlight()
+SHARED_READ_FRESH_SECONDS = float(os.environ.get('SHARED_READ_FRESH_SECONDS', '1'))
+SHARED_READ_STALE_SECONDS = float(os.environ.get('SHARED_READ_STALE_SECONDS', '5'))
+
+CONTENT_CACHE_SECONDS = float(os.environ.get('CONTENT_CACHE_SECONDS', '60'))
+
+# Per-user dashboards, keyed (user ID,). A submit drops the user's dashboard on the worker that served
+# it at once and on every other worker when its answer insert arrives through the invalidation bus;
+# new achievements are evicted the same way.
+dashboard_reads = SingleFlight(max_results=int(os.environ.get('DASHBOARD_CACHE_SIZE', '10000')))
+DASHBOARD_CACHE_SECONDS = float(os.environ.get('DASHBOARD_CACHE_SECONDS', '30'))
+DASHBOARD_RECENT_ANSWERS = 10
+
+async def shared_read(key: tuple, fetch, fresh_for: float = SHARED_READ_FRESH_SECONDS, stale_for: float = SHARED_READ_STALE_SECONDS):
+    """Run fetch once for all concurrent callers of key, reusing results briefly"""
+    return await shared_reads.do(key, fetch, fresh_for, stale_for)
+
+async def cached_content(key: tuple, fetch):
+    """Read admin-managed content through a cache kept fresh by the invalidation bus"""
+    return await shared_reads.do(key, fetch, CONTENT_CACHE_SECONDS)
+
+# Storage: "mongo" (default) or "memory" for in-process tests, load tests and profiling without a database
+STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 'mongo')
+if STORAGE_BACKEND == 'memory':
+    db_client: Storage = InMemoryStorage()
+elif STORAGE_BACKEND == 'mongo':
+    # Stale-tolerant public reads may go to secondaries; READ_ROUTES overrides single methods,
+    # e.g. READ_ROUTES="get_leaderboard=secondary:available,get_panelists=nearest"
+    read_routes = {method: os.environ.get('PUBLIC_READ_PREFERENCE', 'primary') for method in STALE_TOLERANT_READS}
+    for route in filter(None, os.environ.get('READ_ROUTES', '').split(',')):
+        method, _, mode = route.partition('=')
+        read_routes[method.strip()] = mode.strip()
+    db_client = Database(
+        os.environ['MONGO_URL'],
+        os.environ['DB_NAME'],
+        event_listeners=[load_monitor] + ([MongoCommandTracer()] if tracer else []),
+        read_routes=read_routes,
+        max_staleness_seconds=int(os.environ.get('MAX_STALENESS_SECONDS', '90'))
+    )
+else:
+    raise ValueError(f"Unknown STORAGE_BACKEND: {STORAGE_BACKEND}")
+question_pool = QuestionPool()
+recommender = Recommender(db_client, question_pool)
+search_index = SearchIndex()
+worker_id = os.environ.get('WORKER_ID', socket.gethostname())
+# Each worker process keeps its own resume token, so one worker resetting it never clears another's.
+# Set WORKER_INDEX (0, 1, ...) per process for a stable ID that resumes across restarts; without it
+# the process ID keeps workers apart, and a restarted worker starts from the current changes.
+invalidation_bus = InvalidationBus(db_client, f"{worker_id}:{os.environ.get('WORKER_INDEX', os.getpid())}")
+# Workers on one host share a hostname, so the scheduler lease holder also includes the process ID
+competition_scheduler = CompetitionScheduler(db_client, f"{worker_id}:{os.getpid()}")
+# Achievements are evaluated from queued answers in the background; new awards evict the user's dashboard
+achievement_engine = AchievementEngine(db_client, on_award=lambda user_id: dashboard_reads.forget_key((user_id,)))
 
 # Create the main app
-app = FastAPI(title="Bangladesh Olympiadians Hub API", version="1.0.0")
+app = FastAPI(
+    title="Bangladesh Olympiadians Hub API",
+    version="1.0.0",
+    default_response_class=TracedJSONResponse if tracer else JSONResponse
+)
 
 # Create API router
 api_router = APIRouter(prefix="/api")
 
 # Initialize auth service
 auth_service = None
+background_tasks: List[asyncio.Task] = []
+ACTIVE_USER_FLUSH_SECONDS = float(os.environ.get('ACTIVE_USER_FLUSH_SECONDS', '5'))
+SEARCH_COMPACT_SECONDS = float(os.environ.get('SEARCH_COMPACT_SECONDS', '30'))
+
+async def flush_buffered_writes_periodically():
+    """Merge buffered active-user sketches and question rating moves into storage every few seconds"""
+    while True:
+        await asyncio.sleep(ACTIVE_USER_FLUSH_SECONDS)
+        try:
+            await db_client.flush_active_users()
+        except Exception as e:
+            logging.error(f"Failed to flush active users: {e}")
+        try:
+            await db_client.flush_question_ratings()
+        except Exception as e:
+            logging.error(f"Failed to flush question ratings: {e}")
+
+async def compact_search_index_periodically():
+    """Compact the search index off the request path once enough removed questions accumulate"""
+    while True:
+        await asyncio.sleep(SEARCH_COMPACT_SECONDS)
+        if search_index.needs_compaction:
+            try:
+                await search_index.compact()
+            except Exception as e:
+                logging.error(f"Failed to compact the search index: {e}")
+
+async def load_question_indexes():
+    """Rebuild the in-memory question pool and search index"""
+    await question_pool.load(db_client)
+    await search_index.load(db_client)
+
+def on_question_change(change: Optional[Dict[str, Any]]):
+    """Apply a question change from any worker to this worker's indexes and caches"""
+    document = change.get("fullDocument") if change else None
+    if document:
+        question_pool.add(document)
+        search_index.add(document)
+        competition_scheduler.forget_question(document["id"])
+    elif change is None:
+        background_tasks.append(asyncio.create_task(load_question_indexes()))
+        competition_scheduler.forget_question()
+    for prefix in ("questions", "subjects", "stats"):
+        shared_reads.forget((prefix,))
+
+def forget_on_change(*prefixes: str):
+    """Build a change handler that drops cached reads under the given key prefixes"""
+    def handler(change: Optional[Dict[str, Any]]):
+        for prefix in prefixes:
+            shared_reads.forget((prefix,))
+    return handler
+
+def forget_dashboard(change: Optional[Dict[str, Any]]):
+    """Drop the dashboard of a user who answered or was awarded an achievement through any worker"""
+    document = change.get("fullDocument") if change else None
+    if document:
+        dashboard_reads.forget_key((document["user_id"],))
+    elif change is None:
+        dashboard_reads.forget()
+
+invalidation_bus.subscribe("questions", on_question_change)
+invalidation_bus.subscribe("panelists", forget_on_change("panelists"))
+invalidation_bus.subscribe("admin_members", forget_on_change("admin_members"))
+invalidation_bus.subscribe("club_info", forget_on_change("club_info"))
+invalidation_bus.subscribe("users", forget_on_change("leaderboard", "stats"))
+invalidation_bus.subscribe("competitions", competition_scheduler.on_change)
+invalidation_bus.subscribe("competitions", forget_on_change("competitions"))
+invalidation_bus.subscribe("user_answers", forget_dashboard)
+invalidation_bus.subscribe("achievements", forget_dashboard)
 
 @app.on_event("startup")
 async def startup_event():
     """Initialize database and services on startup"""
     global auth_service
     await db_client.create_indexes()
+    await load_question_indexes()
+    background_tasks.append(asyncio.create_task(invalidation_bus.run()))
+    background_tasks.append(asyncio.create_task(flush_buffered_writes_periodically()))
+    background_tasks.append(asyncio.create_task(compact_search_index_periodically()))
+    background_tasks.append(asyncio.create_task(load_monitor.sample_loop_lag()))
+    background_tasks.append(asyncio.create_task(competition_scheduler.run()))
+    background_tasks.append(asyncio.create_task(achievement_engine.run()))
+    if tracer:
+        background_tasks.append(asyncio.create_task(tracer.exporter.run()))
     auth_service = AuthService(db_client)
     
     # Import auth service globally
@@ -62,8 +244,24 @@ async def startup_event():
 @app.on_event("shutdown")
 async def shutdown_event():
     """Cleanup on shutdown"""
+    for task in background_tasks:
+        task.cancel()
+    # Let cancelled tasks finish their cleanup, such as releasing the scheduler lease, before disconnecting
+    await asyncio.gather(*background_tasks, return_exceptions=True)
     await db_client.close()
-    client.close()
+
+# Compress responses innermost; compressed variants of public reads are cached by body digest
+app.add_middleware(
+    CompressionMiddleware,
+    cacheable_prefixes=(
+        "/api/questions", "/api/leaderboard", "/api/panelists", "/api/admin-members",
+        "/api/club-info", "/api/stats", "/api/subjects"
+    ),
+    max_cached_bytes=int(os.environ.get('COMPRESSION_CACHE_MB', '16')) * 1024 * 1024
+)
+
+# Load shedding runs inside CORS so rejected responses still carry CORS headers
+app.add_middleware(LoadSheddingMiddleware, monitor=load_monitor)
 
 # CORS middleware
 app.add_middleware(
@@ -74,13 +272,30 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Tracing is outermost so root spans cover shedding, CORS and compression too
+if tracer:
+    app.add_middleware(TracingMiddleware, tracer=tracer)
+
+def index_question(question: Question):
+    """Refresh a question in the in-memory question indexes"""
+    question_data = question.dict()
+    question_pool.add(question_data)
+    search_index.add(question_data)
+    shared_reads.forget(("questions",))
+
+def unindex_question(question_id: str):
+    """Remove a question from the in-memory question indexes"""
+    question_pool.remove(question_id)
+    search_index.remove(question_id)
+    shared_reads.forget(("questions",))
+
 # Root endpoint
 @api_router.get("/")
 async def root():
     return {"message": "Bangladesh Olympiadians Hub API is running"}
 
 # Authentication endpoints
-@api_router.post("/auth/login", response_model=LoginResponse)
+@api_router.post("/auth/login", response_model=LoginResponse, dependencies=[Depends(login_rate_limit)])
 async def login(session_id: str):
     """Login or register user using Emergent Auth"""
     try:
@@ -110,7 +325,9 @@ async def create_question(question: QuestionCreate, user: User = Depends(get_cur
     """Create a new question (Admin only)"""
     question_data = question.dict()
     question_data["created_by"] = user.id
-    return await db_client.create_question(question_data)
+    created = await db_client.create_question(question_data)
+    index_question(created)
+    return created
 
 @api_router.get("/questions", response_model=List[Question])
 async def get_questions(
@@ -120,13 +337,89 @@ async def get_questions(
     skip: int = 0
 ):
     """Get questions with optional filtering"""
-    questions = await db_client.get_questions(subject, limit, skip)
-    return questions
+    return await cached_content(
+        ("questions", subject, limit, skip),
+        lambda: db_client.get_questions(subject, limit, skip)
+    )
+
+@api_router.get("/admin/questions", response_model=List[AdminQuestion])
+async def get_admin_questions(
+    subject: Optional[str] = None,
+    include_inactive: bool = False,
+    limit: int = 20,
+    skip: int = 0,
+    user: User = Depends(get_current_admin)
+):
+    """Get questions with attempt counts, correctness rate and average time (Admin only)"""
+    return await db_client.get_admin_questions(subject, include_inactive, limit, skip)
+
+@api_router.get("/questions/search", response_model=QuestionSearchPage)
+async def search_questions(
+    q: str,
+    subject: Optional[str] = None,
+    difficulty: Optional[DifficultyLevel] = None,
+    limit: int = 20,
+    cursor: Optional[str] = None
+):
+    """Search question titles, text, explanations and tags by relevance"""
+    try:
+        hits, next_cursor = search_index.search(
+            q,
+            subject,
+            difficulty.value if difficulty else None,
+            max(1, min(limit, 100)),
+            cursor
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    questions = {question.id: question for question in await db_client.get_questions_by_ids([question_id for question_id, _ in hits])}
+    items = [
+        QuestionSearchHit(question=questions[question_id], score=score)
+        for question_id, score in hits if question_id in questions
+    ]
+    return QuestionSearchPage(items=items, next_cursor=next_cursor)
+
+@api_router.get("/questions/sample", response_model=List[Question])
+async def sample_questions(
+    response: Response,
+    count: int = 10,
+    subject: Optional[str] = None,
+    difficulty: Optional[DifficultyLevel] = None,
+    tags: List[str] = Query([]),
+    seed: Optional[int] = None
+):
+    """Get a uniformly random quiz of active questions; the same seed reproduces the quiz"""
+    if seed is None:
+        seed = random.getrandbits(32)
+    response.headers["X-Quiz-Seed"] = str(seed)
+    
+    question_ids = question_pool.sample(
+        max(1, min(count, 100)),
+        subject,
+        difficulty.value if difficulty else None,
+        tags,
+        seed
+    )
+    return await db_client.get_questions_by_ids(question_ids)
+
+@api_router.get("/questions/recommend", response_model=Question)
+async def recommend_question(
+    subject: str,
+    difficulty: Optional[DifficultyLevel] = None,
+    user: User = Depends(get_current_user)
+):
+    """Get an unanswered practice question at the given or adaptively chosen difficulty"""
+    question_id = await recommender.recommend(user.id, subject, difficulty.value if difficulty else None)
+    question = await db_client.get_question_by_id(question_id) if question_id else None
+    if not question:
+        raise HTTPException(status_code=404, detail="No unanswered questions left")
+    return question
 
 @api_router.get("/questions/{question_id}", response_model=Question)
 async def get_question(question_id: str):
     """Get a specific question"""
-    question = await db_client.get_question_by_id(question_id)
+    question = await db_client.get_public_question(question_id)
     if not question:
         raise HTTPException(status_code=404, detail="Question not found")
     return question
@@ -143,7 +436,10 @@ async def update_question(
     if not success:
         raise HTTPException(status_code=404, detail="Question not found")
     
-    return await db_client.get_question_by_id(question_id)
+    updated = await db_client.get_question_by_id(question_id)
+    if updated:
+        index_question(updated)
+    return updated
 
 @api_router.delete("/questions/{question_id}")
 async def delete_question(question_id: str, user: User = Depends(get_current_admin)):
@@ -151,6 +447,7 @@ async def delete_question(question_id: str, user: User = Depends(get_current_adm
     success = await db_client.delete_question(question_id)
     if not success:
         raise HTTPException(status_code=404, detail="Question not found")
+    unindex_question(question_id)
     return {"message": "Question deleted successfully"}
 
 # Answer submission endpoints
@@ -158,11 +455,13 @@ async def delete_question(question_id: str, user: User = Depends(get_current_adm
 async def submit_answer(
     question_id: str,
     answer: AnswerSubmission,
-    user: User = Depends(get_current_user)
+    user: User = Depends(answer_rate_limit)
 ):
     """Submit an answer to a question"""
-    # Get the question
-    question = await db_client.get_question_by_id(question_id)
+    # Get the question, from the warmed answer key while its competition is live
+    question = competition_scheduler.cached_question(answer.competition_id, question_id)
+    if not question:
+        question = await db_client.get_question_by_id(question_id)
     if not question:
         raise HTTPException(status_code=404, detail="Question not found")
     
@@ -170,19 +469,39 @@ async def submit_answer(
     is_correct = answer.selected_answer == question.correct_answer
     
     # Save user answer
+    score_delta = question.points if is_correct else 0
     answer_data = {
         "user_id": user.id,
         "question_id": question_id,
         "selected_answer": answer.selected_answer,
         "is_correct": is_correct,
         "time_taken": answer.time_taken,
-        "competition_id": answer.competition_id
+        "competition_id": answer.competition_id,
+        "subject": question.subject,
+        "difficulty": question.difficulty.value,
+        "points_earned": score_delta
     }
-    user_answer = await db_client.save_user_answer(answer_data)
     
-    # Update user score
-    score_delta = question.points if is_correct else 0
-    await db_client.update_user_score(user.id, question.subject, score_delta, is_correct)
+    async def update_score_and_ratings():
+        # The question moves against the user's rating from before this answer; the move is
+        # buffered and written in batches, so it adds no round trip after the score update
+        question_rating = question.rating if question.rating is not None else INITIAL_RATING
+        score = await db_client.update_user_score(user.id, question.subject, score_delta, is_correct, question_rating)
+        user_rating = score["rating"] - score["rating_change"]
+        db_client.record_question_rating_change(question_id, question_rating_change(user_rating, question_rating, is_correct))
+    
+    # Save the answer and update score, ratings, question stats and rollup counters concurrently
+    db_client.record_active_user(user.id)
+    await asyncio.gather(
+        db_client.save_user_answer(answer_data),
+        update_score_and_ratings(),
+        db_client.update_question_stats(question_id, is_correct, answer.time_taken),
+        db_client.update_user_rollup(user.id, question.subject, question.difficulty.value, is_correct, answer.time_taken),
+        db_client.record_answer_activity(user.id, question.subject, is_correct),
+        recommender.mark_answered(user.id, question_id)
+    )
+    dashboard_reads.forget_key((user.id,))
+    achievement_engine.record(user.id, question.subject, is_correct)
     
     return {
         "is_correct": is_correct,
@@ -198,24 +517,149 @@ async def get_my_scores(user: User = Depends(get_current_user)):
     scores = await db_client.get_user_score(user.id)
     return scores
 
+@api_router.get("/users/me/dashboard", response_model=UserDashboard)
+async def get_my_dashboard(user: User = Depends(get_current_user)):
+    """Get current user's profile, subject scores and ranks, recent answers and achievements"""
+    async def fetch_dashboard():
+        scores, (recent_answers, _), achievements = await asyncio.gather(
+            db_client.get_user_standings(user.id),
+            db_client.get_user_answer_history(user.id, limit=DASHBOARD_RECENT_ANSWERS),
+            db_client.get_user_achievements(user.id)
+        )
+        return {"scores": scores, "recent_answers": recent_answers, "achievements": achievements}
+    
+    # The profile comes from authentication, so only the per-user reads are cached
+    dashboard = await dashboard_reads.do((user.id,), fetch_dashboard, DASHBOARD_CACHE_SECONDS)
+    return UserDashboard(user=user, **dashboard)
+
+@api_router.get("/users/me/answers", response_model=AnswerHistoryPage)
+async def get_my_answers(
+    subject: Optional[str] = None,
+    competition_id: Optional[str] = None,
+    limit: int = 20,
+    cursor: Optional[str] = None,
+    user: User = Depends(get_current_user)
+):
+    """Get current user's answer history, newest first, paginated by cursor"""
+    limit = max(1, min(limit, 100))
+    try:
+        answers, next_cursor = await db_client.get_user_answer_history(user.id, subject, competition_id, limit, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return AnswerHistoryPage(items=answers, next_cursor=next_cursor)
+
+@api_router.get("/users/me/rollup", response_model=UserRollup)
+async def get_my_rollup(user: User = Depends(get_current_user)):
+    """Get current user's attempts, accuracy and average time per subject and difficulty"""
+    return await db_client.get_user_rollup(user.id)
+
 @api_router.get("/leaderboard")
 async def get_leaderboard(subject: Optional[str] = None, limit: int = 10):
     """Get leaderboard"""
-    leaderboard = await db_client.get_leaderboard(subject, limit)
-    return leaderboard
+    limit = max(1, min(limit, 100))
+    return await shared_read(("leaderboard", subject, limit), lambda: db_client.get_leaderboard(subject, limit))
+
+@api_router.get("/leaderboard/ratings")
+async def get_rating_leaderboard(subject: str, limit: int = 10):
+    """Get the highest rated users in a subject"""
+    limit = max(1, min(limit, 100))
+    return await shared_read(("leaderboard", "ratings", subject, limit), lambda: db_client.get_rating_leaderboard(subject, limit))
+
+async def render_uploaded_image(image: Optional[str]):
+    """Resize an uploaded image into its variants, rejecting unreadable images"""
+    try:
+        return await render_image_variants(image)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+# Image endpoints
+@api_router.get("/images/{owner_id}/{variant}")
+async def get_image(owner_id: str, variant: str, v: Optional[str] = None):
+    """Get a resized panelist or admin member image"""
+    if variant not in VARIANT_SIZES:
+        raise HTTPException(status_code=404, detail="Image not found")
+    image = await db_client.get_image_variant(owner_id, variant)
+    if not image:
+        raise HTTPException(status_code=404, detail="Image not found")
+    # Versioned URLs change whenever the image does, so they can be cached indefinitely
+    cache_control = "public, max-age=31536000, immutable" if v == image["version"] else "public, max-age=300"
+    return Response(
+        content=image["data"],
+        media_type=image.get("content_type", VARIANT_CONTENT_TYPE),
+        headers={"Cache-Control": cache_control, "ETag": f'"{image["version"]}"'}
+    )
+
+# Competition endpoints
+@api_router.post("/competitions", response_model=Competition)
+async def create_competition(competition: CompetitionCreate, user: User = Depends(get_current_admin)):
+    """Create a new competition (Admin only)"""
+    if competition.end_date <= competition.start_date:
+        raise HTTPException(status_code=400, detail="Competition must end after it starts")
+    competition_data = competition.dict()
+    competition_data["created_by"] = user.id
+    competition = await db_client.create_competition(competition_data)
+    # Other workers pick it up through the invalidation bus
+    competition_scheduler.schedule(competition)
+    shared_reads.forget(("competitions",))
+    return competition
+
+@api_router.get("/competitions", response_model=List[Competition])
+async def get_competitions(status: Optional[CompetitionStatus] = None, limit: int = 20, skip: int = 0):
+    """Get competitions, soonest first, optionally by status"""
+    limit = max(1, min(limit, 100))
+    status_value = status.value if status else None
+    return await cached_content(
+        ("competitions", status_value, limit, skip),
+        lambda: db_client.get_competitions(status_value, limit, skip)
+    )
+
+@api_router.get("/competitions/{competition_id}", response_model=Competition)
+async def get_competition(competition_id: str):
+    """Get a specific competition"""
+    competition = await db_client.get_competition(competition_id)
+    if not competition:
+        raise HTTPException(status_code=404, detail="Competition not found")
+    return competition
+
+@api_router.get("/competitions/{competition_id}/pack")
+async def get_competition_pack(competition_id: str, user: User = Depends(get_current_user)):
+    """Get a live competition's questions, without answers, in this participant's shuffled order.
+    
+    Options carry their original index, which is what answers must be submitted with.
+    """
+    # Concurrent first requests on a cold worker share one build; later ones are served from memory
+    pack = await shared_reads.do(("competition_pack", competition_id), lambda: competition_scheduler.pack_for(competition_id))
+    if not pack:
+        raise HTTPException(status_code=404, detail="Competition is not live")
+    return Response(content=pack.render(user.id), media_type="application/json", headers={"Cache-Control": "private, no-store"})
+
+@api_router.get("/competitions/{competition_id}/results", response_model=List[CompetitionLeaderboard])
+async def get_competition_results(competition_id: str, limit: int = 100, skip: int = 0):
+    """Get a completed competition's final standings"""
+    limit = max(1, min(limit, 500))
+    return await cached_content(
+        ("competitions", competition_id, "results", limit, skip),
+        lambda: db_client.get_competition_results(competition_id, limit, skip)
+    )
 
 # Panelist endpoints
 @api_router.post("/panelists", response_model=Panelist)
 async def create_panelist(panelist: PanelistCreate, user: User = Depends(get_current_admin)):
     """Create a new panelist (Admin only)"""
+    variants = await render_uploaded_image(panelist.image)
     panelist_data = panelist.dict()
     panelist_data["created_by"] = user.id
-    return await db_client.create_panelist(panelist_data)
+    panelist = await db_client.create_panelist(panelist_data)
+    if variants:
+        urls = await db_client.set_image_variants("panelists", panelist.id, variants, VARIANT_CONTENT_TYPE)
+        panelist = panelist.copy(update=urls)
+    shared_reads.forget(("panelists",))
+    return panelist
 
 @api_router.get("/panelists", response_model=List[Panelist])
 async def get_panelists():
     """Get all panelists"""
-    return await db_client.get_panelists()
+    return await cached_content(("panelists",), db_client.get_panelists)
 
 @api_router.put("/panelists/{panelist_id}")
 async def update_panelist(
@@ -224,10 +668,13 @@ async def update_panelist(
     user: User = Depends(get_current_admin)
 ):
     """Update a panelist (Admin only)"""
+    variants = await render_uploaded_image(panelist_update.image)
     update_data = panelist_update.dict()
     success = await db_client.update_panelist(panelist_id, update_data)
     if not success:
         raise HTTPException(status_code=404, detail="Panelist not found")
+    await db_client.set_image_variants("panelists", panelist_id, variants, VARIANT_CONTENT_TYPE)
+    shared_reads.forget(("panelists",))
     return {"message": "Panelist updated successfully"}
 
 @api_router.delete("/panelists/{panelist_id}")
@@ -236,20 +683,27 @@ async def delete_panelist(panelist_id: str, user: User = Depends(get_current_adm
     success = await db_client.delete_panelist(panelist_id)
     if not success:
         raise HTTPException(status_code=404, detail="Panelist not found")
+    shared_reads.forget(("panelists",))
     return {"message": "Panelist deleted successfully"}
 
 # Admin member endpoints
 @api_router.post("/admin-members", response_model=AdminMember)
 async def create_admin_member(admin: AdminMemberCreate, user: User = Depends(get_current_admin)):
     """Create a new admin member (Admin only)"""
+    variants = await render_uploaded_image(admin.image)
     admin_data = admin.dict()
     admin_data["created_by"] = user.id
-    return await db_client.create_admin_member(admin_data)
+    admin_member = await db_client.create_admin_member(admin_data)
+    if variants:
+        urls = await db_client.set_image_variants("admin_members", admin_member.id, variants, VARIANT_CONTENT_TYPE)
+        admin_member = admin_member.copy(update=urls)
+    shared_reads.forget(("admin_members",))
+    return admin_member
 
 @api_router.get("/admin-members", response_model=List[AdminMember])
 async def get_admin_members():
     """Get all admin members"""
-    return await db_client.get_admin_members()
+    return await cached_content(("admin_members",), db_client.get_admin_members)
 
 # Club info endpoints
 @api_router.post("/club-info", response_model=ClubInfo)
@@ -257,12 +711,14 @@ async def create_club_info(club_info: ClubInfoCreate, user: User = Depends(get_c
     """Create club information (Admin only)"""
     club_data = club_info.dict()
     club_data["created_by"] = user.id
-    return await db_client.create_club_info(club_data)
+    club_info = await db_client.create_club_info(club_data)
+    shared_reads.forget(("club_info",))
+    return club_info
 
 @api_router.get("/club-info", response_model=List[ClubInfo])
 async def get_club_info(section: Optional[str] = None):
     """Get club information"""
-    return await db_client.get_club_info(section)
+    return await cached_content(("club_info", section), lambda: db_client.get_club_info(section))
 
 @api_router.put("/club-info/{info_id}")
 async def update_club_info(
@@ -276,18 +732,74 @@ async def update_club_info(
     success = await db_client.update_club_info(info_id, update_data)
     if not success:
         raise HTTPException(status_code=404, detail="Club info not found")
+    shared_reads.forget(("club_info",))
     return {"message": "Club info updated successfully"}
 
+# Export endpoints
+def export_response(batches, columns: Dict[str, str], export_format: str, filename: str) -> StreamingResponse:
+    """Stream batches of rows as a CSV or Parquet file download"""
+    if export_format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unsupported export format: {export_format}")
+    media_type, extension = EXPORT_FORMATS[export_format]
+    return StreamingResponse(
+        export_rows(batches, columns, export_format),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}.{extension}"'}
+    )
+
+@api_router.get("/admin/exports/scores")
+async def export_scores(
+    subject: Optional[str] = None,
+    format: str = "csv",
+    user: User = Depends(get_current_admin)
+):
+    """Export user scores with user names and per-subject rank as CSV or Parquet (Admin only)"""
+    filename = f"scores-{subject or 'all'}-{datetime.utcnow():%Y%m%d}"
+    return export_response(db_client.iter_score_export(subject), SCORE_COLUMNS, format, filename)
+
+@api_router.get("/admin/exports/competitions/{competition_id}")
+async def export_competition_results(
+    competition_id: str,
+    format: str = "csv",
+    user: User = Depends(get_current_admin)
+):
+    """Export a competition's ranked results as CSV or Parquet (Admin only)"""
+    return export_response(
+        db_client.iter_competition_results(competition_id),
+        COMPETITION_RESULT_COLUMNS,
+        format,
+        f"competition-{competition_id}-results"
+    )
+
 # Statistics endpoints
 @api_router.get("/stats")
 async def get_stats():
     """Get platform statistics"""
-    return await db_client.get_stats()
+    return await shared_read(("stats",), db_client.get_stats)
+
+@api_router.get("/stats/activity", response_model=List[ActivityBucket])
+async def get_activity(
+    granularity: str = "day",
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    subject: str = "all"
+):
+    """Get hourly or daily answer, correctness, distinct-user and signup counts"""
+    end = end or datetime.utcnow()
+    start = start or end - (timedelta(hours=23) if granularity == "hour" else timedelta(days=6))
+    try:
+        return await db_client.get_activity(granularity, start, end, subject)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 # Subject hub endpoints
 @api_router.get("/subjects")
 async def get_subjects():
     """Get all subject hubs with statistics"""
+    return await shared_read(("subjects",), build_subject_hubs)
+
+async def build_subject_hubs() -> List[Dict[str, Any]]:
+    """Build the subject hub list with live question counts"""
     subjects = [
         {
             "id": "physics",
@@ -346,13 +858,9 @@ async def get_subjects():
     ]
     
     # Add member counts and question counts from database
+    question_counts = await db_client.get_subject_question_counts()
     for subject in subjects:
-        # Get question count for this subject
-        question_count = await db_client.questions.count_documents({
-            "subject": subject["id"],
-            "is_active": True
-        })
-        subject["question_count"] = question_count
+        subject["question_count"] = question_counts.get(subject["id"], 0)
         
         # Mock member count (in real app, this would come from WhatsApp API or user registration)
         member_counts = {
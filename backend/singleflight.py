@@ -0,0 +1,86 @@
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+class SingleFlight:
+    """Coalesce concurrent identical reads into one in-flight call.
+
+    Callers asking for a key that is already being fetched await the same
+    task instead of starting their own. Results can also be reused for a
+    short fresh window, and then served stale while a single background
+    refresh runs.
+    """
+
+    def __init__(self, max_results: int = 1024):
+        self.max_results = max_results
+        self.inflight: Dict[Hashable, asyncio.Task] = {}
+        self.results: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()  # key -> (fetched at, value)
+
+    async def do(
+        self,
+        key: Hashable,
+        fetch: Callable[[], Awaitable[Any]],
+        fresh_for: float = 0.0,
+        stale_for: float = 0.0
+    ) -> Any:
+        """Get the value for key, sharing any in-flight fetch and reusing recent results"""
+        cached = self.results.get(key)
+        if cached:
+            age = time.monotonic() - cached[0]
+            if age < fresh_for:
+                return cached[1]
+            if age < fresh_for + stale_for:
+                if key not in self.inflight:
+                    self._start(key, fetch, fresh_for + stale_for > 0)
+                return cached[1]
+
+        task = self.inflight.get(key) or self._start(key, fetch, fresh_for + stale_for > 0)
+        # Shield the shared task so one cancelled caller does not cancel it for the others
+        return await asyncio.shield(task)
+
+    def forget(self, prefix: Tuple = ()):
+        """Drop cached results whose tuple key starts with prefix; everything by default.
+
+        Fetches already in flight for those keys are detached: their callers
+        still get the result, but it is not cached and later callers start a
+        new fetch, so a read that began before a write cannot outlive it.
+        """
+        for entries in (self.results, self.inflight):
+            for key in [key for key in entries if isinstance(key, tuple) and key[:len(prefix)] == prefix]:
+                del entries[key]
+
+    def forget_key(self, key: Hashable):
+        """Drop the cached result for exactly key and detach its in-flight fetch, without scanning other keys"""
+        self.results.pop(key, None)
+        self.inflight.pop(key, None)
+
+    def _start(self, key: Hashable, fetch: Callable[[], Awaitable[Any]], keep: bool) -> asyncio.Task:
+        task = asyncio.ensure_future(self._run(key, fetch, keep))
+        # Background refreshes may finish with nobody awaiting them; mark their errors as retrieved
+        task.add_done_callback(lambda done: done.cancelled() or done.exception())
+        self.inflight[key] = task
+        return task
+
+    async def _run(self, key: Hashable, fetch: Callable[[], Awaitable[Any]], keep: bool) -> Any:
+        task = asyncio.current_task()
+        try:
+            value = await fetch()
+        except Exception:
+            # A failed refresh leaves the previous result in place; waiters see the error
+            logger.exception(f"Shared fetch for {key!r} failed")
+            raise
+        finally:
+            detached = self.inflight.get(key) is not task
+            if not detached:
+                del self.inflight[key]
+
+        if keep and not detached:
+            self.results[key] = (time.monotonic(), value)
+            self.results.move_to_end(key)
+            if len(self.results) > self.max_results:
+                self.results.popitem(last=False)
+        return value
@@ -0,0 +1,506 @@
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta, timezone
+from typing import Optional, Dict, Any, List, Tuple, AsyncIterator
+import base64
+
+from hll import HyperLogLog
+from ratings import INITIAL_RATING
+from models import User, Question, AdminQuestion, Competition, CompetitionLeaderboard, Panelist, AdminMember, ClubInfo, UserAnswer, UserScore, SubjectStanding, UserSession, UserRollup, ActivityBucket, Achievement
+
+ACTIVITY_SPANS = {"hour": timedelta(hours=1), "day": timedelta(days=1)}
+ACTIVITY_ALL_SUBJECTS = "all"
+MAX_ACTIVITY_BUCKETS = 500
+
+def bucket_start(at: datetime, granularity: str) -> datetime:
+    """Truncate a timestamp to the start of its hour or day bucket, as naive UTC"""
+    if at.tzinfo:
+        at = at.astimezone(timezone.utc).replace(tzinfo=None)
+    if granularity == "hour":
+        return at.replace(minute=0, second=0, microsecond=0)
+    return at.replace(hour=0, minute=0, second=0, microsecond=0)
+
+def activity_bucket_range(granularity: str, start: datetime, end: datetime) -> List[datetime]:
+    """List the bucket starts from start to end inclusive, rejecting unknown granularities and oversized ranges"""
+    if granularity not in ACTIVITY_SPANS:
+        raise ValueError(f"Unknown granularity: {granularity}")
+    span = ACTIVITY_SPANS[granularity]
+    start, end = bucket_start(start, granularity), bucket_start(end, granularity)
+    if start > end or (end - start) / span >= MAX_ACTIVITY_BUCKETS:
+        raise ValueError(f"Time range must cover between 1 and {MAX_ACTIVITY_BUCKETS} buckets")
+
+    buckets = []
+    bucket = start
+    while bucket <= end:
+        buckets.append(bucket)
+        bucket += span
+    return buckets
+
+def field_key(value: str) -> str:
+    """Make a value safe to use as an embedded document key"""
+    return value.replace(".", "_").replace("$", "_")
+
+def previous_day(day: str) -> str:
+    """The "%Y-%m-%d" day before day"""
+    return (datetime.strptime(day, "%Y-%m-%d") - timedelta(days=1)).strftime("%Y-%m-%d")
+
+def encode_cursor(created_at: datetime, doc_id: str) -> str:
+    """Encode a (created_at, id) keyset position as an opaque cursor"""
+    raw = f"{created_at.isoformat()}|{doc_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+def decode_cursor(cursor: str) -> Tuple[datetime, str]:
+    """Decode a cursor produced by encode_cursor, raising ValueError if malformed"""
+    try:
+        created_at, doc_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|", 1)
+        return datetime.fromisoformat(created_at), doc_id
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+def with_rates(counters: Dict[str, Any]) -> Dict[str, Any]:
+    """Add accuracy and average time to a rollup counters document"""
+    attempts = counters.get("attempts", 0)
+    counters["accuracy"] = counters.get("correct", 0) / attempts if attempts else 0.0
+    counters["average_time"] = counters.get("total_time", 0) / attempts if attempts else 0.0
+    return counters
+
+async def iter_batches(cursor, batch_size: int) -> AsyncIterator[List[Dict[str, Any]]]:
+    """Group the documents of a cursor into lists of at most batch_size"""
+    batch = []
+    async for doc in cursor:
+        batch.append(doc)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+class Storage(ABC):
+    """Everything the API server and its in-process services read and write.
+
+    Database stores it in MongoDB; InMemoryStorage keeps it in process for
+    tests, load tests and profiling. Offline jobs that run aggregation
+    pipelines, such as reconciliation, calibration, archiving and rating
+    replays, still take a Database.
+    """
+
+    # Whether watch_changes can tail writes made by other workers
+    supports_change_streams = False
+
+    def __init__(self):
+        # Active users recorded by this process but not yet merged into storage, by UTC day
+        self.pending_active_users: Dict[str, HyperLogLog] = {}
+        # Question rating moves not yet written, summed per question ID
+        self.pending_question_ratings: Dict[str, float] = {}
+
+    @abstractmethod
+    async def create_indexes(self):
+        """Prepare storage for use"""
+
+    @abstractmethod
+    async def close(self):
+        """Flush buffered writes and release connections"""
+
+    # Users and sessions
+
+    @abstractmethod
+    async def get_user_by_email(self, email: str) -> Optional[User]:
+        """Get user by email"""
+
+    @abstractmethod
+    async def get_user_by_id(self, user_id: str) -> Optional[User]:
+        """Get user by ID"""
+
+    @abstractmethod
+    async def create_user(self, user_data: Dict[str, Any]) -> User:
+        """Create a new user and count the signup"""
+
+    @abstractmethod
+    async def login_user(self, user_data: Dict[str, Any], at: datetime, last_login_interval: timedelta) -> Tuple[User, bool]:
+        """Find or create the user with user_data's email and record the login, returning (user, created).
+
+        user_data only fills in new users. last_login is written at most once
+        per last_login_interval. Signups are not counted here, so the caller
+        can count them alongside its other writes.
+        """
+
+    @abstractmethod
+    async def create_session(self, session_data: Dict[str, Any]) -> UserSession:
+        """Create a new user session"""
+
+    @abstractmethod
+    async def get_session_by_token(self, session_token: str) -> Optional[UserSession]:
+        """Get an active, unexpired session by token"""
+
+    @abstractmethod
+    async def deactivate_session(self, session_token: str):
+        """Deactivate a session"""
+
+    # Questions
+
+    @abstractmethod
+    async def allocate_ordinals(self, name: str, count: int = 1) -> int:
+        """Reserve count consecutive values from a named counter and return the first"""
+
+    @abstractmethod
+    async def assign_missing_question_ordinals(self) -> int:
+        """Give every question without an ordinal its own ordinal, returning how many were assigned"""
+
+    @abstractmethod
+    def iter_question_index_entries(self, fields: Optional[List[str]] = None) -> AsyncIterator[Dict[str, Any]]:
+        """Iterate active questions with the fields needed by in-memory question indexes"""
+
+    @abstractmethod
+    async def create_question(self, question_data: Dict[str, Any]) -> Question:
+        """Create a new question"""
+
+    @abstractmethod
+    async def get_questions(self, subject: Optional[str] = None, limit: int = 20, skip: int = 0) -> List[Question]:
+        """Get active questions, optionally by subject"""
+
+    @abstractmethod
+    async def get_admin_questions(
+        self,
+        subject: Optional[str] = None,
+        include_inactive: bool = False,
+        limit: int = 20,
+        skip: int = 0
+    ) -> List[AdminQuestion]:
+        """Get questions, newest first, together with their embedded answer statistics"""
+
+    @abstractmethod
+    async def get_subject_question_counts(self) -> Dict[str, int]:
+        """Count active questions per subject"""
+
+    @abstractmethod
+    async def get_question_by_id(self, question_id: str) -> Optional[Question]:
+        """Get an active question by ID"""
+
+    @abstractmethod
+    async def get_public_question(self, question_id: str) -> Optional[Question]:
+        """Get an active question by ID for display, tolerating a slightly stale copy"""
+
+    @abstractmethod
+    async def get_questions_by_ids(self, question_ids: List[str]) -> List[Question]:
+        """Get active questions by ID, preserving the given order"""
+
+    @abstractmethod
+    async def update_question(self, question_id: str, update_data: Dict[str, Any]) -> bool:
+        """Update a question, returning whether anything changed"""
+
+    @abstractmethod
+    async def delete_question(self, question_id: str) -> bool:
+        """Soft delete a question, returning whether it was active"""
+
+    @abstractmethod
+    async def update_question_stats(self, question_id: str, correct: bool, time_taken: int):
+        """Increment a question's embedded answer statistics"""
+
+    @abstractmethod
+    async def apply_question_rating_changes(self, changes: Dict[str, float]):
+        """Move question ratings by the given amounts in one batch; unrated questions start from the initial rating"""
+
+    def record_question_rating_change(self, question_id: str, rating_change: float):
+        """Note a move of a question's rating; buffered in memory until flush_question_ratings"""
+        self.pending_question_ratings[question_id] = self.pending_question_ratings.get(question_id, 0.0) + rating_change
+
+    async def flush_question_ratings(self):
+        """Write buffered question rating moves"""
+        pending, self.pending_question_ratings = self.pending_question_ratings, {}
+        if not pending:
+            return
+        try:
+            await self.apply_question_rating_changes(pending)
+        except Exception:
+            # Keep the moves buffered for the next flush
+            for question_id, rating_change in pending.items():
+                self.record_question_rating_change(question_id, rating_change)
+            raise
+
+    # Competitions
+
+    @abstractmethod
+    async def create_competition(self, competition_data: Dict[str, Any]) -> Competition:
+        """Create a new competition"""
+
+    @abstractmethod
+    async def get_competition(self, competition_id: str) -> Optional[Competition]:
+        """Get an active competition by ID"""
+
+    @abstractmethod
+    async def get_competitions(self, status: Optional[str] = None, limit: int = 20, skip: int = 0) -> List[Competition]:
+        """Get active competitions, soonest first, optionally by status"""
+
+    @abstractmethod
+    async def get_scheduled_competitions(self) -> List[Competition]:
+        """Get competitions that still have a status change or finalization ahead of them"""
+
+    @abstractmethod
+    async def set_competition_status(self, competition_id: str, from_statuses: List[str], status: str) -> bool:
+        """Move a competition to status only if it is still in one of from_statuses"""
+
+    @abstractmethod
+    async def get_answer_key(self, question_ids: List[str]) -> Dict[str, Question]:
+        """Get active questions with their answers for grading"""
+
+    @abstractmethod
+    def iter_competition_results(self, competition_id: str, batch_size: int = 5000) -> AsyncIterator[List[Dict[str, Any]]]:
+        """Iterate a competition's standings in batches, from its finalized results or else live from its answers"""
+
+    @abstractmethod
+    async def finalize_competition_results(self, competition_id: str, ended_at: datetime) -> int:
+        """Rank a competition's answers up to its end into its results, returning the participant count"""
+
+    @abstractmethod
+    async def get_competition_results(self, competition_id: str, limit: int = 100, skip: int = 0) -> List[CompetitionLeaderboard]:
+        """Get a competition's finalized standings by rank"""
+
+    @abstractmethod
+    async def acquire_lease(self, name: str, holder: str, ttl_seconds: float) -> bool:
+        """Take or renew a named lease, returning False while another holder's lease is unexpired"""
+
+    @abstractmethod
+    async def release_lease(self, name: str, holder: str):
+        """Give up a lease if holder still has it"""
+
+    # Panelists, admin members and club information
+
+    @abstractmethod
+    async def create_panelist(self, panelist_data: Dict[str, Any]) -> Panelist:
+        """Create a new panelist"""
+
+    @abstractmethod
+    async def get_panelists(self) -> List[Panelist]:
+        """Get all active panelists without their full-size images"""
+
+    @abstractmethod
+    async def update_panelist(self, panelist_id: str, update_data: Dict[str, Any]) -> bool:
+        """Update a panelist"""
+
+    @abstractmethod
+    async def delete_panelist(self, panelist_id: str) -> bool:
+        """Soft delete a panelist"""
+
+    @abstractmethod
+    async def create_admin_member(self, admin_data: Dict[str, Any]) -> AdminMember:
+        """Create a new admin member"""
+
+    @abstractmethod
+    async def get_admin_members(self) -> List[AdminMember]:
+        """Get all active admin members without their full-size images"""
+
+    @abstractmethod
+    async def set_image_variants(
+        self,
+        owner_collection: str,
+        owner_id: str,
+        variants: Dict[str, Tuple[bytes, str]],
+        content_type: str
+    ) -> Dict[str, Optional[str]]:
+        """Store resized variants of an owner's image and point the owner at them, returning the <variant>_url fields set"""
+
+    @abstractmethod
+    async def get_image_variant(self, owner_id: str, variant: str) -> Optional[Dict[str, Any]]:
+        """Get a stored image variant with its content type, data and version"""
+
+    @abstractmethod
+    def iter_owner_images(self, owner_collection: str, missing_only: bool = True) -> AsyncIterator[Dict[str, Any]]:
+        """Iterate id and image of owners with an image, optionally only those without variants"""
+
+    @abstractmethod
+    async def create_club_info(self, club_data: Dict[str, Any]) -> ClubInfo:
+        """Create club information"""
+
+    @abstractmethod
+    async def get_club_info(self, section: Optional[str] = None) -> List[ClubInfo]:
+        """Get active club information in display order, optionally by section"""
+
+    @abstractmethod
+    async def update_club_info(self, info_id: str, update_data: Dict[str, Any]) -> bool:
+        """Update club information"""
+
+    # Answers, rollups and scores
+
+    @abstractmethod
+    async def save_user_answer(self, answer_data: Dict[str, Any]) -> UserAnswer:
+        """Save user answer"""
+
+    @abstractmethod
+    async def get_user_answers(self, user_id: str, question_id: Optional[str] = None) -> List[UserAnswer]:
+        """Get a user's answers, newest first"""
+
+    @abstractmethod
+    async def get_user_answer_history(
+        self,
+        user_id: str,
+        subject: Optional[str] = None,
+        competition_id: Optional[str] = None,
+        limit: int = 20,
+        cursor: Optional[str] = None
+    ) -> Tuple[List[UserAnswer], Optional[str]]:
+        """Get a page of user answers, newest first, with a keyset cursor for the next page"""
+
+    @abstractmethod
+    async def update_user_rollup(self, user_id: str, subject: str, difficulty: str, correct: bool, time_taken: int):
+        """Increment the user's overall, per-subject and per-difficulty answer counters"""
+
+    @abstractmethod
+    async def get_user_rollup(self, user_id: str) -> UserRollup:
+        """Get the user's answer rollup with accuracy and average time filled in"""
+
+    @abstractmethod
+    async def get_answered_words(self, user_id: str) -> Optional[Dict[int, int]]:
+        """Get the user's answered-question bitmap as {word index: word}, or None if never built"""
+
+    @abstractmethod
+    async def set_answered_bits(self, user_id: str, words: Dict[int, int], create: bool = True):
+        """OR the given words into the user's answered-question bitmap"""
+
+    @abstractmethod
+    async def get_answered_question_ids(self, user_id: str) -> List[str]:
+        """Get the distinct IDs of every question the user has answered"""
+
+    @abstractmethod
+    async def update_user_score(
+        self,
+        user_id: str,
+        subject: str,
+        score_delta: int,
+        correct: bool,
+        question_rating: float = INITIAL_RATING
+    ) -> Dict[str, Any]:
+        """Update user score and subject rating in one write, returning rating, rating_change and questions_answered"""
+
+    @abstractmethod
+    async def get_user_score(self, user_id: str, subject: Optional[str] = None) -> List[UserScore]:
+        """Get user scores"""
+
+    @abstractmethod
+    async def get_user_standings(self, user_id: str) -> List[SubjectStanding]:
+        """Get the user's scores with their rank by total score in each subject"""
+
+    @abstractmethod
+    async def get_leaderboard(self, subject: Optional[str] = None, limit: int = 10) -> List[Dict[str, Any]]:
+        """Get the highest scoring users, overall or in a subject"""
+
+    @abstractmethod
+    async def get_rating_leaderboard(self, subject: str, limit: int = 10) -> List[Dict[str, Any]]:
+        """Get the highest rated users in a subject who have answered enough questions to be rated"""
+
+    @abstractmethod
+    def iter_score_export(self, subject: Optional[str] = None, batch_size: int = 5000) -> AsyncIterator[List[Dict[str, Any]]]:
+        """Iterate user scores joined with user names, ranked within each subject, in batches"""
+
+    # Achievements
+
+    @abstractmethod
+    async def get_user_achievements(self, user_id: str, limit: int = 20) -> List[Achievement]:
+        """Get the user's public achievements, most recently earned first"""
+
+    @abstractmethod
+    async def update_achievement_progress(self, user_id: str, day: str, answers: int, correct: Dict[str, int]) -> Dict[str, Any]:
+        """Add a day's answers and correct answers per subject to the user's streak and counters, returning the progress"""
+
+    @abstractmethod
+    async def award_achievements(self, user_id: str, achievements: List[Dict[str, Any]]) -> List[Achievement]:
+        """Award achievements once per (user_id, rule_id) and note them in the progress, returning the new ones"""
+
+    # Activity
+
+    @abstractmethod
+    async def record_answer_activity(self, user_id: str, subject: str, correct: bool, at: Optional[datetime] = None):
+        """Count an answer in the hourly and daily activity buckets for its subject and overall"""
+
+    @abstractmethod
+    async def record_signup_activity(self, at: Optional[datetime] = None):
+        """Count a new user in the overall hourly and daily activity buckets"""
+
+    @abstractmethod
+    async def get_activity(
+        self,
+        granularity: str,
+        start: datetime,
+        end: datetime,
+        subject: str = ACTIVITY_ALL_SUBJECTS
+    ) -> List[ActivityBucket]:
+        """Get activity buckets from start to end inclusive, with empty buckets filled in"""
+
+    @abstractmethod
+    async def merge_active_user_sketch(self, day: str, sketch: HyperLogLog):
+        """Merge a sketch into the stored one for a day"""
+
+    @abstractmethod
+    async def get_active_user_sketches(self, days: List[str]) -> Dict[str, HyperLogLog]:
+        """Get the stored active-user sketches of the given days"""
+
+    @abstractmethod
+    async def count_active(self, collection: str) -> int:
+        """Count the active users, questions or competitions"""
+
+    def record_active_user(self, user_id: str, at: Optional[datetime] = None):
+        """Note that a user was active; buffered in memory until flush_active_users"""
+        day = (at or datetime.utcnow()).strftime("%Y-%m-%d")
+        self.pending_active_users.setdefault(day, HyperLogLog()).add(user_id)
+
+    async def flush_active_users(self):
+        """Merge buffered active-user sketches into their stored daily sketches"""
+        pending, self.pending_active_users = self.pending_active_users, {}
+        while pending:
+            day, sketch = next(iter(pending.items()))
+            try:
+                await self.merge_active_user_sketch(day, sketch)
+            except Exception:
+                # Keep unmerged sketches buffered for the next flush
+                for day, sketch in pending.items():
+                    self.pending_active_users.setdefault(day, HyperLogLog()).merge(sketch)
+                raise
+            del pending[day]
+
+    async def get_active_user_counts(self, now: Optional[datetime] = None) -> Dict[str, int]:
+        """Estimate daily, weekly and monthly active users from the last 30 daily sketches"""
+        now = now or datetime.utcnow()
+        days = [(now - timedelta(days=offset)).strftime("%Y-%m-%d") for offset in range(30)]
+        sketches = {day: HyperLogLog() for day in days}
+        for day, sketch in (await self.get_active_user_sketches(days)).items():
+            sketches[day].merge(sketch)
+        for day, sketch in self.pending_active_users.items():
+            if day in sketches:
+                sketches[day].merge(sketch)
+
+        return {
+            "daily": sketches[days[0]].count(),
+            "weekly": HyperLogLog.union(sketches[day] for day in days[:7]).count(),
+            "monthly": HyperLogLog.union(sketches.values()).count()
+        }
+
+    async def get_stats(self) -> Dict[str, Any]:
+        """Get platform statistics"""
+        total_users = await self.count_active("users")
+        total_questions = await self.count_active("questions")
+        total_competitions = await self.count_active("competitions")
+        now = datetime.utcnow()
+        recent_activities = await self.get_activity("day", now - timedelta(days=6), now)
+        active_users = await self.get_active_user_counts(now)
+
+        return {
+            "total_users": total_users,
+            "total_questions": total_questions,
+            "total_competitions": total_competitions,
+            "active_users": active_users["daily"],
+            "weekly_active_users": active_users["weekly"],
+            "monthly_active_users": active_users["monthly"],
+            "recent_activities": [bucket.dict() for bucket in recent_activities]
+        }
+
+    # Cross-worker change notification
+
+    def watch_changes(self, pipeline: List[Dict[str, Any]], resume_after: Optional[Dict[str, Any]] = None):
+        """Open a change stream over every collection; only called when supports_change_streams is set"""
+        raise NotImplementedError(f"{type(self).__name__} does not support change streams")
+
+    @abstractmethod
+    async def get_resume_token(self, worker_id: str) -> Optional[Dict[str, Any]]:
+        """Get the last change stream resume token stored for a worker"""
+
+    @abstractmethod
+    async def save_resume_token(self, worker_id: str, token: Optional[Dict[str, Any]]):
+        """Store a worker's change stream resume token"""
@@ -0,0 +1,358 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional, Tuple
+import asyncio
+import json
+import logging
+import os
+import random
+import threading
+import time
+
+import httpx
+from fastapi import routing
+from fastapi.responses import JSONResponse
+from pymongo import monitoring
+
+logger = logging.getLogger(__name__)
+
+# OTLP span kinds
+INTERNAL = 1
+SERVER = 2
+CLIENT = 3
+
+STATUS_ERROR = 2
+MAX_SPANS_PER_TRACE = 500  # Long exports and cursors stop recording child spans past this
+
+class Span:
+    """One timed stage of a request"""
+
+    __slots__ = ("trace", "span_id", "parent_id", "name", "kind", "start_ns", "end_ns", "attributes", "error")
+
+    def __init__(self, trace: "Trace", name: str, parent_id: Optional[str], kind: int = INTERNAL, **attributes):
+        self.trace = trace
+        self.span_id = random.getrandbits(64).to_bytes(8, "big").hex()
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.start_ns = time.time_ns()
+        self.end_ns = 0
+        self.attributes = attributes
+        self.error: Optional[str] = None
+
+    def child(self, name: str, kind: int = INTERNAL, **attributes) -> Optional["Span"]:
+        """Start a child span, or return None once the trace is full"""
+        if len(self.trace.spans) >= MAX_SPANS_PER_TRACE:
+            self.trace.dropped += 1
+            return None
+        span = Span(self.trace, name, self.span_id, kind, **attributes)
+        self.trace.spans.append(span)
+        return span
+
+    def end(self, error: Optional[str] = None):
+        self.end_ns = time.time_ns()
+        if error:
+            self.error = error
+
+    @property
+    def duration(self) -> float:
+        """Seconds from start to end"""
+        return (self.end_ns - self.start_ns) / 1e9
+
+class Trace:
+    """Every span recorded while serving one request"""
+
+    __slots__ = ("trace_id", "spans", "dropped")
+
+    def __init__(self, trace_id: Optional[str] = None):
+        self.trace_id = trace_id or random.getrandbits(128).to_bytes(16, "big").hex()
+        self.spans: List[Span] = []
+        self.dropped = 0
+
+    def root(self, name: str, parent_id: Optional[str] = None, **attributes) -> Span:
+        span = Span(self, name, parent_id, SERVER, **attributes)
+        self.spans.append(span)
+        return span
+
+# The innermost open span of the request being served by the current task
+current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+@contextmanager
+def span(name: str, **attributes):
+    """Time a block as a child of the current span; does nothing outside a traced request"""
+    parent = current_span.get()
+    child = parent.child(name, **attributes) if parent else None
+    if child is None:
+        yield None
+        return
+
+    token = current_span.set(child)
+    try:
+        yield child
+    except BaseException as e:
+        child.end(type(e).__name__)
+        raise
+    else:
+        child.end()
+    finally:
+        current_span.reset(token)
+
+def parse_traceparent(header: str) -> Tuple[Optional[str], Optional[str]]:
+    """Get (trace ID, parent span ID) from a W3C traceparent header, or (None, None) if malformed"""
+    parts = header.strip().split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None, None
+    try:
+        int(parts[1], 16), int(parts[2], 16)
+    except ValueError:
+        return None, None
+    return parts[1], parts[2]
+
+class TailSampler:
+    """Decide after a request finishes whether its trace is kept.
+
+    Slow requests and server errors are always kept; the rest are kept at
+    sample_rate so there is a baseline to compare slow traces against.
+    """
+
+    def __init__(self, slow_seconds: float, sample_rate: float):
+        self.slow_seconds = slow_seconds
+        self.sample_rate = sample_rate
+
+    def keep(self, root: Span) -> bool:
+        if root.duration >= self.slow_seconds or root.error:
+            return True
+        if root.attributes.get("http.status_code", 0) >= 500:
+            return True
+        return random.random() < self.sample_rate
+
+def otlp_value(value: Any) -> Dict[str, Any]:
+    """Encode an attribute value as an OTLP AnyValue"""
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+def otlp_span(trace: Trace, span: Span) -> Dict[str, Any]:
+    data = {
+        "traceId": trace.trace_id,
+        "spanId": span.span_id,
+        "name": span.name,
+        "kind": span.kind,
+        "startTimeUnixNano": str(span.start_ns),
+        "endTimeUnixNano": str(span.end_ns or span.start_ns),
+        "attributes": [{"key": key, "value": otlp_value(value)} for key, value in span.attributes.items() if value is not None],
+    }
+    if span.parent_id:
+        data["parentSpanId"] = span.parent_id
+    if span.error:
+        data["status"] = {"code": STATUS_ERROR, "message": span.error}
+    return data
+
+def otlp_request(traces: List[Trace], service_name: str) -> Dict[str, Any]:
+    """Build an OTLP/JSON ExportTraceServiceRequest"""
+    return {
+        "resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": service_name}}]},
+            "scopeSpans": [{
+                "scope": {"name": __name__},
+                "spans": [otlp_span(trace, span) for trace in traces for span in trace.spans]
+            }]
+        }]
+    }
+
+class OtlpExporter:
+    """Ship kept traces in batches as OTLP/JSON, to a collector's /v1/traces or appended to a file.
+
+    The file format is one ExportTraceServiceRequest per line, as written by
+    the OpenTelemetry collector's file exporter, so either destination can
+    be loaded by the same tools. Traces wait in a bounded queue and are sent
+    by a background task, never on the request path.
+    """
+
+    def __init__(
+        self,
+        service_name: str,
+        endpoint: Optional[str] = None,
+        path: Optional[str] = None,
+        flush_seconds: float = 5.0,
+        max_batch: int = 200,
+        max_queued: int = 5000
+    ):
+        self.service_name = service_name
+        self.endpoint = endpoint.rstrip("/") + "/v1/traces" if endpoint else None
+        self.path = path
+        self.flush_seconds = flush_seconds
+        self.max_batch = max_batch
+        self.queue: "asyncio.Queue[Trace]" = asyncio.Queue(max_queued)
+        self.dropped = 0
+
+    def submit(self, trace: Trace):
+        try:
+            self.queue.put_nowait(trace)
+        except asyncio.QueueFull:
+            self.dropped += 1
+
+    async def run(self):
+        """Export queued traces until cancelled, flushing what is left on the way out"""
+        async with httpx.AsyncClient(timeout=10.0) as client:
+            try:
+                while True:
+                    await asyncio.sleep(self.flush_seconds)
+                    await self.flush(client)
+            finally:
+                await self.flush(client)
+
+    async def flush(self, client: httpx.AsyncClient):
+        while not self.queue.empty():
+            batch = [self.queue.get_nowait() for _ in range(min(self.max_batch, self.queue.qsize()))]
+            body = json.dumps(otlp_request(batch, self.service_name), separators=(",", ":"))
+            try:
+                if self.endpoint:
+                    response = await client.post(self.endpoint, content=body, headers={"Content-Type": "application/json"})
+                    response.raise_for_status()
+                if self.path:
+                    await asyncio.to_thread(self._append, body)
+            except Exception as e:
+                logger.warning(f"Dropped {len(batch)} traces that could not be exported: {e}")
+
+    def _append(self, line: str):
+        with open(self.path, "a", encoding="utf-8") as file:
+            file.write(line + "\n")
+
+class Tracer:
+    """Start and finish request traces, handing the ones the sampler keeps to the exporter"""
+
+    def __init__(self, sampler: TailSampler, exporter: OtlpExporter):
+        self.sampler = sampler
+        self.exporter = exporter
+
+    def finish(self, root: Span):
+        root.end(root.error)
+        if root.trace.dropped:
+            root.attributes["trace.dropped_spans"] = root.trace.dropped
+        if self.sampler.keep(root):
+            self.exporter.submit(root.trace)
+
+class TracingMiddleware:
+    """Open a root span per HTTP request and report its trace ID in the X-Trace-Id header"""
+
+    def __init__(self, app, tracer: Tracer, path_prefix: str = "/api/"):
+        self.app = app
+        self.tracer = tracer
+        self.path_prefix = path_prefix
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope["path"].startswith(self.path_prefix):
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope["headers"])
+        trace_id, parent_id = parse_traceparent(headers.get(b"traceparent", b"").decode("latin-1"))
+        root = Trace(trace_id).root(
+            f"{scope['method']} {scope['path']}",
+            parent_id,
+            **{"http.method": scope["method"], "http.target": scope["path"]}
+        )
+
+        async def send_traced(message):
+            if message["type"] == "http.response.start":
+                root.attributes["http.status_code"] = message["status"]
+                message = {**message, "headers": list(message.get("headers", [])) + [(b"x-trace-id", root.trace.trace_id.encode())]}
+            await send(message)
+
+        token = current_span.set(root)
+        try:
+            await self.app(scope, receive, send_traced)
+        except BaseException as e:
+            root.error = type(e).__name__
+            raise
+        finally:
+            current_span.reset(token)
+            route = scope.get("route")
+            if route is not None and getattr(route, "path", None):
+                # Name by route template so traces of one endpoint group together
+                root.name = f"{scope['method']} {route.path}"
+            self.tracer.finish(root)
+
+class MongoCommandTracer(monitoring.CommandListener):
+    """Record each Mongo command as a client span of the request that issued it.
+
+    Motor runs commands on executor threads but copies the calling task's
+    context into them, so the current span is visible here. Started spans
+    are matched to their outcome by connection and request ID.
+    """
+
+    def __init__(self):
+        self.pending: Dict[Tuple[Any, int], Span] = {}
+        self.lock = threading.Lock()
+
+    def started(self, event):
+        parent = current_span.get()
+        if parent is None:
+            return
+        collection = event.command.get(event.command_name)
+        if not isinstance(collection, str):
+            # getMore names its collection separately; admin commands have none
+            collection = event.command.get("collection")
+        child = parent.child(
+            f"mongo.{event.command_name}",
+            CLIENT,
+            **{
+                "db.system": "mongodb",
+                "db.name": event.database_name,
+                "db.operation": event.command_name,
+                "db.mongodb.collection": collection if isinstance(collection, str) else None
+            }
+        )
+        if child is not None:
+            with self.lock:
+                self.pending[(event.connection_id, event.request_id)] = child
+
+    def _finish(self, event, error: Optional[str] = None):
+        with self.lock:
+            child = self.pending.pop((event.connection_id, event.request_id), None)
+        if child is not None:
+            child.end(error)
+
+    def succeeded(self, event):
+        self._finish(event)
+
+    def failed(self, event):
+        self._finish(event, str(event.failure.get("codeName") or event.failure.get("errmsg") or "failed"))
+
+class TracedJSONResponse(JSONResponse):
+    """JSON response whose encoding is timed as its own span"""
+
+    def render(self, content: Any) -> bytes:
+        with span("serialize.json"):
+            return super().render(content)
+
+def instrument_response_validation():
+    """Time FastAPI's response model validation and encoding as a span of each request"""
+    serialize_response = routing.serialize_response
+    if getattr(serialize_response, "traced", False):
+        return
+
+    async def traced_serialize_response(*args, **kwargs):
+        with span("serialize.validate"):
+            return await serialize_response(*args, **kwargs)
+
+    traced_serialize_response.traced = True
+    routing.serialize_response = traced_serialize_response
+
+def tracer_from_env() -> Optional[Tracer]:
+    """Build a tracer from TRACE_* and OTEL_* settings, or None when no export destination is set"""
+    endpoint = os.environ.get('OTEL_EXPORTER_OTLP_ENDPOINT')
+    path = os.environ.get('TRACE_EXPORT_FILE')
+    if not endpoint and not path:
+        return None
+    sampler = TailSampler(
+        slow_seconds=float(os.environ.get('TRACE_SLOW_MS', '500')) / 1000,
+        sample_rate=float(os.environ.get('TRACE_SAMPLE_RATE', '0.01'))
+    )
+    exporter = OtlpExporter(os.environ.get('OTEL_SERVICE_NAME', 'bdoh-api'), endpoint=endpoint, path=path)
+    return Tracer(sampler, exporter)
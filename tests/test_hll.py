@@ -0,0 +1,67 @@
+"""
+Tests for the HyperLogLog distinct-count sketch behind active-user counts.
+"""
+
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+sys.path.insert(0, str(BACKEND_DIR))
+
+from hll import HyperLogLog, REGISTERS
+
+def sketch_of(values) -> HyperLogLog:
+    sketch = HyperLogLog()
+    for value in values:
+        sketch.add(value)
+    return sketch
+
+def test_empty_sketch_counts_zero():
+    assert HyperLogLog().count() == 0
+
+@pytest.mark.parametrize("distinct", [1, 10, 1000, 50000])
+def test_count_is_within_a_few_standard_errors(distinct):
+    estimate = sketch_of(f"user-{number}" for number in range(distinct)).count()
+    # About 2.3% standard error; linear counting is near exact for small counts
+    assert abs(estimate - distinct) <= max(1, 0.07 * distinct)
+
+def test_duplicates_do_not_change_the_sketch():
+    sketch = sketch_of(f"user-{number}" for number in range(500))
+    registers = bytes(sketch.registers)
+    assert not any(sketch.add(f"user-{number}") for number in range(500))
+    assert bytes(sketch.registers) == registers
+
+def test_merge_equals_the_sketch_of_the_union():
+    first = sketch_of(f"user-{number}" for number in range(0, 3000))
+    second = sketch_of(f"user-{number}" for number in range(2000, 5000))
+    both = sketch_of(f"user-{number}" for number in range(0, 5000))
+
+    assert HyperLogLog.union([first, second]).registers == both.registers
+    assert first.merge(second).registers == both.registers
+
+def test_registers_round_trip():
+    sketch = sketch_of(["alice", "bob"])
+    restored = HyperLogLog(bytes(sketch.registers))
+    assert restored.registers == sketch.registers
+    assert len(restored.registers) == REGISTERS
+    assert restored.count() == 2
+
+def test_hashing_agrees_across_processes():
+    # Workers merge each other's sketches, so register placement cannot depend on PYTHONHASHSEED
+    script = "from hll import HyperLogLog; s = HyperLogLog(); s.add('alice'); print(s.registers.hex())"
+    outputs = {
+        subprocess.run(
+            [sys.executable, "-c", script],
+            cwd=BACKEND_DIR,
+            env={**os.environ, "PYTHONHASHSEED": seed},
+            capture_output=True,
+            text=True,
+            check=True
+        ).stdout.strip()
+        for seed in ("1", "2")
+    }
+    assert outputs == {sketch_of(["alice"]).registers.hex()}
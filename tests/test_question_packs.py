@@ -0,0 +1,92 @@
+"""
+Tests for per-participant competition question packs.
+"""
+
+import json
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from models import Competition, Question
+from question_packs import PACK_FIELDS, QuestionPack
+
+NOW = datetime(2026, 1, 1, 12, 0)
+
+def make_pack(question_count: int = 6) -> QuestionPack:
+    questions = {
+        f"q{number}": Question(
+            id=f"q{number}",
+            subject="math",
+            title=f"Question {number}",
+            question_text="Pick the right one — “carefully”",
+            options=[f"option {number}.{index}" for index in range(4)],
+            correct_answer=number % 4,
+            explanation="Secret explanation",
+            created_by="admin",
+            tags=["algebra"]
+        )
+        for number in range(question_count)
+    }
+    competition = Competition(
+        id="competition-1",
+        title="Spring Olympiad",
+        description="",
+        subject="math",
+        duration_minutes=60,
+        total_questions=question_count,
+        start_date=NOW,
+        end_date=NOW + timedelta(hours=1),
+        questions=list(questions) + ["missing"],
+        prizes="",
+        created_by="admin"
+    )
+    return QuestionPack(competition, questions)
+
+def test_pack_is_valid_json_without_answers():
+    pack = json.loads(make_pack().render("alice"))
+    assert pack["competition_id"] == "competition-1"
+    assert pack["ends_at"] == (NOW + timedelta(hours=1)).isoformat()
+    assert len(pack["questions"]) == 6  # Unknown question IDs are skipped
+
+    for question in pack["questions"]:
+        assert set(question) == set(PACK_FIELDS) | {"options"}
+        assert "correct_answer" not in question and "explanation" not in question
+        assert question["question_text"] == "Pick the right one — “carefully”"
+        # Options keep their original index, which is what participants answer with
+        number = question["id"][1:]
+        assert sorted((option["index"], option["text"]) for option in question["options"]) == [
+            (index, f"option {number}.{index}") for index in range(4)
+        ]
+
+    assert b"Secret explanation" not in make_pack().render("alice")
+
+def test_order_is_stable_per_participant_and_differs_between_participants():
+    pack = make_pack(12)
+    assert pack.render("alice") == pack.render("alice")
+    assert make_pack(12).render("alice") == pack.render("alice")  # Seeded, not tied to this process's pack
+
+    def order(user_id: str):
+        questions = json.loads(pack.render(user_id))["questions"]
+        return [(question["id"], [option["index"] for option in question["options"]]) for question in questions]
+
+    orders = {json.dumps(order(f"user-{number}")) for number in range(10)}
+    assert len(orders) > 1
+    assert {question_id for question_id, _ in order("alice")} == {f"q{number}" for number in range(12)}
+
+def test_empty_pack_renders():
+    pack = QuestionPack(Competition(
+        id="empty",
+        title="Empty",
+        description="",
+        subject="math",
+        duration_minutes=10,
+        total_questions=0,
+        start_date=NOW,
+        end_date=NOW,
+        prizes="",
+        created_by="admin"
+    ), {})
+    assert json.loads(pack.render("alice"))["questions"] == []
+    assert pack.size == 0
@@ -0,0 +1,102 @@
+"""
+Tests for the token-bucket rate limiter and the per-user answer limit.
+"""
+
+import asyncio
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from fastapi import HTTPException
+from fastapi.security import HTTPAuthorizationCredentials
+from starlette.requests import Request
+
+import rate_limit
+from rate_limit import RateLimiter, client_ip, limit_by_user
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(rate_limit.time, "monotonic", clock)
+    return clock
+
+def request_from(host: str, forwarded_for: str = None) -> Request:
+    headers = [(b"x-forwarded-for", forwarded_for.encode())] if forwarded_for else []
+    return Request({"type": "http", "method": "POST", "path": "/", "headers": headers, "client": (host, 1234)})
+
+def test_burst_then_refill_at_rate(clock):
+    limiter = RateLimiter(rate=2, burst=3)
+    assert [limiter.acquire("alice") for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert limiter.acquire("alice") == pytest.approx(0.5)
+    assert limiter.acquire("bob") == 0.0  # Buckets are per key
+
+    clock.now += 0.5
+    assert limiter.acquire("alice") == 0.0
+    assert limiter.acquire("alice") > 0
+
+    # Refills never exceed the burst
+    clock.now += 60
+    assert [limiter.acquire("alice") for _ in range(4)][-1] > 0
+
+def test_check_raises_429_with_retry_after(clock):
+    limiter = RateLimiter(rate=0.1, burst=1)
+    limiter.check("alice")
+    with pytest.raises(HTTPException) as raised:
+        limiter.check("alice")
+    assert raised.value.status_code == 429
+    assert raised.value.headers["Retry-After"] == "10"
+
+def test_least_recently_used_keys_are_evicted(clock):
+    limiter = RateLimiter(rate=1, burst=1, max_keys=2)
+    limiter.acquire("alice")
+    limiter.acquire("bob")
+    limiter.acquire("alice")  # Touching alice makes bob the oldest
+    limiter.acquire("carol")
+    assert list(limiter.buckets) == ["alice", "carol"]
+
+def test_client_ip_trusts_forwarded_for_only_when_asked():
+    request = request_from("10.0.0.1", "203.0.113.7, 10.0.0.1")
+    assert client_ip(request) == "10.0.0.1"
+    assert client_ip(request, trust_forwarded_for=True) == "203.0.113.7"
+
+def test_answer_limit_checks_the_ip_before_authenticating_and_then_the_user(clock, monkeypatch):
+    authenticated = []
+
+    async def get_current_user(credentials):
+        authenticated.append(credentials.credentials)
+        if credentials.credentials != "valid":
+            raise HTTPException(status_code=401)
+        return type("User", (), {"id": "user-1"})()
+
+    monkeypatch.setattr(rate_limit, "get_current_user", get_current_user)
+    dependency = limit_by_user(RateLimiter(rate=1, burst=2), RateLimiter(rate=1, burst=3))
+
+    def submit(token: str, host: str = "198.51.100.1"):
+        return asyncio.run(dependency(request_from(host), HTTPAuthorizationCredentials(scheme="Bearer", credentials=token)))
+
+    # Fresh garbage tokens share the client's IP bucket, so they stop costing session reads
+    for number in range(3):
+        with pytest.raises(HTTPException) as raised:
+            submit(f"garbage-{number}")
+        assert raised.value.status_code == 401
+    with pytest.raises(HTTPException) as raised:
+        submit("garbage-3")
+    assert raised.value.status_code == 429
+    assert authenticated == ["garbage-0", "garbage-1", "garbage-2"]
+
+    # A real user is limited by user ID, whichever address the requests come from
+    assert submit("valid", "198.51.100.2").id == "user-1"
+    assert submit("valid", "198.51.100.3").id == "user-1"
+    with pytest.raises(HTTPException) as raised:
+        submit("valid", "198.51.100.4")
+    assert raised.value.status_code == 429
@@ -0,0 +1,132 @@
+"""
+Correctness tests for the in-memory BM25 question search index.
+"""
+
+import asyncio
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from search_index import SearchIndex, decode_search_cursor
+
+def question(question_id: str, title: str, subject: str = "math", difficulty: str = "easy", **overrides):
+    return {
+        "id": question_id,
+        "title": title,
+        "question_text": "",
+        "explanation": "",
+        "tags": [],
+        "subject": subject,
+        "difficulty": difficulty,
+        "is_active": True,
+        **overrides
+    }
+
+def ids(hits):
+    return [question_id for question_id, _ in hits]
+
+def all_pages(index: SearchIndex, query: str, limit: int, **filters):
+    """Follow next cursors until the last page, returning every hit in order"""
+    hits, cursor = index.search(query, limit=limit, **filters)
+    while cursor:
+        page, cursor = index.search(query, limit=limit, cursor=cursor, **filters)
+        hits += page
+    return hits
+
+def test_ranking_order():
+    index = SearchIndex()
+    index.add(question("text", "Geometry", question_text="prime"))
+    index.add(question("title", "Prime numbers"))
+    index.add(question("twice", "Prime prime numbers"))
+    index.add(question("other", "Fractions"))
+
+    hits, cursor = index.search("prime")
+    assert ids(hits) == ["twice", "title", "text"]
+    assert hits[0][1] > hits[1][1] > hits[2][1] > 0
+    assert cursor is None
+
+    # Matching ignores case and punctuation, and stopwords match nothing
+    assert index.search("PRIME!")[0] == hits
+    assert ids(index.search("the of")[0]) == []
+
+def test_keyset_paging_covers_every_hit_once_in_order():
+    index = SearchIndex()
+    for number in range(25):
+        index.add(question(f"q{number:02d}", "prime " * (1 + number % 4) + f"filler{number}"))
+
+    everything, _ = index.search("prime", limit=100)
+    paged = all_pages(index, "prime", limit=7)
+    assert ids(paged) == ids(everything)
+    assert len(set(ids(paged))) == 25
+
+    # Equal scores are ordered by question ID, so ties never repeat or skip across pages
+    for (first_id, first_score), (second_id, second_score) in zip(paged, paged[1:]):
+        assert first_score > second_score or (first_score == second_score and first_id < second_id)
+
+def test_cursors_name_the_last_hit_and_malformed_ones_are_rejected():
+    index = SearchIndex()
+    index.add(question("q1", "prime"))
+    with pytest.raises(ValueError):
+        index.search("prime", cursor="not a cursor")
+    index.add(question("q2", "prime"))
+    _, cursor = index.search("prime", limit=1)
+    assert decode_search_cursor(cursor)[1] == "q1"
+
+def test_subject_and_difficulty_filters():
+    index = SearchIndex()
+    index.add(question("math-easy", "prime", "math", "easy"))
+    index.add(question("math-hard", "prime", "math", "hard"))
+    index.add(question("physics-easy", "prime", "physics", "easy"))
+
+    assert sorted(ids(index.search("prime", subject="math")[0])) == ["math-easy", "math-hard"]
+    assert sorted(ids(index.search("prime", difficulty="easy")[0])) == ["math-easy", "physics-easy"]
+    assert ids(index.search("prime", subject="math", difficulty="hard")[0]) == ["math-hard"]
+    assert ids(index.search("prime", subject="biology")[0]) == []
+    assert ids(all_pages(index, "prime", limit=1, subject="math")) == ids(index.search("prime", subject="math")[0])
+
+def test_removed_and_updated_questions_stay_out_before_and_after_compaction():
+    index = SearchIndex()
+    for number in range(8):
+        index.add(question(f"q{number}", f"prime topic{number}"))
+    index.remove("q1")
+    index.add(question("q2", "composite"))  # Updated: the old postings are tombstoned
+    index.add(question("q3", "prime", is_active=False))  # Deactivated
+
+    expected = ["q0", "q4", "q5", "q6", "q7"]
+    assert sorted(ids(index.search("prime", limit=100)[0])) == expected
+    assert ids(index.search("composite")[0]) == ["q2"]
+    assert index.needs_compaction
+    before = index.search("prime", limit=100)[0]
+
+    # Scores change as tombstoned postings stop counting towards document frequency; results do not
+    assert asyncio.run(index.compact())
+    assert not index.needs_compaction
+    assert ids(index.search("prime", limit=100)[0]) == ids(before)
+    assert ids(index.search("composite")[0]) == ["q2"]
+    assert ids(index.search("topic1")[0]) == []
+
+    # The index keeps working incrementally after compaction
+    index.remove("q0")
+    index.add(question("q8", "prime"))
+    assert sorted(ids(index.search("prime", limit=100)[0])) == ["q4", "q5", "q6", "q7", "q8"]
+
+def test_compaction_of_an_outdated_snapshot_is_discarded():
+    index = SearchIndex()
+    for number in range(4):
+        index.add(question(f"q{number}", "prime"))
+    index.remove("q0")
+    index.remove("q1")
+
+    async def compact_while_editing():
+        compaction = asyncio.create_task(index.compact())
+        await asyncio.sleep(0)  # Let the snapshot be taken before the edit
+        index.add(question("q4", "prime"))
+        return await compaction
+
+    assert not asyncio.run(compact_while_editing())
+    assert sorted(ids(index.search("prime")[0])) == ["q2", "q3", "q4"]
+    assert asyncio.run(index.compact())
+    assert sorted(ids(index.search("prime")[0])) == ["q2", "q3", "q4"]
@@ -0,0 +1,154 @@
+"""
+Tests for the SingleFlight read coalescer that callers rely on.
+"""
+
+import asyncio
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from singleflight import SingleFlight
+
+class Fetcher:
+    """A fetch that returns its call number, but only once released"""
+
+    def __init__(self):
+        self.calls = 0
+        self.release = asyncio.Event()
+
+    async def __call__(self):
+        self.calls += 1
+        call = self.calls
+        await self.release.wait()
+        return call
+
+async def settle():
+    """Let every ready task run"""
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+def test_concurrent_callers_share_one_fetch():
+    async def scenario():
+        flight, fetch = SingleFlight(), Fetcher()
+        callers = [asyncio.ensure_future(flight.do(("key",), fetch)) for _ in range(10)]
+        await settle()
+        fetch.release.set()
+        results = await asyncio.gather(*callers)
+        assert results == [1] * 10
+        assert fetch.calls == 1
+
+        # Nothing is cached without a fresh window, so the next call fetches again
+        assert await flight.do(("key",), fetch) == 2
+
+    asyncio.run(scenario())
+
+def test_cancelled_caller_does_not_cancel_the_shared_fetch():
+    async def scenario():
+        flight, fetch = SingleFlight(), Fetcher()
+        cancelled = asyncio.ensure_future(flight.do(("key",), fetch))
+        waiting = asyncio.ensure_future(flight.do(("key",), fetch))
+        await settle()
+        cancelled.cancel()
+        await settle()
+        fetch.release.set()
+
+        assert await waiting == 1
+        assert cancelled.cancelled()
+        assert fetch.calls == 1
+
+    asyncio.run(scenario())
+
+def test_errors_reach_every_waiter_and_are_not_cached():
+    async def scenario():
+        flight = SingleFlight()
+
+        async def failing():
+            await asyncio.sleep(0)
+            raise RuntimeError("down")
+
+        callers = [asyncio.ensure_future(flight.do(("key",), failing, fresh_for=60)) for _ in range(3)]
+        results = await asyncio.gather(*callers, return_exceptions=True)
+        assert all(isinstance(result, RuntimeError) for result in results)
+        assert not flight.results and not flight.inflight
+
+    asyncio.run(scenario())
+
+def test_stale_window_serves_the_old_value_and_refreshes_once():
+    async def scenario():
+        flight, fetch = SingleFlight(), Fetcher()
+        fetch.release.set()
+        assert await flight.do(("key",), fetch, fresh_for=0.05, stale_for=60) == 1
+        assert await flight.do(("key",), fetch, fresh_for=0.05, stale_for=60) == 1
+        assert fetch.calls == 1
+
+        await asyncio.sleep(0.06)
+        fetch.release.clear()
+        stale = await asyncio.gather(*(flight.do(("key",), fetch, fresh_for=0.05, stale_for=60) for _ in range(5)))
+        assert stale == [1] * 5
+        await settle()
+        assert fetch.calls == 2
+
+        fetch.release.set()
+        await settle()
+        assert await flight.do(("key",), fetch, fresh_for=0.05, stale_for=60) == 2
+        assert fetch.calls == 2
+
+    asyncio.run(scenario())
+
+@pytest.mark.parametrize("forget", [
+    lambda flight: flight.forget(("user",)),
+    lambda flight: flight.forget(),
+    lambda flight: flight.forget_key(("user", 1))
+])
+def test_forget_detaches_an_inflight_fetch(forget):
+    async def scenario():
+        flight, fetch = SingleFlight(), Fetcher()
+        before = asyncio.ensure_future(flight.do(("user", 1), fetch, fresh_for=60))
+        await settle()
+        forget(flight)
+
+        # A caller arriving after the write starts its own fetch instead of joining the old one
+        after = asyncio.ensure_future(flight.do(("user", 1), fetch, fresh_for=60))
+        await settle()
+        fetch.release.set()
+        assert await before == 1
+        assert await after == 2
+        assert fetch.calls == 2
+
+        # Only the fetch started after forgetting is cached
+        assert await flight.do(("user", 1), fetch, fresh_for=60) == 2
+        assert fetch.calls == 2
+
+    asyncio.run(scenario())
+
+def test_forget_drops_only_matching_keys():
+    async def scenario():
+        flight = SingleFlight()
+
+        async def fetch():
+            return "value"
+
+        for key in [("user", 1), ("user", 2), ("stats",), ("user",)]:
+            await flight.do(key, fetch, fresh_for=60)
+        flight.forget_key(("user", 1))
+        assert set(flight.results) == {("user", 2), ("stats",), ("user",)}
+        flight.forget(("user",))
+        assert set(flight.results) == {("stats",)}
+
+    asyncio.run(scenario())
+
+def test_results_are_bounded_least_recently_used_first():
+    async def scenario():
+        flight = SingleFlight(max_results=2)
+
+        async def fetch():
+            return "value"
+
+        for key in [("a",), ("b",), ("c",)]:
+            await flight.do(key, fetch, fresh_for=60)
+        assert list(flight.results) == [("b",), ("c",)]
+
+    asyncio.run(scenario())
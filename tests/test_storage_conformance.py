@@ -0,0 +1,393 @@
+"""
+Conformance tests every storage backend must pass.
+
+The in-memory backend always runs; the MongoDB backend runs too when MONGO_URL
+is set, each test against a throwaway database that is dropped afterwards.
+"""
+
+import asyncio
+import os
+import sys
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from pymongo.errors import DuplicateKeyError
+
+from memory_storage import InMemoryStorage
+from ratings import INITIAL_RATING, MIN_RATED_ANSWERS, PROVISIONAL_K
+from storage import Storage
+
+BACKENDS = ["memory"] + (["mongo"] if os.environ.get("MONGO_URL") else [])
+NOW = datetime.utcnow().replace(microsecond=0)
+
+@pytest.fixture(params=BACKENDS)
+def backend(request):
+    return request.param
+
+def run(backend: str, scenario):
+    """Run an async scenario against a fresh, empty storage of the given backend"""
+    async def main():
+        if backend == "memory":
+            storage: Storage = InMemoryStorage()
+        else:
+            from database import Database
+            storage = Database(os.environ["MONGO_URL"], f"conformance_{uuid.uuid4().hex[:12]}")
+        await storage.create_indexes()
+        try:
+            return await scenario(storage)
+        finally:
+            if backend == "mongo":
+                await storage.client.drop_database(storage.db.name)
+            await storage.close()
+
+    return asyncio.run(main())
+
+def question_data(subject: str = "math", **overrides):
+    return {
+        "subject": subject,
+        "title": "Sum",
+        "question_text": "What is 1 + 1?",
+        "options": ["1", "2", "3"],
+        "correct_answer": 1,
+        "explanation": "Count",
+        "created_by": "admin",
+        **overrides
+    }
+
+def competition_data(**overrides):
+    return {
+        "title": "Weekly",
+        "description": "Weekly round",
+        "subject": "math",
+        "duration_minutes": 30,
+        "start_date": NOW + timedelta(hours=1),
+        "end_date": NOW + timedelta(hours=2),
+        "prizes": "Medals",
+        "created_by": "admin",
+        **overrides
+    }
+
+async def create_user(storage: Storage, name: str):
+    return await storage.create_user({"email": f"{name}@example.com", "name": name})
+
+def test_users(backend):
+    async def scenario(storage: Storage):
+        user = await create_user(storage, "ana")
+        assert (await storage.get_user_by_email("ana@example.com")).id == user.id
+        assert (await storage.get_user_by_id(user.id)).name == "ana"
+        assert await storage.get_user_by_id("missing") is None
+        with pytest.raises(DuplicateKeyError):
+            await create_user(storage, "ana")
+
+    run(backend, scenario)
+
+def test_login_user(backend):
+    async def scenario(storage: Storage):
+        interval = timedelta(minutes=15)
+        user, created = await storage.login_user({"email": "ana@example.com", "name": "ana", "role": "admin"}, NOW, interval)
+        assert created and (user.role, user.last_login) == ("admin", NOW)
+
+        # Existing users keep their fields, and last_login only moves once it is older than the interval
+        again, created = await storage.login_user({"email": "ana@example.com", "name": "other", "role": "user"}, NOW + timedelta(minutes=5), interval)
+        assert not created and (again.id, again.name, again.role, again.last_login) == (user.id, "ana", "admin", NOW)
+        later, _ = await storage.login_user({"email": "ana@example.com", "name": "ana"}, NOW + interval, interval)
+        assert later.last_login == NOW + interval
+        assert (await storage.get_user_by_id(user.id)).last_login == NOW + interval
+
+        other, created = await storage.login_user({"email": "ben@example.com", "name": "ben"}, NOW, interval)
+        assert created and other.id != user.id
+
+    run(backend, scenario)
+
+def test_sessions(backend):
+    async def scenario(storage: Storage):
+        await storage.create_session({"user_id": "u1", "session_token": "live", "expires_at": NOW + timedelta(days=1)})
+        await storage.create_session({"user_id": "u1", "session_token": "expired", "expires_at": NOW - timedelta(days=1)})
+        assert (await storage.get_session_by_token("live")).user_id == "u1"
+        assert await storage.get_session_by_token("expired") is None
+
+        await storage.deactivate_session("live")
+        assert await storage.get_session_by_token("live") is None
+
+    run(backend, scenario)
+
+def test_questions(backend):
+    async def scenario(storage: Storage):
+        first = await storage.create_question(question_data())
+        second = await storage.create_question(question_data("physics"))
+        third = await storage.create_question(question_data())
+        assert first.ordinal < second.ordinal < third.ordinal
+
+        assert [q.id for q in await storage.get_questions("math")] == [first.id, third.id]
+        assert [q.id for q in await storage.get_questions_by_ids([third.id, "missing", first.id])] == [third.id, first.id]
+        assert await storage.get_subject_question_counts() == {"math": 2, "physics": 1}
+
+        assert await storage.update_question(first.id, {"title": "Addition"}) is True
+        assert await storage.update_question(first.id, {"title": "Addition"}) is False
+        assert (await storage.get_public_question(first.id)).title == "Addition"
+
+        assert await storage.delete_question(second.id) is True
+        assert await storage.delete_question(second.id) is False
+        assert await storage.get_question_by_id(second.id) is None
+        assert len(await storage.get_admin_questions(include_inactive=True)) == 3
+        entries = [entry async for entry in storage.iter_question_index_entries(["title"])]
+        assert sorted(entry["id"] for entry in entries) == sorted([first.id, third.id])
+        assert all(set(entry) == {"id", "ordinal", "subject", "difficulty", "tags", "is_active", "title"} for entry in entries)
+
+        await storage.update_question_stats(first.id, True, 10)
+        await storage.update_question_stats(first.id, False, 30)
+        storage.record_question_rating_change(first.id, -5.0)
+        storage.record_question_rating_change(first.id, -3.0)
+        await storage.flush_question_ratings()
+        stats = {q.id: q for q in await storage.get_admin_questions("math")}[first.id]
+        assert (stats.stats.attempts, stats.stats.correct, stats.stats.accuracy, stats.stats.average_time) == (2, 1, 0.5, 20.0)
+        assert stats.rating == pytest.approx(INITIAL_RATING - 8.0)
+
+        answer_key = await storage.get_answer_key([first.id, second.id])
+        assert list(answer_key) == [first.id] and answer_key[first.id].correct_answer == 1
+
+    run(backend, scenario)
+
+def test_answer_history_pages(backend):
+    async def scenario(storage: Storage):
+        for offset in range(5):
+            await storage.save_user_answer({
+                "user_id": "u1",
+                "question_id": f"q{offset}",
+                "selected_answer": 0,
+                "is_correct": offset % 2 == 0,
+                "time_taken": 5,
+                "subject": "math" if offset < 3 else "physics",
+                "created_at": NOW + timedelta(seconds=offset)
+            })
+
+        pages, cursor = [], None
+        while True:
+            answers, cursor = await storage.get_user_answer_history("u1", limit=2, cursor=cursor)
+            pages.append([answer.question_id for answer in answers])
+            if not cursor:
+                break
+        assert pages == [["q4", "q3"], ["q2", "q1"], ["q0"]]
+
+        answers, cursor = await storage.get_user_answer_history("u1", subject="physics", limit=2)
+        assert ([answer.question_id for answer in answers], cursor) == (["q4", "q3"], None)
+        assert [answer.question_id for answer in await storage.get_user_answers("u1", "q2")] == ["q2"]
+        assert sorted(await storage.get_answered_question_ids("u1")) == ["q0", "q1", "q2", "q3", "q4"]
+        with pytest.raises(ValueError):
+            await storage.get_user_answer_history("u1", cursor="not a cursor")
+
+    run(backend, scenario)
+
+def test_rollups_and_answered_bits(backend):
+    async def scenario(storage: Storage):
+        assert (await storage.get_user_rollup("u1")).overall.attempts == 0
+        await storage.update_user_rollup("u1", "math", "easy", True, 10)
+        await storage.update_user_rollup("u1", "math", "hard", False, 30)
+        rollup = await storage.get_user_rollup("u1")
+        assert (rollup.overall.attempts, rollup.overall.accuracy, rollup.overall.average_time) == (2, 0.5, 20.0)
+        assert rollup.subjects["math"].difficulties["easy"].accuracy == 1.0
+
+        assert await storage.get_answered_words("u1") is None
+        await storage.set_answered_bits("u1", {})
+        assert await storage.get_answered_words("u1") == {}
+        await storage.set_answered_bits("u1", {0: 0b0101, 3: 1})
+        await storage.set_answered_bits("u1", {0: 0b0010})
+        assert await storage.get_answered_words("u1") == {0: 0b0111, 3: 1}
+        await storage.set_answered_bits("u2", {0: 1}, create=False)
+        assert await storage.get_answered_words("u2") is None
+
+    run(backend, scenario)
+
+def test_scores_and_leaderboards(backend):
+    async def scenario(storage: Storage):
+        ana, ben = await create_user(storage, "ana"), await create_user(storage, "ben")
+        score = await storage.update_user_score(ana.id, "math", 10, True)
+        assert score["questions_answered"] == 1
+        assert score["rating_change"] == pytest.approx(PROVISIONAL_K / 2)
+        assert score["rating"] == pytest.approx(INITIAL_RATING + PROVISIONAL_K / 2)
+
+        for _ in range(MIN_RATED_ANSWERS):
+            await storage.update_user_score(ben.id, "math", 10, True)
+        await storage.update_user_score("no-such-user", "math", 1000, True)
+
+        assert [row["user_id"] for row in await storage.get_leaderboard("math")] == [ben.id, ana.id]
+        assert [row["user_id"] for row in await storage.get_leaderboard(limit=1)] == [ben.id]
+        ratings = await storage.get_rating_leaderboard("math")
+        assert [row["user_id"] for row in ratings] == [ben.id]
+        assert ratings[0]["rating"] == round(ratings[0]["rating"])
+
+        scores = await storage.get_user_score(ben.id, "math")
+        assert (scores[0].total_score, scores[0].questions_answered, scores[0].correct_answers) == (100, 10, 10)
+
+        await storage.update_user_score(ana.id, "physics", 5, True)
+        standings = await storage.get_user_standings(ana.id)
+        assert [(standing.subject, standing.rank, standing.total_score) for standing in standings] == [("math", 3, 10), ("physics", 1, 5)]
+        assert await storage.get_user_standings("nobody") == []
+
+        rows = [row async for batch in storage.iter_score_export("math", batch_size=2) for row in batch]
+        assert [(row["rank"], row["user_id"]) for row in rows] == [(1, "no-such-user"), (2, ben.id), (3, ana.id)]
+        assert rows[1]["user_name"] == "ben"
+
+    run(backend, scenario)
+
+def test_competitions(backend):
+    async def scenario(storage: Storage):
+        ana, ben, cy = [await create_user(storage, name) for name in ("ana", "ben", "cy")]
+        later = await storage.create_competition(competition_data(start_date=NOW + timedelta(days=1), end_date=NOW + timedelta(days=2)))
+        competition = await storage.create_competition(competition_data(questions=["q1", "q2"]))
+        assert competition.total_questions == 2
+        assert [c.id for c in await storage.get_competitions()] == [competition.id, later.id]
+        assert {c.id for c in await storage.get_scheduled_competitions()} == {competition.id, later.id}
+
+        assert await storage.set_competition_status(competition.id, ["upcoming"], "live") is True
+        assert await storage.set_competition_status(competition.id, ["upcoming"], "live") is False
+        assert [c.id for c in await storage.get_competitions("live")] == [competition.id]
+
+        answers = [(ana, 10, 20), (ben, 10, 20), (cy, 10, 5), (cy, 0, 5), (ana, 10, 99)]
+        for offset, (user, points, time_taken) in enumerate(answers):
+            await storage.save_user_answer({
+                "user_id": user.id,
+                "question_id": "q1",
+                "selected_answer": 0,
+                "is_correct": points > 0,
+                "time_taken": time_taken,
+                "competition_id": competition.id,
+                "points_earned": points,
+                # The last answer arrives after the competition ends
+                "created_at": competition.end_date + timedelta(seconds=1) if offset == 4 else NOW
+            })
+
+        live = [row async for batch in storage.iter_competition_results(competition.id) for row in batch]
+        assert [(row["rank"], row["user_name"]) for row in live] == [(1, "ana"), (2, "cy"), (3, "ben")]
+
+        assert await storage.finalize_competition_results(competition.id, competition.end_date) == 3
+        results = await storage.get_competition_results(competition.id)
+        # Answers after the end are left out, so cy's shorter time now wins and ana ties with ben
+        assert [(row.rank, row.user_id) for row in results] == [(1, cy.id)] + sorted([(2, ana.id), (2, ben.id)])
+        assert [row.user_id for row in await storage.get_competition_results(competition.id, limit=1, skip=2)] == [results[2].user_id]
+
+        final = [row async for batch in storage.iter_competition_results(competition.id, batch_size=2) for row in batch]
+        assert [row["user_id"] for row in final] == [row.user_id for row in results]
+        assert "finalized_at" not in final[0] and final[0]["email"].endswith("@example.com")
+
+        assert await storage.set_competition_status(competition.id, ["live"], "completed") is True
+        finished = await storage.get_competition(competition.id)
+        assert (finished.status, finished.participant_count) == ("completed", 3)
+        assert [c.id for c in await storage.get_scheduled_competitions()] == [later.id]
+
+    run(backend, scenario)
+
+def test_leases(backend):
+    async def scenario(storage: Storage):
+        assert await storage.acquire_lease("scheduler", "a", 30) is True
+        assert await storage.acquire_lease("scheduler", "b", 30) is False
+        assert await storage.acquire_lease("scheduler", "a", 30) is True
+        await storage.release_lease("scheduler", "b")
+        assert await storage.acquire_lease("scheduler", "b", 30) is False
+        await storage.release_lease("scheduler", "a")
+        assert await storage.acquire_lease("scheduler", "b", -1) is True
+        # An expired lease can be taken over
+        assert await storage.acquire_lease("scheduler", "a", 30) is True
+
+    run(backend, scenario)
+
+def test_content_and_image_variants(backend):
+    async def scenario(storage: Storage):
+        panelist = await storage.create_panelist({"name": "Dr. Rahman", "title": "Coach", "bio": "Bio", "image": "raw", "created_by": "admin"})
+        variants = {"thumbnail": (b"small", "v1"), "medium": (b"large", "v1")}
+        urls = await storage.set_image_variants("panelists", panelist.id, variants, "image/webp")
+        assert urls["thumbnail_url"] == f"/api/images/{panelist.id}/thumbnail?v=v1"
+
+        listed = (await storage.get_panelists())[0]
+        assert (listed.image, listed.medium_url) == (None, urls["medium_url"])
+        variant = await storage.get_image_variant(panelist.id, "thumbnail")
+        assert (variant["data"], variant["version"], variant["content_type"]) == (b"small", "v1", "image/webp")
+
+        await storage.set_image_variants("panelists", panelist.id, {"thumbnail": (b"smaller", "v2")}, "image/webp")
+        assert await storage.get_image_variant(panelist.id, "medium") is None
+        assert [doc async for doc in storage.iter_owner_images("panelists")] == []
+
+        await storage.set_image_variants("panelists", panelist.id, {}, "image/webp")
+        assert (await storage.get_panelists())[0].thumbnail_url is None
+        assert [doc async for doc in storage.iter_owner_images("panelists")] == [{"id": panelist.id, "image": "raw"}]
+
+        assert await storage.update_panelist(panelist.id, {"bio": "New bio"}) is True
+        assert await storage.delete_panelist(panelist.id) is True
+        assert await storage.get_panelists() == []
+
+        admin = await storage.create_admin_member({"name": "Lee", "position": "Chair", "department": "Board", "bio": "Bio", "created_by": "admin"})
+        assert [member.id for member in await storage.get_admin_members()] == [admin.id]
+
+        second = await storage.create_club_info({"section": "about", "title": "B", "content": "B", "order": 2, "created_by": "admin"})
+        first = await storage.create_club_info({"section": "about", "title": "A", "content": "A", "order": 1, "created_by": "admin"})
+        await storage.create_club_info({"section": "founder", "title": "F", "content": "F", "created_by": "admin"})
+        assert [info.id for info in await storage.get_club_info("about")] == [first.id, second.id]
+        assert await storage.update_club_info(second.id, {"is_active": False}) is True
+        assert [info.id for info in await storage.get_club_info("about")] == [first.id]
+
+    run(backend, scenario)
+
+def test_activity_and_stats(backend):
+    async def scenario(storage: Storage):
+        await create_user(storage, "ana")
+        await storage.create_question(question_data())
+        await storage.record_answer_activity("u1", "math", True, NOW)
+        await storage.record_answer_activity("u1", "math", False, NOW)
+        await storage.record_answer_activity("u2", "physics", True, NOW)
+
+        day = (await storage.get_activity("day", NOW, NOW))[0]
+        assert (day.answers, day.correct, day.distinct_users, day.signups) == (3, 2, 2, 1)
+        hours = await storage.get_activity("hour", NOW - timedelta(hours=2), NOW, "math")
+        assert [(bucket.answers, bucket.distinct_users) for bucket in hours] == [(0, 0), (0, 0), (2, 1)]
+        with pytest.raises(ValueError):
+            await storage.get_activity("week", NOW, NOW)
+        with pytest.raises(ValueError):
+            await storage.get_activity("hour", NOW, NOW - timedelta(hours=1))
+
+        storage.record_active_user("u1", NOW)
+        storage.record_active_user("u2", NOW)
+        await storage.flush_active_users()
+        storage.record_active_user("u3", NOW)
+        assert (await storage.get_active_user_counts(NOW))["daily"] == 3
+
+        stats = await storage.get_stats()
+        assert (stats["total_users"], stats["total_questions"], stats["total_competitions"]) == (1, 1, 0)
+        assert len(stats["recent_activities"]) == 7
+
+    run(backend, scenario)
+
+def test_achievements(backend):
+    async def scenario(storage: Storage):
+        progress = await storage.update_achievement_progress("u1", "2024-03-01", 2, {"physics": 1, "math": 0})
+        assert (progress["streak"], progress["answers"], progress["correct"], progress["subjects"]) == (1, 2, 1, {"physics": 1})
+        progress = await storage.update_achievement_progress("u1", "2024-03-02", 1, {"physics": 1})
+        assert (progress["streak"], progress["last_day"], progress["subjects"]["physics"]) == (2, "2024-03-02", 2)
+        # A late answer from an earlier day counts but leaves the streak alone
+        progress = await storage.update_achievement_progress("u1", "2024-03-01", 1, {"math": 1})
+        assert (progress["streak"], progress["last_day"], progress["correct"]) == (2, "2024-03-02", 3)
+        progress = await storage.update_achievement_progress("u1", "2024-03-05", 1, {})
+        assert progress["streak"] == 1
+
+        award = {"rule_id": "streak-3", "title": "On a Roll", "description": "3 days", "type": "streak", "icon": "🔥"}
+        awarded = await storage.award_achievements("u1", [award])
+        assert [achievement.rule_id for achievement in awarded] == ["streak-3"]
+        assert await storage.award_achievements("u1", [award]) == []
+        assert (await storage.update_achievement_progress("u1", "2024-03-05", 1, {}))["awarded"] == ["streak-3"]
+
+        assert [achievement.rule_id for achievement in await storage.get_user_achievements("u1")] == ["streak-3"]
+        assert await storage.get_user_achievements("u2") == []
+
+    run(backend, scenario)
+
+def test_resume_tokens(backend):
+    async def scenario(storage: Storage):
+        assert await storage.get_resume_token("worker") is None
+        await storage.save_resume_token("worker", {"_data": "abc"})
+        assert await storage.get_resume_token("worker") == {"_data": "abc"}
+
+    run(backend, scenario)
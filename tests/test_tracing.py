@@ -0,0 +1,99 @@
+"""
+Tests for trace context parsing, span recording and tail sampling.
+"""
+
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+import tracing
+from tracing import MAX_SPANS_PER_TRACE, TailSampler, Trace, current_span, otlp_value, parse_traceparent, span
+
+TRACE_ID = "4bf92f3577b34da6a3ce929d0e0e4736"
+PARENT_ID = "00f067aa0ba902b7"
+
+def finished_root(duration: float = 0.01, error: str = None, status_code: int = 200):
+    root = Trace().root("GET /api/questions", **{"http.status_code": status_code})
+    root.end(error)
+    root.end_ns = root.start_ns + int(duration * 1e9)
+    return root
+
+def test_parse_traceparent():
+    assert parse_traceparent(f"00-{TRACE_ID}-{PARENT_ID}-01") == (TRACE_ID, PARENT_ID)
+    assert parse_traceparent(f"  00-{TRACE_ID}-{PARENT_ID}-00 ") == (TRACE_ID, PARENT_ID)
+
+@pytest.mark.parametrize("header", [
+    "",
+    "garbage",
+    f"00-{TRACE_ID}-{PARENT_ID}",
+    f"00-{TRACE_ID[:-1]}-{PARENT_ID}-01",
+    f"00-{TRACE_ID}-{PARENT_ID}00-01",
+    f"00-{TRACE_ID[:-1]}z-{PARENT_ID}-01",
+    f"00-{TRACE_ID}-{PARENT_ID[:-1]}z-01",
+    f"00-{TRACE_ID}-{PARENT_ID}-01-extra"
+])
+def test_malformed_traceparent_is_ignored(header):
+    assert parse_traceparent(header) == (None, None)
+
+def test_slow_and_failed_requests_are_always_kept(monkeypatch):
+    monkeypatch.setattr(tracing.random, "random", lambda: 0.99)
+    sampler = TailSampler(slow_seconds=0.5, sample_rate=0.0)
+    assert sampler.keep(finished_root(duration=0.5))
+    assert sampler.keep(finished_root(error="RuntimeError"))
+    assert sampler.keep(finished_root(status_code=503))
+    assert not sampler.keep(finished_root(status_code=404))
+    assert not sampler.keep(finished_root())
+
+def test_fast_requests_are_kept_at_the_sample_rate(monkeypatch):
+    sampler = TailSampler(slow_seconds=0.5, sample_rate=0.1)
+    monkeypatch.setattr(tracing.random, "random", lambda: 0.05)
+    assert sampler.keep(finished_root())
+    monkeypatch.setattr(tracing.random, "random", lambda: 0.15)
+    assert not sampler.keep(finished_root())
+
+def test_spans_nest_under_the_current_span_and_record_errors():
+    trace = Trace(TRACE_ID)
+    root = trace.root("request", PARENT_ID)
+    token = current_span.set(root)
+    try:
+        with span("auth") as auth:
+            with span("mongo.find", collection="sessions") as find:
+                pass
+        with pytest.raises(KeyError):
+            with span("render"):
+                raise KeyError("missing")
+    finally:
+        current_span.reset(token)
+
+    auth_span, find_span, render_span = trace.spans[1:]
+    assert root.parent_id == PARENT_ID and trace.trace_id == TRACE_ID
+    assert auth_span is auth and auth.parent_id == root.span_id
+    assert find_span is find and find.parent_id == auth.span_id
+    assert find.attributes == {"collection": "sessions"}
+    assert render_span.parent_id == root.span_id and render_span.error == "KeyError"
+    assert all(recorded.end_ns >= recorded.start_ns for recorded in trace.spans[1:])
+    assert current_span.get() is None
+
+def test_span_does_nothing_outside_a_traced_request():
+    with span("untraced") as untraced:
+        assert untraced is None
+
+def test_traces_stop_recording_past_the_span_limit():
+    trace = Trace()
+    root = trace.root("export")
+    for _ in range(MAX_SPANS_PER_TRACE + 10):
+        root.child("mongo.getMore")
+    assert len(trace.spans) == MAX_SPANS_PER_TRACE
+    assert trace.dropped == 11
+
+@pytest.mark.parametrize("value, encoded", [
+    (True, {"boolValue": True}),
+    (3, {"intValue": "3"}),
+    (0.5, {"doubleValue": 0.5}),
+    ("find", {"stringValue": "find"})
+])
+def test_otlp_values(value, encoded):
+    assert otlp_value(value) == encoded